@@ -20,6 +20,7 @@ import pisi.db.packagedb
 import pisi.db.repodb
 import pisi.errors
 import pisi.file
+import pisi.indexdelta
 import pisi.metadata
 import pisi.operations.check
 import pisi.operations.helper
@@ -254,12 +255,8 @@ def list_upgradable():
     """
     installdb = pisi.db.installdb.InstallDB()
     packagedb = pisi.db.packagedb.PackageDB()
-    is_upgradable = pisi.operations.upgrade.is_upgradable
-    installed = installdb.list_installed()
 
-    upgradable = [
-        name for name in installed if is_upgradable(name, installdb, packagedb)
-    ]
+    upgradable = pisi.operations.upgrade.list_upgradable(installdb, packagedb)
     # replaced packages can not pass is_upgradable test, so we add them manually
     upgradable.extend(list_replaces())
 
@@ -581,7 +578,9 @@ def delete_cache():
     ctx.ui.info(_("Cleaning temporary directory %s...") % ctx.config.tmp_dir())
     pisi.util.clean_dir(ctx.config.tmp_dir())
     for cache in [
-        x for x in os.listdir(ctx.config.cache_root_dir()) if x.endswith(".cache")
+        x
+        for x in os.listdir(ctx.config.cache_root_dir())
+        if x.endswith((".cache", ".db"))
     ]:
         cache_file = pisi.util.join_path(ctx.config.cache_root_dir(), cache)
         ctx.ui.info(_("Removing cache file %s...") % cache_file)
@@ -836,7 +835,9 @@ def index(dirs=None, output="eopkg-index.xml", skip_signing=False, compression=0
         index.index(repo_dir)
 
     sign = None if skip_signing else pisi.file.File.detached
+    previous = pisi.indexdelta.load_previous(output)
     index.write(output, sha1sum=True, compress=compression, sign=sign)
+    pisi.indexdelta.publish(output, previous)
     ctx.ui.info(_("Index file written"))
 
 
@@ -913,16 +914,23 @@ def __update_repo(repo, force=False):
     if repodb.has_repo(repo):
         repouri = repodb.get_repo(repo).indexuri.get_uri()
         try:
-            index.read_uri_of_repo(repouri, repo)
+            doc = pisi.indexdelta.update_index(repouri, repo)
+            if doc is None:
+                index.read_uri_of_repo(repouri, repo)
         except pisi.file.AlreadyHaveException as e:
             ctx.ui.info(_("%s repository information is up-to-date.") % repo)
             if force:
                 ctx.ui.info(_("Updating database at any rate as requested"))
                 index.read_uri_of_repo(repouri, repo, force=force)
+                doc = None
             else:
                 return False
 
+        if doc is None:
+            pisi.indexdelta.record_generation(repouri, repo)
+
         pisi.db.historydb.HistoryDB().update_repo(repo, repouri, "update")
+        repodb.regenerate_index(repo, doc)
         repodb.check_distribution(repo)
         ctx.ui.info(_("Package database updated."))
     else:
@@ -4,12 +4,15 @@
 """Archive module provides access to regular archive file types."""
 
 # standard library modules
+import collections
 import errno
 import os
 import shutil
 import stat
 import tarfile
+import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 import lzma_mt
 
@@ -18,7 +21,7 @@ import pisi
 import pisi.context as ctx
 import pisi.util as util
 from pisi import translate as _
-from pisi.path import is_usr_merged_duplicate, normpath
+from pisi.path import invalidate_links, is_usr_merged_duplicate, normpath
 
 
 class UnknownArchiveType(Exception):
@@ -187,6 +190,127 @@ class ArchiveLzma(ArchiveBase):
         lzma_file.close()
 
 
+class ExtractPool:
+    """Writes the regular files of a tar archive on a pool of threads.
+
+    The archive is still read and decompressed in order by the caller,
+    which hands the members it wants written over with add(). The data of
+    at most MAX_PENDING bytes is held in memory at a time.
+
+    Errors of the workers are kept with the member they belong to, and
+    raised by raise_errors() once the caller is done with the member it
+    is working on.
+    """
+
+    # Larger files are extracted by the caller
+    MAX_FILE_SIZE = 8 * 1024 * 1024
+    MAX_PENDING = 64 * 1024 * 1024
+
+    def __init__(self, tar, workers, set_attrs, callback=None):
+        """set_attrs(tarinfo) and callback(tarinfo, extracted=True) are
+        called for every written file, the callback in the caller's thread.
+        With less than two workers no files are accepted."""
+        self.tar = tar
+        self.set_attrs = set_attrs
+        self.callback = callback
+        self.executor = None
+        if workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending = collections.deque()
+        self.pending_paths = set()
+        self.pending_size = 0
+        # [(tarinfo, exception)] of the files which could not be written
+        self.errors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def accepts(self, tarinfo):
+        return (
+            self.executor is not None
+            and tarinfo.isreg()
+            and not tarinfo.issparse()
+            and tarinfo.size <= self.MAX_FILE_SIZE
+            and tarinfo.name not in self.pending_paths
+        )
+
+    def __write(self, tarinfo, data):
+        # Never write through an old file, it may be a symlink or a
+        # running executable
+        if os.path.lexists(tarinfo.name):
+            os.unlink(tarinfo.name)
+        with open(tarinfo.name, "wb") as f:
+            f.write(data)
+        self.tar.chown(tarinfo, tarinfo.name, False)
+        self.tar.chmod(tarinfo, tarinfo.name)
+        self.tar.utime(tarinfo, tarinfo.name)
+        self.set_attrs(tarinfo)
+
+    def __finish_one(self):
+        future, tarinfo = self.pending.popleft()
+        self.pending_paths.discard(tarinfo.name)
+        self.pending_size -= tarinfo.size
+
+        error = future.exception()
+        if error is not None:
+            self.errors.append((tarinfo, error))
+        elif self.callback:
+            self.callback(tarinfo, extracted=True)
+
+    def add(self, tarinfo):
+        """Read the data of a member and queue it for writing.
+
+        The member goes through the extraction filter of the archive
+        first, like with TarFile.extract(). Returns False if the filter
+        excluded it.
+        """
+        extraction_filter = getattr(self.tar, "extraction_filter", None)
+        if extraction_filter is not None:
+            tarinfo = extraction_filter(tarinfo, "")
+            if tarinfo is None:
+                return False
+
+        # Upper directories are created here, like tarfile does, so that
+        # conflicts with existing files surface in the caller
+        upperdirs = os.path.dirname(tarinfo.name)
+        if upperdirs and not os.path.exists(upperdirs):
+            os.makedirs(upperdirs)
+
+        data = self.tar.extractfile(tarinfo).read()
+
+        while self.pending and (
+            self.pending_size + tarinfo.size > self.MAX_PENDING
+            or self.pending[0][0].done()
+        ):
+            self.__finish_one()
+
+        future = self.executor.submit(self.__write, tarinfo, data)
+        self.pending.append((future, tarinfo))
+        self.pending_paths.add(tarinfo.name)
+        self.pending_size += tarinfo.size
+        return True
+
+    def wait(self):
+        """Wait until all queued files are written."""
+        while self.pending:
+            self.__finish_one()
+
+    def raise_errors(self):
+        """Raise the error of the first file which could not be written."""
+        if self.errors:
+            tarinfo, error = self.errors[0]
+            ctx.ui.error(_("Could not extract %s") % tarinfo.name)
+            raise error
+
+    def close(self):
+        """Stop the workers once the files being written are done."""
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
 class ArchiveTar(ArchiveBase):
     """ArchiveTar handles tar archives depending on the compression
     type. Provides access to tar, tar.gz and tar.bz2 files.
@@ -226,9 +350,27 @@ class ArchiveTar(ArchiveBase):
         print(("Overwriting stale pip install: /{}".format(info.name)))
         shutil.rmtree(info.name)
 
+    def set_attrs(self, tarinfo):
+        # tarfile.extract does not honor umask. It must be honored
+        # explicitly. See --no-same-permissions option of tar(1),
+        # which is the deafult behaviour.
+        #
+        # Note: This is no good while installing a pisi package.
+        # Thats why this is optional.
+        if self.no_same_permissions and not os.path.islink(tarinfo.name):
+            os.chmod(tarinfo.name, tarinfo.mode & ~ctx.const.umask)
+
+        if self.no_same_owner:
+            if not os.path.islink(tarinfo.name):
+                os.chown(tarinfo.name, os.getuid(), os.getgid())
+            else:
+                os.lchown(tarinfo.name, os.getuid(), os.getgid())
+
     def unpack_dir(self, target_dir, callback=None, files=None):
         if files is None:
             files = self._tar_file_list()
+        elif not isinstance(files, (set, frozenset)):
+            files = set(files)
 
         self.tar = self._open_tar()
 
@@ -240,158 +382,205 @@ class ArchiveTar(ArchiveBase):
             pass
         os.chdir(target_dir)
 
-        uid = os.getuid()
-        gid = os.getgid()
-
-        for tarinfo in self.tar:
-            tarinfo.path = normpath(tarinfo.path)
-            if tarinfo.path not in files:
-                ctx.ui.warning(
-                    _("Ignoring unknown file in archive: %s" % repr(tarinfo.path))
-                )
-                continue
+        start = time.time()
+        extracted = extracted_size = 0
+
+        workers = int(ctx.config.values.general.extract_workers)
+        with ExtractPool(self.tar, workers, self.set_attrs, callback) as pool:
+            for tarinfo in self.tar:
+                # Errors of files written in the background belong to
+                # those files, not to the member extracted next
+                pool.raise_errors()
+
+                tarinfo.path = normpath(tarinfo.path)
+                if tarinfo.path not in files:
+                    ctx.ui.warning(
+                        _("Ignoring unknown file in archive: %s" % repr(tarinfo.path))
+                    )
+                    continue
 
-            if is_usr_merged_duplicate(files, tarinfo.path):
-                ctx.ui.debug(_("Skipping merged file %s" % tarinfo.path))
-                continue
+                if is_usr_merged_duplicate(files, tarinfo.path):
+                    ctx.ui.debug(_("Skipping merged file %s" % tarinfo.path))
+                    continue
 
-            if callback:
-                callback(tarinfo, extracted=False)
-
-            try:
-                self.maybe_nuke_pip(tarinfo)
-            except Exception as e:
-                print(("Failed to remove stale pip install: {}".format(e)))
-                raise e
-
-            if (
-                tarinfo.issym()
-                and os.path.isdir(tarinfo.name)
-                and not os.path.islink(tarinfo.name)
-            ):
-                # Changing a directory with a symlink. tarfile module
-                # cannot handle this case.
-
-                if os.path.isdir(tarinfo.linkname):
-                    # Symlink target is a directory. Move old directory's
-                    # content to this directory.
-                    for filename in os.listdir(tarinfo.name):
-                        old_path = util.join_path(tarinfo.name, filename)
-                        new_path = util.join_path(tarinfo.linkname, filename)
-
-                        if os.path.lexists(new_path):
-                            if not os.path.isdir(new_path):
-                                # A file with the same name exists in the
-                                # target. Remove the one in the old directory.
-                                os.remove(old_path)
-                            continue
-
-                        # try as up to this time
+                if (
+                    tarinfo.islnk()
+                    or tarinfo.name in pool.pending_paths
+                    or (not tarinfo.isdir() and os.path.isdir(tarinfo.name))
+                ):
+                    # The member replaces a directory, or refers to files
+                    # which may still be written by the pool
+                    pool.wait()
+
+                if callback:
+                    callback(tarinfo, extracted=False)
+
+                try:
+                    self.maybe_nuke_pip(tarinfo)
+                except Exception as e:
+                    print(("Failed to remove stale pip install: {}".format(e)))
+                    raise e
+
+                if (
+                    tarinfo.issym()
+                    and os.path.isdir(tarinfo.name)
+                    and not os.path.islink(tarinfo.name)
+                ):
+                    # Changing a directory with a symlink. tarfile module
+                    # cannot handle this case.
+
+                    if os.path.isdir(tarinfo.linkname):
+                        # Symlink target is a directory. Move old directory's
+                        # content to this directory.
+                        for filename in os.listdir(tarinfo.name):
+                            old_path = util.join_path(tarinfo.name, filename)
+                            new_path = util.join_path(tarinfo.linkname, filename)
+
+                            if os.path.lexists(new_path):
+                                if not os.path.isdir(new_path):
+                                    # A file with the same name exists in the
+                                    # target. Remove the one in the old directory.
+                                    os.remove(old_path)
+                                continue
+
+                            # try as up to this time
+                            try:
+                                os.renames(old_path, new_path)
+                            except OSError as e:
+                                # something gone wrong? [Errno 18] Invalid cross-device link?
+                                # try in other way
+                                if e.errno == errno.EXDEV:
+                                    if tarinfo.linkname.startswith(".."):
+                                        new_path = util.join_path(
+                                            os.path.normpath(
+                                                os.path.join(
+                                                    os.path.dirname(tarinfo.name),
+                                                    tarinfo.linkname,
+                                                )
+                                            ),
+                                            filename,
+                                        )
+                                    if not old_path.startswith("/"):
+                                        old_path = "/" + old_path
+                                    if not new_path.startswith("/"):
+                                        new_path = "/" + new_path
+                                    print(("Moving:", old_path, " -> ", new_path))
+                                    shutil.move(
+                                        old_path,
+                                        new_path,
+                                        copy_function=util.clone_file_stat,
+                                    )
+                                else:
+                                    raise
                         try:
-                            os.renames(old_path, new_path)
+                            os.rmdir(tarinfo.name)
                         except OSError as e:
-                            # something gone wrong? [Errno 18] Invalid cross-device link?
-                            # try in other way
-                            if e.errno == errno.EXDEV:
-                                if tarinfo.linkname.startswith(".."):
-                                    new_path = util.join_path(
-                                        os.path.normpath(
-                                            os.path.join(
-                                                os.path.dirname(tarinfo.name),
-                                                tarinfo.linkname,
-                                            )
-                                        ),
-                                        filename,
-                                    )
-                                if not old_path.startswith("/"):
-                                    old_path = "/" + old_path
-                                if not new_path.startswith("/"):
-                                    new_path = "/" + new_path
-                                print(("Moving:", old_path, " -> ", new_path))
-                                os.system("mv -f %s %s" % (old_path, new_path))
+                            # hmmm, not empty dir? try rename it adding .old extension.
+                            if e.errno == errno.ENOTEMPTY:
+                                os.system(
+                                    "mv -f %s %s.old" % (tarinfo.name, tarinfo.name)
+                                )
                             else:
                                 raise
-                    try:
-                        os.rmdir(tarinfo.name)
-                    except OSError as e:
-                        # hmmm, not empty dir? try rename it adding .old extension.
-                        if e.errno == errno.ENOTEMPTY:
-                            os.system("mv -f %s %s.old" % (tarinfo.name, tarinfo.name))
-                        else:
-                            raise
-
-                elif not os.path.lexists(tarinfo.linkname):
-                    # Symlink target does not exist. Assume the old
-                    # directory is moved to another place in package.
-                    os.renames(tarinfo.name, tarinfo.linkname)
 
-                else:
-                    # This should not happen. Probably a packaging error.
-                    # Try to rename directory
-                    try:
-                        os.rename(tarinfo.name, "%s.renamed-by-pisi" % tarinfo.name)
-                    except:
-                        # If fails, try to remove it
-                        shutil.rmtree(tarinfo.name)
-
-            elif os.path.isdir(tarinfo.name) and tarinfo.isfile():
-                # If we get past all of the above and the destination is still a directory and the new package is
-                # installing a regular file there, remove the directory first. The tarfile module cannot handle this.
-                shutil.rmtree(tarinfo.name)
-
-            try:
-                self.tar.extract(tarinfo)
-            except (IOError, OSError) as e:
-                # Handle the case where an upper directory cannot
-                # be created because of a conflict with an existing
-                # regular file or symlink. In this case, remove
-                # the old file and retry extracting.
-
-                if e.errno != errno.EEXIST and e.errno != errno.ENOTDIR:
-                    raise
-
-                # For the path "a/b/c", upper_dirs will be ["a", "a/b"].
-                upper_dirs = []
-                head, tail = os.path.split(tarinfo.name)
-
-                while head and tail:
-                    upper_dirs.insert(0, head)
-                    head, tail = os.path.split(head)
-
-                for path in upper_dirs:
-                    if not os.path.lexists(path):
-                        break
-
-                    if not os.path.isdir(path):
-                        # A file with the same name exists.
-                        # Remove the existing file.
-                        os.remove(path)
-                        break
-                else:
-                    # No conflicts detected! This is probably not the case
-                    # mentioned here. Raise the same exception.
-                    raise
+                    elif not os.path.lexists(tarinfo.linkname):
+                        # Symlink target does not exist. Assume the old
+                        # directory is moved to another place in package.
+                        os.renames(tarinfo.name, tarinfo.linkname)
 
-                # Try to extract again.
-                self.tar.extract(tarinfo)
+                    else:
+                        # This should not happen. Probably a packaging error.
+                        # Try to rename directory
+                        try:
+                            os.rename(tarinfo.name, "%s.renamed-by-pisi" % tarinfo.name)
+                        except:
+                            # If fails, try to remove it
+                            shutil.rmtree(tarinfo.name)
+
+                elif os.path.isdir(tarinfo.name) and tarinfo.isfile():
+                    # If we get past all of the above and the destination is still a directory and the new package is
+                    # installing a regular file there, remove the directory first. The tarfile module cannot handle this.
+                    shutil.rmtree(tarinfo.name)
+
+                pooled = pool.accepts(tarinfo)
+                extract = pool.add if pooled else self.tar.extract
+                try:
+                    queued = extract(tarinfo)
+                except (IOError, OSError) as e:
+                    # Handle the case where an upper directory cannot
+                    # be created because of a conflict with an existing
+                    # regular file or symlink. In this case, remove
+                    # the old file and retry extracting.
+
+                    if e.errno != errno.EEXIST and e.errno != errno.ENOTDIR:
+                        raise
+
+                    # For the path "a/b/c", upper_dirs will be ["a", "a/b"].
+                    upper_dirs = []
+                    head, tail = os.path.split(tarinfo.name)
+
+                    while head and tail:
+                        upper_dirs.insert(0, head)
+                        head, tail = os.path.split(head)
+
+                    pool.wait()
+                    for path in upper_dirs:
+                        if not os.path.lexists(path):
+                            break
+
+                        if not os.path.isdir(path):
+                            # A file with the same name exists.
+                            # Remove the existing file.
+                            os.remove(path)
+                            invalidate_links(path)
+                            break
+                    else:
+                        # No conflicts detected! This is probably not the case
+                        # mentioned here. Raise the same exception.
+                        raise
 
-            # tarfile.extract does not honor umask. It must be honored
-            # explicitly. See --no-same-permissions option of tar(1),
-            # which is the deafult behaviour.
-            #
-            # Note: This is no good while installing a pisi package.
-            # Thats why this is optional.
-            if self.no_same_permissions and not os.path.islink(tarinfo.name):
-                os.chmod(tarinfo.name, tarinfo.mode & ~ctx.const.umask)
+                    # Try to extract again.
+                    queued = extract(tarinfo)
 
-            if self.no_same_owner:
-                if not os.path.islink(tarinfo.name):
-                    os.chown(tarinfo.name, uid, gid)
-                else:
-                    os.lchown(tarinfo.name, uid, gid)
+                if pooled and not queued:
+                    # Excluded by the extraction filter
+                    continue
+
+                if tarinfo.isreg():
+                    extracted += 1
+                    extracted_size += tarinfo.size
+
+                if pooled:
+                    # Attributes are set and the callback is called once
+                    # the pool has written the file
+                    continue
 
-            if callback:
-                callback(tarinfo, extracted=True)
+                if tarinfo.issym() or tarinfo.isdir():
+                    # The package may be changing the usr merge layout
+                    invalidate_links(tarinfo.path)
+
+                self.set_attrs(tarinfo)
+
+                if callback:
+                    callback(tarinfo, extracted=True)
+
+            pool.wait()
+            pool.raise_errors()
+
+        elapsed = max(time.time() - start, 0.001)
+        ctx.ui.debug(
+            _(
+                "Extracted %(files)d files (%(mb).1f MB) in %(secs).2f seconds, "
+                "%(fps)d files/s, %(mbps).1f MB/s."
+            )
+            % {
+                "files": extracted,
+                "mb": extracted_size / 1024 / 1024,
+                "secs": elapsed,
+                "fps": extracted / elapsed,
+                "mbps": extracted_size / 1024 / 1024 / elapsed,
+            }
+        )
 
         try:
             if oldwd:
@@ -455,7 +644,7 @@ class ArchiveTar(ArchiveBase):
 
     def _tar_file_list(self):
         with self._open_tar() as tar:
-            paths = [normpath(tarinfo.path) for tarinfo in tar]
+            paths = set(normpath(tarinfo.path) for tarinfo in tar)
 
         if self.fileobj is not None:
             self.fileobj.seek(0)
@@ -543,7 +732,7 @@ class ArchiveTarZ(ArchiveBase):
     def _tar_file_list(self):
         with tarfile.open(self.file_path) as tar:
             self._set_trust(tar)
-            paths = [tarinfo.path for tarinfo in tar]
+            paths = set(tarinfo.path for tarinfo in tar)
 
         return paths
 
@@ -648,7 +837,7 @@ class ArchiveZip(ArchiveBase):
         unpacks stuff into target_dir and only extracts files
         from archive_root, treating it as the archive root"""
         zip_obj = self.zip_obj
-        files = [info.filename for info in zip_obj.infolist()]
+        files = set(info.filename for info in zip_obj.infolist())
 
         for info in zip_obj.infolist():
             if pred(info.filename):  # check if condition holds
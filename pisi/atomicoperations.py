@@ -11,6 +11,7 @@ import zipfile
 import pisi
 import pisi.context as ctx
 import pisi.db
+import pisi.durability
 import pisi.files
 import pisi.metadata
 import pisi.operations.delta
@@ -19,7 +20,7 @@ import pisi.uri
 import pisi.util as util
 import pisi.version
 from pisi import translate as _
-from pisi.path import is_usr_merged_duplicate
+from pisi.path import invalidate_links, is_usr_merged_duplicate
 
 
 class Error(pisi.Error):
@@ -105,6 +106,9 @@ class Install(AtomicOperation):
         self.check_versioning(self.pkginfo.version, self.pkginfo.release)
         self.check_relations()
 
+        # Package scripts may have changed the usr merge symlinks since the
+        # last operation, start over with a fresh cache
+        invalidate_links()
         self.extract_install()
         self.store_pisi_files()
         self.update_databases()
@@ -166,8 +170,8 @@ class Install(AtomicOperation):
         if file_conflicts:
             upgradable_pkgs = pisi.api.list_upgradable()
             file_conflicts_str = ""
+            paths = set(fileinfo.path for fileinfo in self.files.list)
             for pkg, existing_file in file_conflicts:
-                paths = [fileinfo.path for fileinfo in self.files.list]
                 replaced_by = False
                 if existing_file in paths:
                     # FIXME: If the package is in the updates list assume it's been vetted for now...
@@ -327,7 +331,8 @@ class Install(AtomicOperation):
                 if os.path.islink(old_path):
                     os.symlink(os.readlink(old_path), new_path)
                 else:
-                    shutil.copy(old_path, new_path)
+                    util.clone_file(old_path, new_path)
+                    shutil.copymode(old_path, new_path)
 
             if missing_old_files:
                 ctx.ui.warning(
@@ -343,10 +348,10 @@ class Install(AtomicOperation):
             stat_cache = {}
 
             files_by_name = {}
-            new_paths = []
+            new_paths = set()
             for f in self.files.list:
                 files_by_name.setdefault(os.path.basename(f.path), []).append(f)
-                new_paths.append(f.path)
+                new_paths.add(f.path)
 
             for old_file in self.old_files.list:
                 if old_file.path in new_paths:
@@ -415,6 +420,10 @@ class Install(AtomicOperation):
             nonlocal extracted_count
             if extracted:
                 extracted_count += 1
+                if tarinfo.isreg():
+                    pisi.durability.written(
+                        util.join_path(ctx.config.dest_dir(), tarinfo.name)
+                    )
                 ctx.ui.display_progress(
                     operation="extracting",
                     percent=progress.update(extracted_count),
@@ -566,8 +575,10 @@ class Remove(AtomicOperation):
 
         self.check_dependencies()
 
+        invalidate_links()
+        paths = set(fileinfo.path for fileinfo in self.files.list)
         for fileinfo in self.files.list:
-            if is_usr_merged_duplicate(self.files.list, fileinfo.path):
+            if is_usr_merged_duplicate(paths, fileinfo.path):
                 ctx.ui.debug("Not removing usr-merged file: %s" % fileinfo.path)
                 continue
 
@@ -633,7 +644,10 @@ class Remove(AtomicOperation):
                     % fpath
                 )
         else:
-            if os.path.isfile(fpath) or os.path.islink(fpath):
+            if os.path.islink(fpath):
+                os.unlink(fpath)
+                invalidate_links(fileinfo.path)
+            elif os.path.isfile(fpath):
                 os.unlink(fpath)
             elif os.path.isdir(fpath) and not os.listdir(fpath):
                 os.rmdir(fpath)
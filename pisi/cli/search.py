@@ -99,21 +99,17 @@ database.
         if ctx.get_option("installdb"):
             db = pisi.db.installdb.InstallDB()
             pkgs = db.search_package(self.args, lang, fields)
-            get_info = db.get_package
-            get_name_sum = lambda pkg: (pkg.name, pkg.summary)
+            get_summary = db.get_summary
         else:
             db = pisi.db.packagedb.PackageDB()
             pkgs = db.search_package(self.args, lang, repo, fields)
-            get_info = db.get_package
-            get_name_sum = lambda pkg: (pkg.name, pkg.summary)
+            get_summary = lambda pkg: db.get_package(pkg).summary
 
         if pkgs:
             maxlen = max([len(_pkg) for _pkg in pkgs])
 
         for pkg in pkgs:
-            pkg_info = get_info(pkg)
-
-            name, summary = get_name_sum(pkg_info)
+            name, summary = pkg, get_summary(pkg)
             lenp = len(name)
 
             name = replace.sub(pisi.util.colorize(r"\1", "brightred"), name)
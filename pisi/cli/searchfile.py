@@ -17,6 +17,9 @@ class SearchFile(command.Command, metaclass=command.autocommand):
 Usage: search-file <path1> <path2> ... <pathn>
 
 Finds the installed package which contains the specified file.
+Paths can be given in full, as a part of a path or as a glob
+pattern such as "usr/lib64/libfoo*.so". Partial paths and patterns
+are matched case insensitively.
 """
     )
 
@@ -88,6 +88,12 @@ expanded to package names.
             default=False,
             help=_("Fetch upgrades but do not install."),
         )
+        group.add_option(
+            "--pipeline",
+            action="store_true",
+            default=False,
+            help=_("Install each package as soon as it is downloaded and verified."),
+        )
         group.add_option(
             "-x",
             "--exclude",
@@ -80,6 +80,8 @@ class GeneralDefaults:
     ignore_safety = False
     ignore_delta = False
     download_workers = 8
+    extract_workers = 4
+    pipelined_install = False
 
 
 class BuildDefaults:
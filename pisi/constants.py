@@ -89,7 +89,12 @@ class Constants(metaclass=Singleton):
         self.__c.needs_restart = "needsrestart"
         self.__c.needs_reboot = "needsreboot"
         self.__c.auto_installed = "autoinstalled"
-        self.__c.files_db = "files.db"
+        self.__c.sync_intent = "syncintent"
+        self.__c.files_db = "files.sqlite"
+        self.__c.legacy_files_db = "files.db"
+        self.__c.binary_index = "eopkg-index.bin"
+        self.__c.index_generation = "generation"
+        self.__c.index_deltas_suffix = ".deltas"
         self.__c.repos = "repos"
         self.__c.devel_package_end = "-devel"
         self.__c.doc_package_end = "-docs?$"
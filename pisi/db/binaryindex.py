@@ -0,0 +1,375 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Compact, memory-mappable form of a repository's eopkg-index.xml.
+
+The binary index holds everything PackageDB, ComponentDB and GroupDB
+extract from the XML index, so that they can be loaded without parsing
+the whole document on every cold start.
+
+File layout (all integers little-endian):
+
+    header   magic, format version, section count, XML size, XML mtime
+    sections section count x (name, records offset, record count)
+    records  per section, record count x (key offset, value offset,
+             key length, value length), sorted by key
+    data     the raw key and value bytes the records point into
+
+List values are stored as NUL separated strings. Reverse dependencies are
+stored as (package, attributes) pairs, the attributes of the Dependency
+node being packed by pack_attrs().
+"""
+
+import mmap
+import os
+import struct
+import zlib
+
+import pisi
+import pisi.dependency
+from pisi import translate as _
+from pisi.db import searchindex
+
+MAGIC = b"EOPKGBIX"
+FORMAT_VERSION = 6
+
+_header = struct.Struct("<8sIIQQ")
+_section = struct.Struct("<32sQI4x")
+_record = struct.Struct("<QQII")
+
+SEPARATOR = b"\0"
+
+
+class Error(pisi.Error):
+    pass
+
+
+def join_list(values):
+    return SEPARATOR.join(value.encode() for value in values)
+
+
+def split_list(value):
+    if not value:
+        return []
+    return value.decode().split("\0")
+
+
+def pack_attrs(attrs):
+    return "\x1f".join("%s=%s" % attr for attr in attrs)
+
+
+def unpack_attrs(value):
+    if not value:
+        return ()
+    return tuple(tuple(attr.split("=", 1)) for attr in value.split("\x1f"))
+
+
+class MemoryIndex:
+    """Index sections kept in memory, as generated from an XML document."""
+
+    def __init__(self, sections=None):
+        self.sections = sections or {}
+
+    def keys(self, section):
+        return list(self.sections.get(section, {}).keys())
+
+    def items(self, section):
+        return iter(self.sections.get(section, {}).items())
+
+    def get(self, section, key, default=None):
+        return self.sections.get(section, {}).get(key, default)
+
+    def get_list(self, section, key):
+        return split_list(self.get(section, key))
+
+    def prefix_items(self, section, prefix):
+        items = self.sections.get(section, {})
+        for key in sorted(items):
+            if key.startswith(prefix):
+                yield key, items[key]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BinaryIndex(MemoryIndex):
+    """Read-only view over a binary index file through mmap."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise Error(_("Binary index %s is empty.") % path)
+
+        try:
+            magic, version, count, self.source_size, self.source_mtime = (
+                _header.unpack_from(self._map, 0)
+            )
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise Error(_("Binary index %s has an unknown format.") % path)
+
+            self.sections = {}
+            for i in range(count):
+                name, offset, records = _section.unpack_from(
+                    self._map, _header.size + i * _section.size
+                )
+                self.sections[name.rstrip(b"\0").decode()] = (offset, records)
+        except struct.error:
+            self.close()
+            raise Error(_("Binary index %s is truncated.") % path)
+        except Error:
+            self.close()
+            raise
+
+    def is_current(self, source):
+        """Check if the index was generated from the given XML file."""
+        try:
+            st = os.stat(source)
+        except OSError:
+            return False
+        return (st.st_size, st.st_mtime_ns) == (self.source_size, self.source_mtime)
+
+    def __record(self, offset, i):
+        key_off, val_off, key_len, val_len = _record.unpack_from(
+            self._map, offset + i * _record.size
+        )
+        return key_off, key_len, val_off, val_len
+
+    def __key(self, offset, i):
+        key_off, key_len, val_off, val_len = self.__record(offset, i)
+        return self._map[key_off : key_off + key_len]
+
+    def keys(self, section):
+        offset, count = self.sections.get(section, (0, 0))
+        return [self.__key(offset, i).decode() for i in range(count)]
+
+    def items(self, section):
+        offset, count = self.sections.get(section, (0, 0))
+        for i in range(count):
+            key_off, key_len, val_off, val_len = self.__record(offset, i)
+            yield (
+                self._map[key_off : key_off + key_len].decode(),
+                self._map[val_off : val_off + val_len],
+            )
+
+    def __bisect(self, offset, count, key):
+        # Records are sorted by key, so bisect the offset table
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.__key(offset, mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get(self, section, key, default=None):
+        offset, count = self.sections.get(section, (0, 0))
+        key = key.encode()
+
+        i = self.__bisect(offset, count, key)
+        if i < count and self.__key(offset, i) == key:
+            key_off, key_len, val_off, val_len = self.__record(offset, i)
+            return self._map[val_off : val_off + val_len]
+
+        return default
+
+    def prefix_items(self, section, prefix):
+        offset, count = self.sections.get(section, (0, 0))
+        prefix = prefix.encode()
+
+        i = self.__bisect(offset, count, prefix)
+        while i < count:
+            key_off, key_len, val_off, val_len = self.__record(offset, i)
+            key = self._map[key_off : key_off + key_len]
+            if not key.startswith(prefix):
+                break
+            yield key.decode(), self._map[val_off : val_off + val_len]
+            i += 1
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+def write(path, index, source):
+    """Write the sections of a MemoryIndex to path atomically.
+
+    The size and mtime of the source XML file are recorded so that a
+    stale binary index can be detected by BinaryIndex.is_current().
+    """
+    st = os.stat(source)
+    names = sorted(index.sections)
+
+    data = bytearray()
+    tables = []
+    for name in names:
+        records = []
+        for key, value in sorted(index.sections[name].items()):
+            key = key.encode()
+            records.append((len(data), len(data) + len(key), len(key), len(value)))
+            data += key
+            data += value
+        tables.append(records)
+
+    # Data follows the header, the section table and all record tables
+    data_start = _header.size + len(names) * _section.size
+    data_start += sum(len(records) for records in tables) * _record.size
+
+    tmp = "%s.tmp" % path
+    with open(tmp, "wb") as f:
+        f.write(
+            _header.pack(
+                MAGIC, FORMAT_VERSION, len(names), st.st_size, st.st_mtime_ns
+            )
+        )
+
+        offset = _header.size + len(names) * _section.size
+        for name, records in zip(names, tables):
+            f.write(_section.pack(name.encode(), offset, len(records)))
+            offset += len(records) * _record.size
+
+        for records in tables:
+            for key_off, val_off, key_len, val_len in records:
+                f.write(
+                    _record.pack(
+                        data_start + key_off, data_start + val_off, key_len, val_len
+                    )
+                )
+
+        f.write(data)
+
+    os.replace(tmp, path)
+
+
+def from_doc(doc):
+    """Extract all index sections from a parsed eopkg-index.xml document."""
+    sections = {}
+
+    distribution = {}
+    packages = {}
+    revdeps = {}
+    replaces = {}
+    pkgconfig = {}
+    pkgconfig32 = {}
+    isa = {}
+
+    specs = doc.getTag("SpecFile") is not None
+    if specs:
+        distribution["SpecFile"] = b""
+
+    distro = doc.getTag("Distribution")
+    if distro:
+        for tag in ("SourceName", "Version"):
+            data = distro.getTagData(tag)
+            if data is not None:
+                distribution[tag] = data.encode()
+
+        obsoletes = distro.getTag("Obsoletes")
+        if obsoletes and not specs:
+            distribution["Obsoletes"] = join_list(
+                x.firstChild().data() for x in obsoletes.tags("Package")
+            )
+
+    def local_texts(node, tag):
+        return dict(
+            (x.getAttribute("xml:lang") or "en", x.firstChild().data())
+            for x in node.tags(tag)
+            if x.firstChild()
+        )
+
+    component_packages = {}
+    search = {}
+    versions = {}
+    for node in doc.tags("Package"):
+        name = node.getTagData("Name")
+        packages[name] = zlib.compress(node.toString().encode())
+        update = node.getTag("History").getTag("Update")
+        versions[name] = join_list(
+            value or ""
+            for value in (
+                update.getTagData("Version"),
+                update.getAttribute("release"),
+                node.getTagData("Distribution"),
+                node.getTagData("DistributionRelease"),
+            )
+        )
+        for key in searchindex.package_keys(
+            name, local_texts(node, "Summary"), local_texts(node, "Description")
+        ):
+            search.setdefault(key, []).append(name)
+        # Packages and sources without a component are listed under ""
+        component_packages.setdefault(node.getTagData("PartOf") or "", []).append(name)
+
+        if node.getTagData("Replaces"):
+            replaces[name] = b""
+
+        deps = node.getTag("RuntimeDependencies")
+        if deps:
+            for dep in deps.tags("Dependency"):
+                package, attrs = pisi.dependency.pack(dep)
+                revdeps.setdefault(package, []).extend((name, pack_attrs(attrs)))
+
+        prov = node.getTag("Provides")
+        if prov:
+            for pc in prov.tags("PkgConfig"):
+                pkgconfig[pc.firstChild().data()] = name.encode()
+            for pc in prov.tags("PkgConfig32"):
+                pkgconfig32[pc.firstChild().data()] = name.encode()
+
+        for node_isa in node.tags("IsA"):
+            isa.setdefault(node_isa.firstChild().data(), []).append(name)
+
+    component_sources = {}
+    for spec in doc.tags("SpecFile"):
+        src = spec.getTag("Source")
+        component_sources.setdefault(src.getTagData("PartOf") or "", []).append(
+            src.getTagData("Name")
+        )
+
+    components = {}
+    group_components = {}
+    for node in doc.tags("Component"):
+        name = node.getTagData("Name")
+        components[name] = node.toString().encode()
+        group = node.getTagData("Group") or "unknown"
+        group_components.setdefault(group, []).append(name)
+
+    groups = dict(
+        (x.getTagData("Name"), x.toString().encode()) for x in doc.tags("Group")
+    )
+
+    sections["distribution"] = distribution
+    sections["packages"] = packages
+    sections["versions"] = versions
+    sections["revdeps"] = dict((k, join_list(v)) for k, v in revdeps.items())
+    sections["replaces"] = replaces
+    sections["pkgconfig"] = pkgconfig
+    sections["pkgconfig32"] = pkgconfig32
+    sections["isa"] = dict((k, join_list(v)) for k, v in isa.items())
+    sections["search"] = dict((k, join_list(v)) for k, v in search.items())
+    sections["search_words"] = dict(
+        (k, v.encode()) for k, v in searchindex.word_lists(search).items()
+    )
+    sections["components"] = components
+    sections["component_packages"] = dict(
+        (k, join_list(v)) for k, v in component_packages.items()
+    )
+    sections["component_sources"] = dict(
+        (k, join_list(v)) for k, v in component_sources.items()
+    )
+    sections["groups"] = groups
+    sections["group_components"] = dict(
+        (k, join_list(v)) for k, v in group_components.items()
+    )
+
+    return MemoryIndex(sections)
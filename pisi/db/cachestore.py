@@ -0,0 +1,214 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Keyed on-disk record store for the eopkg database caches.
+
+Records are grouped in tables, and every table is split by repository
+just like the dictionaries handed to pisi.db.itembyrepo.ItemByRepo. Each
+record value is pickled on its own, so reading one package does not
+require loading the rest of the cache.
+
+The store is an SQLite database using a rollback journal rather than WAL,
+as unprivileged eopkg processes must be able to read it without creating
+the -shm file next to it.
+"""
+
+import os
+import pickle
+import sqlite3
+from collections.abc import Mapping
+
+import pisi
+from pisi import translate as _
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS tables (
+    tbl TEXT,
+    repo TEXT,
+    PRIMARY KEY (tbl, repo)
+);
+CREATE TABLE IF NOT EXISTS records (
+    tbl TEXT,
+    repo TEXT,
+    key TEXT,
+    value BLOB,
+    PRIMARY KEY (tbl, repo, key)
+) WITHOUT ROWID;
+"""
+
+
+class Error(pisi.Error):
+    pass
+
+
+def encode(value):
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def decode(value):
+    return pickle.loads(value, encoding="utf-8")
+
+
+class StoredTable(Mapping):
+    """Read-only mapping over the records of one table of one repository."""
+
+    def __init__(self, store, tbl, repo):
+        self.store = store
+        self.tbl = tbl
+        self.repo = repo
+
+    def __getitem__(self, key):
+        row = self.store.execute(
+            "SELECT value FROM records WHERE tbl = ? AND repo = ? AND key = ?",
+            (self.tbl, self.repo, key),
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return decode(row[0])
+
+    def __contains__(self, key):
+        return (
+            self.store.execute(
+                "SELECT 1 FROM records WHERE tbl = ? AND repo = ? AND key = ?",
+                (self.tbl, self.repo, key),
+            ).fetchone()
+            is not None
+        )
+
+    def __iter__(self):
+        for (key,) in self.store.execute(
+            "SELECT key FROM records WHERE tbl = ? AND repo = ?", (self.tbl, self.repo)
+        ):
+            yield key
+
+    def __len__(self):
+        return self.store.execute(
+            "SELECT COUNT(*) FROM records WHERE tbl = ? AND repo = ?",
+            (self.tbl, self.repo),
+        ).fetchone()[0]
+
+    def keys(self):
+        return list(iter(self))
+
+    def items(self):
+        for key, value in self.store.execute(
+            "SELECT key, value FROM records WHERE tbl = ? AND repo = ?",
+            (self.tbl, self.repo),
+        ):
+            yield key, decode(value)
+
+    def values(self):
+        for key, value in self.items():
+            yield value
+
+
+class CacheStore:
+    """An SQLite file holding the tables of a database cache."""
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+
+        try:
+            if readonly:
+                self.conn = sqlite3.connect(
+                    "file:%s?mode=ro" % path, uri=True, check_same_thread=False
+                )
+            else:
+                self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+                self.conn.executescript(SCHEMA)
+        except sqlite3.Error as e:
+            raise Error(_("Cannot open cache store %s: %s") % (path, e))
+
+    def execute(self, query, args=()):
+        try:
+            return self.conn.execute(query, args)
+        except sqlite3.DatabaseError as e:
+            raise Error(_("Cache store %s is corrupt: %s") % (self.path, e))
+
+    def get_meta(self, key):
+        try:
+            row = self.conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.DatabaseError:
+            return None
+        return row and row[0]
+
+    def set_meta(self, key, value):
+        self.execute("REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def repos(self, tbl):
+        return [
+            repo
+            for (repo,) in self.execute("SELECT repo FROM tables WHERE tbl = ?", (tbl,))
+        ]
+
+    def has_table(self, tbl):
+        return (
+            self.execute("SELECT 1 FROM tables WHERE tbl = ?", (tbl,)).fetchone()
+            is not None
+        )
+
+    def table(self, tbl):
+        """Return the {repo: StoredTable} views of a table."""
+        return dict((repo, StoredTable(self, tbl, repo)) for repo in self.repos(tbl))
+
+    def write_table(self, tbl, table):
+        """Replace all records of a {repo: {key: value}} table."""
+        self.execute("DELETE FROM records WHERE tbl = ?", (tbl,))
+        self.execute("DELETE FROM tables WHERE tbl = ?", (tbl,))
+        for repo, items in table.items():
+            self.execute("INSERT INTO tables VALUES (?, ?)", (tbl, repo))
+            try:
+                self.conn.executemany(
+                    "INSERT INTO records VALUES (?, ?, ?, ?)",
+                    ((tbl, repo, key, encode(value)) for key, value in items.items()),
+                )
+            except sqlite3.Error as e:
+                raise Error(
+                    _("Cannot write table %s to cache store %s: %s")
+                    % (tbl, self.path, e)
+                )
+
+    def put(self, tbl, repo, key, value):
+        self.execute("INSERT OR IGNORE INTO tables VALUES (?, ?)", (tbl, repo))
+        self.execute(
+            "REPLACE INTO records VALUES (?, ?, ?, ?)", (tbl, repo, key, encode(value))
+        )
+
+    def delete(self, tbl, repo, key):
+        self.execute(
+            "DELETE FROM records WHERE tbl = ? AND repo = ? AND key = ?",
+            (tbl, repo, key),
+        )
+
+    def commit(self):
+        try:
+            self.conn.commit()
+        except sqlite3.Error as e:
+            raise Error(_("Cannot commit cache store %s: %s") % (self.path, e))
+
+    def rollback(self):
+        try:
+            self.conn.rollback()
+        except sqlite3.Error as e:
+            raise Error(_("Cannot roll back cache store %s: %s") % (self.path, e))
+
+    def close(self):
+        try:
+            self.conn.close()
+        except sqlite3.Error as e:
+            raise Error(_("Cannot close cache store %s: %s") % (self.path, e))
+
+    @staticmethod
+    def remove(path):
+        for f in (path, "%s-journal" % path):
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
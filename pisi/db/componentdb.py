@@ -7,6 +7,7 @@ from pisi import Error
 
 import pisi
 import pisi.db.repodb
+import pisi.db.binaryindex as binaryindex
 import pisi.db.itembyrepo
 import pisi.component
 import pisi.db.lazydb as lazydb
@@ -15,6 +16,8 @@ import os
 
 
 class ComponentDB(lazydb.LazyDB):
+    cache_tables = ("components", "packages", "sources")
+
     def __init__(self):
         lazydb.LazyDB.__init__(self, cacheable=True)
 
@@ -26,35 +29,40 @@ class ComponentDB(lazydb.LazyDB):
         repodb = pisi.db.repodb.RepoDB()
 
         for repo in repodb.list_repos():
-            doc = repodb.get_repo_doc(repo)
-            component_nodes[repo] = self.__generate_components(doc)
-            component_packages[repo] = self.__generate_packages(doc)
-            component_sources[repo] = self.__generate_sources(doc)
-
-        self.cdb = pisi.db.itembyrepo.ItemByRepo(component_nodes)
-        self.cpdb = pisi.db.itembyrepo.ItemByRepo(component_packages)
-        self.csdb = pisi.db.itembyrepo.ItemByRepo(component_sources)
-
-    def __generate_packages(self, doc):
-        components = {}
-        for pkg in doc.tags("Package"):
-            components.setdefault(pkg.getTagData("PartOf"), []).append(
-                pkg.getTagData("Name")
-            )
-        return components
-
-    def __generate_sources(self, doc):
-        components = {}
-        for spec in doc.tags("SpecFile"):
-            src = spec.getTag("Source")
-            components.setdefault(src.getTagData("PartOf"), []).append(
-                src.getTagData("Name")
-            )
-        return components
-
-    def __generate_components(self, doc):
+            with repodb.get_repo_index(repo) as index:
+                component_nodes[repo] = self.__generate_components(index)
+                component_packages[repo] = self.__generate_packages(index)
+                component_sources[repo] = self.__generate_sources(index)
+
+        self.tables = {
+            "components": component_nodes,
+            "packages": component_packages,
+            "sources": component_sources,
+        }
+        self.load_tables(self.tables)
+
+    def load_tables(self, tables):
+        self.cdb = pisi.db.itembyrepo.ItemByRepo(tables["components"])
+        self.cpdb = pisi.db.itembyrepo.ItemByRepo(tables["packages"])
+        self.csdb = pisi.db.itembyrepo.ItemByRepo(tables["sources"])
+
+    def __generate_packages(self, index):
+        # Packages without a component are listed under "", as the cache
+        # store has no None keys
+        return dict(
+            (name, binaryindex.split_list(packages))
+            for name, packages in index.items("component_packages")
+        )
+
+    def __generate_sources(self, index):
+        return dict(
+            (name, binaryindex.split_list(sources))
+            for name, sources in index.items("component_sources")
+        )
+
+    def __generate_components(self, index):
         return dict(
-            [(x.getTagData("Name"), x.toString()) for x in doc.tags("Component")]
+            (name, node.decode()) for name, node in index.items("components")
         )
 
     def has_component(self, name, repo=None):
@@ -1,12 +1,14 @@
 # SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
 # SPDX-License-Identifier: GPL-2.0-or-later
 
-import dbm
-import hashlib
+import contextlib
+import multiprocessing
 import os
 import re
-import shelve
-import sys
+import sqlite3
+import time
+
+import iksemel
 
 import pisi
 from pisi import context as ctx
@@ -20,37 +22,121 @@ from pisi.db import lazydb
 # file conflict mechanism of pisi prevents this and needs a fast has_file function.
 # So currently filesdb is the only db and we cant still get rid of rebuild-db :/
 
-# dbm.sqlite3 (default in py3.13+) is significantly slower for many small writes.
-# We literally just use the shelve as a fast file lookup
-try:
-    import dbm.gnu as gdbm
-except ImportError:
-    gdbm = None
+# The files database is an SQLite table keyed by the installed paths, so
+# that lookups, substring and glob searches are all answered from it. It
+# is kept in WAL mode, so that the updates of a whole install or upgrade
+# go into one transaction which other processes can keep reading the
+# database through.
+FILESDB_FORMAT_VERSION = 6
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    package TEXT NOT NULL
+) WITHOUT ROWID;
+"""
 
-if gdbm:
-    FILESDB_FORMAT_VERSION = 4
-elif sys.version_info >= (3, 13):
-    FILESDB_FORMAT_VERSION = 5
-else:
-    FILESDB_FORMAT_VERSION = 4
+GLOB_CHARS = re.compile(r"[*?\[]")
 
 
 class FilesDB(lazydb.LazyDB):
     def init(self, force_rebuild=False):
-        self.filesdb = {}
+        self.filesdb = None
+        self.in_transaction = False
         self.__check_filesdb(force_rebuild)
 
+    @contextlib.contextmanager
+    def transaction(self):
+        """Group the file updates of a multi-package operation.
+
+        The additions and removals of all packages are written in a
+        single SQLite transaction, which is committed when the block is
+        left, also if the operation failed after some packages were done.
+        A crash in between rolls the database back to where it was
+        before the operation instead of leaving it half updated.
+        """
+        self.__check_filesdb()
+        if self.filesdb is None or self.in_transaction:
+            yield
+            return
+
+        self.filesdb.commit()
+        self.filesdb.execute("BEGIN IMMEDIATE")
+        self.in_transaction = True
+        try:
+            yield
+        finally:
+            self.in_transaction = False
+            self.filesdb.commit()
+
+    def __set_meta(self, key, value):
+        self.filesdb.execute("REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def __get_meta(self, key):
+        row = self.filesdb.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row and row[0]
+
     def has_file(self, path):
-        return hashlib.md5(path.encode()).hexdigest() in self.filesdb
+        if self.filesdb is None:
+            return False
+        return (
+            self.filesdb.execute(
+                "SELECT 1 FROM files WHERE path = ?", (path,)
+            ).fetchone()
+            is not None
+        )
 
     def get_file(self, path):
-        return self.filesdb[hashlib.md5(path.encode()).hexdigest()], path
+        row = None
+        if self.filesdb is not None:
+            row = self.filesdb.execute(
+                "SELECT package FROM files WHERE path = ?", (path,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(path)
+        return row[0], path
 
     def search_file(self, term):
+        """Find the installed files matching a path, a glob pattern or a
+        case insensitive substring of a path."""
         if self.has_file(term):
             pkg, path = self.get_file(term)
             return [(pkg, [path])]
 
+        if self.filesdb is None:
+            return self.__search_files_xml(term)
+
+        if GLOB_CHARS.search(term):
+            # Case insensitive like the substring search
+            rows = self.filesdb.execute(
+                "SELECT package, path FROM files WHERE lower(path) GLOB lower(?) "
+                "ORDER BY package, path",
+                (term,),
+            )
+        else:
+            pattern = (
+                term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            )
+            rows = self.filesdb.execute(
+                "SELECT package, path FROM files WHERE path LIKE ? ESCAPE '\\' "
+                "ORDER BY package, path",
+                ("%%%s%%" % pattern,),
+            )
+
+        found = []
+        for pkg, path in rows:
+            if not found or found[-1][0] != pkg:
+                found.append((pkg, []))
+            found[-1][1].append(path)
+        return found
+
+    def __search_files_xml(self, term):
         installdb = pisi.db.installdb.InstallDB()
         found = []
         for pkg in installdb.list_installed():
@@ -87,41 +173,68 @@ class FilesDB(lazydb.LazyDB):
 
     def add_files(self, pkg, files):
         self.__check_filesdb()
+        if self.filesdb is None:
+            return
 
-        for f in files.list:
-            self.filesdb[hashlib.md5(f.path.encode()).hexdigest()] = pkg
+        self.filesdb.executemany(
+            "REPLACE INTO files VALUES (?, ?)", ((f.path, pkg) for f in files.list)
+        )
+        if not self.in_transaction:
+            self.filesdb.commit()
 
     def remove_files(self, files):
-        for f in files:
-            if hashlib.md5(f.path.encode()).hexdigest() in self.filesdb:
-                del self.filesdb[hashlib.md5(f.path.encode()).hexdigest()]
+        if self.filesdb is None:
+            return
+
+        self.filesdb.executemany(
+            "DELETE FROM files WHERE path = ?", ((f.path,) for f in files)
+        )
+        if not self.in_transaction:
+            self.filesdb.commit()
 
     def destroy(self):
-        files_db = os.path.join(ctx.config.info_dir(), ctx.const.files_db)
-        if os.path.exists(files_db):
-            os.unlink(files_db)
+        for name in (ctx.const.files_db, ctx.const.legacy_files_db):
+            files_db = os.path.join(ctx.config.info_dir(), name)
+            for path in [files_db] + [
+                "%s-%s" % (files_db, suffix) for suffix in ("journal", "wal", "shm")
+            ]:
+                if os.path.exists(path):
+                    os.unlink(path)
 
     def close(self):
-        if isinstance(self.filesdb, shelve.Shelf):
-            self.filesdb.sync()
+        if self.filesdb is not None:
+            self.filesdb.commit()
             self.filesdb.close()
+            self.filesdb = None
 
-    def __open_shelve(self, path, flag):
-        """Helper to open shelve with preferred backend."""
-        if gdbm:
+    def __open_db(self, path, readonly=False):
+        if readonly:
+            db = sqlite3.connect("file:%s?mode=ro" % path, uri=True)
             try:
-                # Explicitly use gdbm if available for write performance
-                return shelve.Shelf(gdbm.open(path, flag))
-            except dbm.error:
-                # If it's not a gdbm file (e.g. it's sqlite), fall back to default
-                pass
-        return shelve.open(path, flag)
+                db.execute("SELECT 1 FROM meta LIMIT 1")
+            except sqlite3.OperationalError:
+                # The WAL index cannot be created without write access to
+                # the directory. The database file itself only changes
+                # when a committed transaction is checkpointed into it,
+                # so read it directly
+                db.close()
+                db = sqlite3.connect("file:%s?immutable=1" % path, uri=True)
+        else:
+            db = sqlite3.connect(path, timeout=30)
+            db.execute("PRAGMA journal_mode = WAL")
+            db.execute("PRAGMA synchronous = NORMAL")
+            db.executescript(SCHEMA)
+        return db
+
+    def __get_version(self):
+        version = self.__get_meta("version")
+        return version and int(version)
 
     def __check_filesdb(self, force_rebuild=False):
         """Sets valid self.files_db reference and automatically rebuilds the underlying db if necessary."""
 
         # already initialized
-        if isinstance(self.filesdb, shelve.Shelf):
+        if self.filesdb is not None:
             return
 
         files_db = os.path.join(ctx.config.info_dir(), ctx.const.files_db)
@@ -131,18 +244,18 @@ class FilesDB(lazydb.LazyDB):
             if os.path.exists(files_db):
                 try:
                     # Try opening read-write first
-                    try:
-                        self.filesdb = self.__open_shelve(files_db, "w")
-                    except dbm.error:
+                    if os.access(files_db, os.W_OK):
+                        self.filesdb = self.__open_db(files_db)
+                    else:
                         # Fallback to read-only
-                        self.filesdb = self.__open_shelve(files_db, "r")
+                        self.filesdb = self.__open_db(files_db, readonly=True)
                         ctx.ui.debug(
                             # . FilesDB is a proper name and should not be translated
                             _(f"Opened FilesDB {files_db} read-only.")
                         )
 
                     # Check version
-                    if self.filesdb.get("version") != FILESDB_FORMAT_VERSION:
+                    if self.__get_version() != FILESDB_FORMAT_VERSION:
                         ctx.ui.warning(
                             # . FilesDB is a proper name and should not be translated
                             _("FilesDB version mismatch or missing version.")
@@ -165,7 +278,6 @@ class FilesDB(lazydb.LazyDB):
                 self.__rebuild()
             else:
                 self.close()
-                self.filesdb = {}
                 ctx.ui.warning(
                     # . FilesDB is a proper name and should not be translated
                     _("FilesDB is invalid and cannot be rebuilt (no write access).")
@@ -182,11 +294,9 @@ class FilesDB(lazydb.LazyDB):
 
         self.close()
         self.destroy()
-        self.filesdb = {}
 
         try:
-            # "n" means we're opening a new shelve, overwriting the old one
-            self.filesdb = self.__open_shelve(files_db, "n")
+            self.filesdb = self.__open_db(files_db)
         except Exception as err:
             ctx.ui.error(
                 # . FilesDB is a proper name and should not be translated
@@ -194,31 +304,76 @@ class FilesDB(lazydb.LazyDB):
             )
             raise err
 
-        self.filesdb["version"] = FILESDB_FORMAT_VERSION
-        # we need a list of installed files per package
-        installdb = pisi.db.installdb.InstallDB()
+        # Parse files.xml and metadata.xml of the installed packages in a
+        # process pool and write the results from here. The InstallDB
+        # records are rebuilt from the same pass.
+        installed = pisi.db.installdb.installed_package_dirs()
+        packages = [
+            (pkg, os.path.join(ctx.config.packages_dir(), "%s-%s" % (pkg, version)))
+            for pkg, version in installed.items()
+        ]
+        records = {}
         pkgs = 0
+        nfiles = 0
         verbose = ctx.config.options.verbose
         ctx.ui.info(
             # . FilesDB is a proper name and should not be translated
             _(f"Adding packages to FilesDB {files_db}:")
         )
-        for pkg in installdb.list_installed():
-            files = installdb.get_files(pkg)
-            if verbose:
-                ctx.ui.info(_("Adding '%s' ...") % pkg, noln=True)
-            self.add_files(pkg, files)
-            if verbose:
-                ctx.ui.info(_("Okay."))
-            pkgs += 1
-            # Print out useful markers every so often
-            if pkgs % 50 == 0:
-                if verbose:
-                    ctx.ui.info("-------------")
-                    ctx.ui.info(_("Added so far: %s") % pkgs)
-                    ctx.ui.info("-------------")
-                else:
-                    ctx.ui.info(".", noln=True)
+
+        start = time.time()
+        pool = multiprocessing.Pool()
+        try:
+            with self.transaction():
+                for pkg, paths, record in pool.imap_unordered(
+                    read_package, packages, chunksize=16
+                ):
+                    if paths is None:
+                        ctx.ui.warning(
+                            _(
+                                "Installation info for package '%s' is broken. "
+                                "Reinstall it to fix this problem."
+                            )
+                            % pkg
+                        )
+                        continue
+
+                    if verbose:
+                        ctx.ui.info(_("Added '%s'.") % pkg)
+                    self.filesdb.executemany(
+                        "REPLACE INTO files VALUES (?, ?)",
+                        ((path, pkg) for path in paths),
+                    )
+                    if record is not None:
+                        record["dir"] = installed[pkg]
+                        records[pkg] = record
+                    pkgs += 1
+                    nfiles += len(paths)
+                    # Print out useful markers every so often
+                    if pkgs % 50 == 0:
+                        if verbose:
+                            ctx.ui.info("-------------")
+                            ctx.ui.info(_("Added so far: %s") % pkgs)
+                            ctx.ui.info("-------------")
+                        else:
+                            ctx.ui.info(".", noln=True)
+                self.__set_meta("version", FILESDB_FORMAT_VERSION)
+        except KeyboardInterrupt:
+            # Stop the workers right away
+            pool.terminate()
+            pool.join()
+            ctx.ui.info("")
+            raise
+        except Exception:
+            pool.terminate()
+            pool.join()
+            raise
+        pool.close()
+        pool.join()
+        elapsed = max(time.time() - start, 0.001)
+
+        pisi.db.installdb.InstallDB().save_records(records)
+
         ctx.ui.info(
             ngettext(
                 "\n%(num)d package added in total.",
@@ -227,10 +382,46 @@ class FilesDB(lazydb.LazyDB):
             )
             % {"num": pkgs}
         )
-        # ensure that the changes get pushed out to disk
-        self.filesdb.sync()
+        ctx.ui.info(
+            _(
+                "%(files)d files indexed in %(secs).2f seconds "
+                "(%(pkgs_rate).1f packages/s, %(files_rate).1f files/s)."
+            )
+            % {
+                "files": nfiles,
+                "secs": elapsed,
+                "pkgs_rate": pkgs / elapsed,
+                "files_rate": nfiles / elapsed,
+            }
+        )
         # This acts as a check that the version has been correctly added and synced to disk
         ctx.ui.info(
             # . FilesDB is a proper name and should not be translated
-            _(f"Finished rebuilding FilesDB (version: {self.filesdb['version']})")
+            _(f"Finished rebuilding FilesDB (version: {self.__get_version()})")
         )
+
+
+def read_package(params):
+    """Read the file list and the InstallDB record of an installed package.
+
+    Runs in the worker processes of the FilesDB rebuild. Returns the
+    package name, its paths and its record, with None paths if the
+    package info is broken.
+    """
+    try:
+        pkg, pkg_dir = params
+        try:
+            doc = iksemel.parse(os.path.join(pkg_dir, ctx.const.files_xml))
+            paths = [node.getTagData("Path") for node in doc.tags("File")]
+        except Exception:
+            return pkg, None, None
+
+        record = pisi.db.installdb.read_record(
+            os.path.join(pkg_dir, ctx.const.metadata_xml)
+        )
+        return pkg, paths, record
+
+    except KeyboardInterrupt:
+        # Workers do not propagate KeyboardInterrupt, so pass it on as an
+        # Exception to the main process (see pisi.index.add_package)
+        raise Exception
@@ -4,7 +4,7 @@
 import pisi
 import pisi.group
 from pisi import translate as _
-from pisi.db import lazydb
+from pisi.db import binaryindex, lazydb
 
 
 class GroupNotFound(Exception):
@@ -12,6 +12,8 @@ class GroupNotFound(Exception):
 
 
 class GroupDB(lazydb.LazyDB):
+    cache_tables = ("groups", "components")
+
     def __init__(self):
         lazydb.LazyDB.__init__(self, cacheable=True)
 
@@ -22,24 +24,27 @@ class GroupDB(lazydb.LazyDB):
         repodb = pisi.db.repodb.RepoDB()
 
         for repo in repodb.list_repos():
-            doc = repodb.get_repo_doc(repo)
-            group_nodes[repo] = self.__generate_groups(doc)
-            group_components[repo] = self.__generate_components(doc)
-
-        self.gdb = pisi.db.itembyrepo.ItemByRepo(group_nodes)
-        self.gcdb = pisi.db.itembyrepo.ItemByRepo(group_components)
-
-    def __generate_components(self, doc):
-        groups = {}
-        for c in doc.tags("Component"):
-            group = c.getTagData("Group")
-            if not group:
-                group = "unknown"
-            groups.setdefault(group, []).append(c.getTagData("Name"))
-        return groups
-
-    def __generate_groups(self, doc):
-        return dict([(x.getTagData("Name"), x.toString()) for x in doc.tags("Group")])
+            with repodb.get_repo_index(repo) as index:
+                group_nodes[repo] = self.__generate_groups(index)
+                group_components[repo] = self.__generate_components(index)
+
+        self.tables = {"groups": group_nodes, "components": group_components}
+        self.load_tables(self.tables)
+
+    def load_tables(self, tables):
+        self.gdb = pisi.db.itembyrepo.ItemByRepo(tables["groups"])
+        self.gcdb = pisi.db.itembyrepo.ItemByRepo(tables["components"])
+
+    def __generate_components(self, index):
+        return dict(
+            (name, binaryindex.split_list(components))
+            for name, components in index.items("group_components")
+        )
+
+    def __generate_groups(self, index):
+        return dict(
+            (name, node.decode()) for name, node in index.items("groups")
+        )
 
     def has_group(self, name, repo=None):
         return self.gdb.has_item(name, repo)
@@ -5,7 +5,6 @@
 #
 
 import os
-import re
 from pisi import translate as _
 from pisi import Error
 
@@ -16,8 +15,11 @@ import pisi
 import pisi.context as ctx
 import pisi.dependency
 import pisi.files
+import pisi.pxml.autoxml
+import pisi.specfile
 import pisi.util
 import pisi.db.lazydb as lazydb
+from pisi.db import cachestore, searchindex
 
 
 class InstallDBError(pisi.Error):
@@ -60,20 +62,218 @@ class InstallInfo:
         return s
 
 
+def installed_package_dirs():
+    """Return {name: "version-release"} for the installed package dirs."""
+
+    def split_name(dirname):
+        name, version, release = dirname.rsplit("-", 2)
+        return name, version + "-" + release
+
+    return dict(list(map(split_name, os.listdir(ctx.config.packages_dir()))))
+
+
+# Bumped when the fields of the records read by read_record() change
+RECORD_FORMAT = "2"
+
+
+def read_record(metadata_xml):
+    """Read the InstallDB record of a package from its metadata.xml.
+
+    Returns None if the file is missing or broken.
+    """
+    try:
+        meta_doc = iksemel.parse(metadata_xml)
+        pkg = meta_doc.getTag("Package")
+    except:
+        pkg = None
+
+    if pkg is None:
+        return None
+
+    def local_texts(tag):
+        return dict(
+            (node.getAttribute("xml:lang") or "en", node.firstChild().data())
+            for node in pkg.tags(tag)
+            if node.firstChild()
+        )
+
+    # Dependencies are packed by pisi.dependency.pack(), any-dependencies
+    # as (None, packed dependencies) pairs
+    deps = []
+    node = pkg.getTag("RuntimeDependencies")
+    if node:
+        for dep in node.tags("Dependency"):
+            deps.append((dep.firstChild().data(), pisi.dependency.pack(dep)))
+        for anydep in node.tags("AnyDependency"):
+            anydeps = tuple(pisi.dependency.pack(x) for x in anydep.tags("Dependency"))
+            for dep in anydep.tags("Dependency"):
+                deps.append((dep.firstChild().data(), (None, anydeps)))
+
+    def provides(tag):
+        node = pkg.getTag("Provides")
+        if node is None:
+            return []
+        return [x.firstChild().data() for x in node.tags(tag)]
+
+    update = pkg.getTag("History").getTag("Update")
+    return {
+        "version": update.getTagData("Version"),
+        "release": update.getAttribute("release"),
+        "distribution": pkg.getTagData("Distribution"),
+        "distribution_release": pkg.getTagData("DistributionRelease"),
+        "build_host": pkg.getTagData("BuildHost"),
+        "summary": local_texts("Summary"),
+        "description": local_texts("Description"),
+        "isa": [x.firstChild().data() for x in pkg.tags("IsA")],
+        "pkgconfig": provides("PkgConfig"),
+        "pkgconfig32": provides("PkgConfig32"),
+        "deps": deps,
+    }
+
+
 class InstallDB(lazydb.LazyDB):
+    # Installed package records are kept in a CacheStore table and read
+    # from it as they are needed. A record is checked against the package
+    # directory when it is read, so only the metadata.xml of packages
+    # changed behind our back gets parsed.
+    records_table = "packages"
+    records_repo = "installed"
+
     def __init__(self):
         lazydb.LazyDB.__init__(self, cacheable=True, cachedir=ctx.config.packages_dir())
 
     def init(self):
         self.installed_db = self.__generate_installed_pkgs()
-        self.rev_deps_db = self.__generate_revdeps()
+        self.store = self.__open_store()
+        # The records read so far, all of them once all_records is set
+        self.records = {}
+        self.all_records = False
+        # Built from the records when they are first needed
+        self.rev_deps_db = None
+        self.search_index = None
+
+    def cache_load(self):
+        # The record store is always opened in init()
+        return False
+
+    def cache_save(self):
+        if self.store is not None:
+            try:
+                self.store.commit()
+            except cachestore.Error as e:
+                ctx.ui.debug(str(e))
+
+    def invalidate(self):
+        if self.is_initialized():
+            self.cache_save()
+        lazydb.LazyDB.invalidate(self)
+        # LazyDB closed and dropped the store, but operations may still
+        # hold this instance and update its records
+        self.__dict__["store"] = None
 
     def __generate_installed_pkgs(self):
-        def split_name(dirname):
-            name, version, release = dirname.rsplit("-", 2)
-            return name, version + "-" + release
+        return installed_package_dirs()
+
+    def __open_store(self):
+        path = self.cache_store_file()
+        if not os.access(ctx.config.cache_root_dir(), os.W_OK):
+            # Unprivileged users only read the records, if there are any
+            if not os.path.exists(path):
+                return None
+            try:
+                store = cachestore.CacheStore(path, readonly=True)
+                if self.__store_current(store):
+                    return store
+                store.close()
+            except cachestore.Error as e:
+                ctx.ui.debug(str(e))
+            return None
 
-        return dict(list(map(split_name, os.listdir(ctx.config.packages_dir()))))
+        try:
+            store = cachestore.CacheStore(path)
+            if not self.__store_current(store):
+                store.write_table(self.records_table, {})
+                self.__set_store_version(store)
+            return store
+        except cachestore.Error as e:
+            ctx.ui.debug(str(e))
+            cachestore.CacheStore.remove(path)
+            return None
+
+    @staticmethod
+    def __store_current(store):
+        return (
+            store.get_meta("version") == lazydb.LazyDB.cache_version
+            and store.get_meta("record_format") == RECORD_FORMAT
+        )
+
+    @staticmethod
+    def __set_store_version(store):
+        store.set_meta("version", lazydb.LazyDB.cache_version)
+        store.set_meta("record_format", RECORD_FORMAT)
+
+    def __stored_records(self):
+        return cachestore.StoredTable(
+            self.store, self.records_table, self.records_repo
+        )
+
+    def __store_put(self, package, record):
+        if self.store is not None and not self.store.readonly:
+            try:
+                self.store.put(self.records_table, self.records_repo, package, record)
+            except cachestore.Error as e:
+                self.__drop_store(e)
+
+    def __store_delete(self, package):
+        if self.store is not None and not self.store.readonly:
+            try:
+                self.store.delete(self.records_table, self.records_repo, package)
+            except cachestore.Error as e:
+                self.__drop_store(e)
+
+    def __drop_store(self, error):
+        # The records are complete without the store, which is reconciled
+        # against the package directories again the next time it is opened
+        ctx.ui.debug(str(error))
+        try:
+            self.store.close()
+        except cachestore.Error:
+            pass
+        self.store = None
+
+    def __load_record(self, package, stored):
+        """Add the record of a package from stored, or from its metadata.xml
+        if the stored one is missing or outdated."""
+        record = stored.get(package)
+        if record is None or record["dir"] != self.installed_db[package]:
+            record = self.__read_record(package)
+            if record is None:
+                return
+            self.__store_put(package, record)
+        self.records[package] = record
+
+    def __load_records(self):
+        """Return the records of all installed packages."""
+        if self.all_records:
+            return self.records
+
+        stored = {}
+        if self.store is not None:
+            try:
+                stored = dict(self.__stored_records().items())
+            except cachestore.Error as e:
+                ctx.ui.debug(str(e))
+
+        for package in stored:
+            if package not in self.installed_db:
+                self.__store_delete(package)
+
+        for package in self.list_installed():
+            if package not in self.records:
+                self.__load_record(package, stored)
+
+        self.all_records = True
+        return self.records
 
     def __get_marked_packages(self, _type):
         info_path = os.path.join(ctx.config.info_dir(), _type)
@@ -81,15 +281,11 @@ class InstallDB(lazydb.LazyDB):
             return open(info_path, "r").read().split()
         return []
 
-    def __add_to_revdeps(self, package, revdeps):
+    def __read_record(self, package):
         metadata_xml = os.path.join(self.package_path(package), ctx.const.metadata_xml)
-        try:
-            meta_doc = iksemel.parse(metadata_xml)
-            pkg = meta_doc.getTag("Package")
-        except:
-            pkg = None
+        record = read_record(metadata_xml)
 
-        if pkg is None:
+        if record is None:
             # If package info is broken or not available, skip it.
             ctx.ui.warning(
                 _(
@@ -99,23 +295,34 @@ class InstallDB(lazydb.LazyDB):
                 % package
             )
             del self.installed_db[package]
-            return
+            return None
 
-        deps = pkg.getTag("RuntimeDependencies")
-        if deps:
-            for dep in deps.tags("Dependency"):
-                revdep = revdeps.setdefault(dep.firstChild().data(), {})
-                revdep[package] = dep.toString()
-            for anydep in deps.tags("AnyDependency"):
-                for dep in anydep.tags("Dependency"):
-                    revdep = revdeps.setdefault(dep.firstChild().data(), {})
-                    revdep[package] = anydep.toString()
-
-    def __generate_revdeps(self):
-        revdeps = {}
-        for package in self.list_installed():
-            self.__add_to_revdeps(package, revdeps)
-        return revdeps
+        record["dir"] = self.installed_db[package]
+        return record
+
+    def save_records(self, records):
+        """Replace the stored records of all installed packages, e.g. with
+        the ones read by a database rebuild, and reload from them."""
+        self.invalidate()
+        try:
+            store = cachestore.CacheStore(self.cache_store_file())
+            store.write_table(self.records_table, {self.records_repo: records})
+            self.__set_store_version(store)
+            store.commit()
+            store.close()
+        except cachestore.Error as e:
+            ctx.ui.debug(str(e))
+
+    def __add_to_revdeps(self, package, revdeps):
+        for name, dep in self.records[package]["deps"]:
+            revdeps.setdefault(name, {})[package] = dep
+
+    def __get_revdeps(self):
+        if self.rev_deps_db is None:
+            self.rev_deps_db = {}
+            for package in self.__load_records():
+                self.__add_to_revdeps(package, self.rev_deps_db)
+        return self.rev_deps_db
 
     def list_installed(self):
         return list(self.installed_db.keys())
@@ -124,15 +331,11 @@ class InstallDB(lazydb.LazyDB):
         return package in self.installed_db
 
     def list_installed_with_build_host(self, build_host):
-        build_host_re = re.compile("<BuildHost>(.*?)</BuildHost>")
         found = []
-        for name in self.list_installed():
-            xml = open(
-                os.path.join(self.package_path(name), ctx.const.metadata_xml)
-            ).read()
-            matched = build_host_re.search(xml)
-            if matched:
-                if build_host != matched.groups()[0]:
+        for name, record in self.__load_records().items():
+            host = record["build_host"]
+            if host is not None:
+                if build_host != host:
                     continue
             elif build_host:
                 continue
@@ -141,29 +344,48 @@ class InstallDB(lazydb.LazyDB):
 
         return found
 
-    def __get_version(self, meta_doc):
-        history = meta_doc.getTag("Package").getTag("History")
-        version = history.getTag("Update").getTagData("Version")
-        release = history.getTag("Update").getAttribute("release")
+    def get_version_and_distro_release(self, package):
+        record = self.__get_record(package)
+        return self.get_version(package) + (
+            record["distribution"],
+            record["distribution_release"],
+        )
+
+    def get_version(self, package):
+        record = self.__get_record(package)
 
         # TODO Remove None
-        return version, release, None
-
-    def __get_distro_release(self, meta_doc):
-        distro = meta_doc.getTag("Package").getTagData("Distribution")
-        release = meta_doc.getTag("Package").getTagData("DistributionRelease")
+        return record["version"], record["release"], None
+
+    def get_version_table(self):
+        """Return {name: (version, release, distribution, distribution
+        release)} of the installed packages."""
+        return dict(
+            (
+                name,
+                (
+                    record["version"],
+                    record["release"],
+                    record["distribution"],
+                    record["distribution_release"],
+                ),
+            )
+            for name, record in self.__load_records().items()
+        )
 
-        return distro, release
+    def __get_record(self, package):
+        if package in self.installed_db and package not in self.records:
+            try:
+                stored = self.__stored_records() if self.store is not None else {}
+                self.__load_record(package, stored)
+            except cachestore.Error as e:
+                ctx.ui.debug(str(e))
+                self.__load_record(package, {})
 
-    def get_version_and_distro_release(self, package):
-        metadata_xml = os.path.join(self.package_path(package), ctx.const.metadata_xml)
-        meta_doc = iksemel.parse(metadata_xml)
-        return self.__get_version(meta_doc) + self.__get_distro_release(meta_doc)
+        if package in self.records:
+            return self.records[package]
 
-    def get_version(self, package):
-        metadata_xml = os.path.join(self.package_path(package), ctx.const.metadata_xml)
-        meta_doc = iksemel.parse(metadata_xml)
-        return self.__get_version(meta_doc)
+        raise Error(_("Package %s is not installed") % package)
 
     def get_files(self, package):
         files = pisi.files.Files()
@@ -184,82 +406,64 @@ class InstallDB(lazydb.LazyDB):
         if fields is equal to : {'name': True, 'summary': True, 'desc': False}
         This method will return only package that contents terms in the package
         name or summary
+
+        Terms are matched as token prefixes, inside of summary and
+        description tokens, and as regular expressions against package
+        names. The result is ranked by relevance.
         """
-        resum = "<Summary xml:lang=.(%s|en).>.*?%s.*?</Summary>"
-        redesc = "<Description xml:lang=.(%s|en).>.*?%s.*?</Description>"
-        if not fields:
-            fields = {"name": True, "summary": True, "desc": True}
-        if not lang:
-            lang = pisi.pxml.autoxml.LocalText.get_lang()
-        found = []
-        for name in self.list_installed():
-            xml = open(
-                os.path.join(self.package_path(name), ctx.const.metadata_xml)
-            ).read()
-            if terms == [
-                term
-                for term in terms
-                if (fields["name"] and re.compile(term, re.I).search(name))
-                or (
-                    fields["summary"]
-                    and re.compile(resum % (lang, term), re.I).search(xml)
-                )
-                or (
-                    fields["desc"]
-                    and re.compile(redesc % (lang, term), re.I).search(xml)
-                )
-            ]:
-                found.append(name)
-        return found
+        if self.search_index is None:
+            self.search_index = searchindex.SearchIndex()
+            for name in self.__load_records():
+                self.__index_package(name)
+
+        return searchindex.rank(self.search_index.search(terms, lang, fields))
+
+    def __index_package(self, package):
+        record = self.records[package]
+        self.search_index.add(package, record["summary"], record["description"])
+
+    def get_summary(self, package):
+        summary = pisi.pxml.autoxml.LocalText("Summary")
+        summary.update(self.__get_record(package)["summary"])
+        return summary
 
     def get_isa_packages(self, isa):
-        risa = "<IsA>%s</IsA>" % isa
-        packages = []
-        for name in self.list_installed():
-            xml = open(
-                os.path.join(self.package_path(name), ctx.const.metadata_xml)
-            ).read()
-            if re.compile(risa).search(xml):
-                packages.append(name)
-        return packages
+        return [
+            name
+            for name, record in self.__load_records().items()
+            if isa in record["isa"]
+        ]
 
     def get_info(self, package):
+        record = self.__get_record(package)
         files_xml = os.path.join(self.package_path(package), ctx.const.files_xml)
         ctime = pisi.util.creation_time(files_xml)
-        pkg = self.get_package(package)
         state = "i"
-        if pkg.name in self.list_pending():
+        if package in self.list_pending():
             state = "ip"
 
-        info = InstallInfo(state, pkg.version, pkg.release, pkg.distribution, ctime)
+        info = InstallInfo(
+            state, record["version"], record["release"], record["distribution"], ctime
+        )
         return info
 
-    def __make_dependency(self, depStr):
-        node = iksemel.parseString(depStr)
-        dependency = pisi.dependency.Dependency()
-        dependency.package = node.firstChild().data()
-        if node.attributes():
-            attr = node.attributes()[0].decode()
-            dependency.__dict__[attr] = node.getAttribute(attr)
-        return dependency
-
-    def __create_dependency(self, depStr: str):
-        if "<AnyDependency>" in depStr:
-            anydependency = pisi.specfile.AnyDependency()
-            for dep in re.compile("(<Dependency .*?>.*?</Dependency>)").findall(depStr):
-                anydependency.dependencies.append(self.__make_dependency(dep))
-            return anydependency
-        else:
-            return self.__make_dependency(depStr)
+    def __unpack_dependency(self, packed):
+        package, attrs = packed
+        if package is not None:
+            return pisi.dependency.unpack(packed)
+
+        anydependency = pisi.specfile.AnyDependency()
+        anydependency.dependencies = [pisi.dependency.unpack(x) for x in attrs]
+        anydependency.package = anydependency.dependencies[0].package
+        return anydependency
 
     def get_rev_deps(self, name):
         rev_deps = []
 
-        package_revdeps = self.rev_deps_db.get(name)
+        package_revdeps = self.__get_revdeps().get(name)
         if package_revdeps:
             for pkg, dep in list(package_revdeps.items()):
-                dependency = self.__create_dependency(dep)
-                rev_deps.append((pkg, dependency))
+                rev_deps.append((pkg, self.__unpack_dependency(dep)))
 
         return rev_deps
 
@@ -274,21 +478,16 @@ class InstallDB(lazydb.LazyDB):
         metadata.read(metadata_xml)
         return metadata.package
 
+    def __get_package_providing(self, provides, pkgconfig):
+        for name, record in self.__load_records().items():
+            if pkgconfig in record[provides]:
+                return self.get_package(name)
+
     def get_package_by_pkgconfig(self, pkgconfig):
-        for item in self.list_installed():
-            pkg = self.get_package(item)
-            if pkg.providesPkgConfig is not None and len(pkg.providesPkgConfig) > 0:
-                for pc in pkg.providesPkgConfig:
-                    if pc.om == pkgconfig:
-                        return pkg
+        return self.__get_package_providing("pkgconfig", pkgconfig)
 
     def get_package_by_pkgconfig32(self, pkgconfig):
-        for item in self.list_installed():
-            pkg = self.get_package(item)
-            if pkg.providesPkgConfig32 is not None and len(pkg.providesPkgConfig32) > 0:
-                for pc in pkg.providesPkgConfig32:
-                    if pc.om == pkgconfig:
-                        return pkg
+        return self.__get_package_providing("pkgconfig32", pkgconfig)
 
     def __mark_package(self, _type, package):
         packages = self.__get_marked_packages(_type)
@@ -310,19 +509,32 @@ class InstallDB(lazydb.LazyDB):
 
     def add_package(self, pkginfo):
         # Cleanup old revdep info
-        for revdep_info in list(self.rev_deps_db.values()):
+        for revdep_info in list((self.rev_deps_db or {}).values()):
             if pkginfo.name in revdep_info:
                 del revdep_info[pkginfo.name]
 
+        self.records.pop(pkginfo.name, None)
         self.installed_db[pkginfo.name] = "%s-%s" % (pkginfo.version, pkginfo.release)
-        self.__add_to_revdeps(pkginfo.name, self.rev_deps_db)
+        record = self.__read_record(pkginfo.name)
+        if record is not None:
+            self.records[pkginfo.name] = record
+            self.__store_put(pkginfo.name, record)
+            if self.rev_deps_db is not None:
+                self.__add_to_revdeps(pkginfo.name, self.rev_deps_db)
+            if self.search_index is not None:
+                self.__index_package(pkginfo.name)
 
     def remove_package(self, package_name):
         if package_name in self.installed_db:
             del self.installed_db[package_name]
 
+        self.records.pop(package_name, None)
+        self.__store_delete(package_name)
+        if self.search_index is not None:
+            self.search_index.remove(package_name)
+
         # Cleanup revdep info
-        for revdep_info in list(self.rev_deps_db.values()):
+        for revdep_info in list((self.rev_deps_db or {}).values()):
             if package_name in revdep_info:
                 del revdep_info[package_name]
 
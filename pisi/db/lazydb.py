@@ -6,8 +6,10 @@ import pickle
 import time
 
 import pisi
+import pisi.durability
 from pisi import context as ctx
 from pisi import util
+from pisi.db import cachestore
 
 # lower borks for international locales. What we want is ascii lower.
 ascii_lowercase = "abcdefghijklmnopqrstuvwxyz"
@@ -40,6 +42,13 @@ class LazyDB(Singleton):
     # Make sure that caches get invalidated when switching between pisi/eopkg versions
     cache_version = pisi.__version__
 
+    # Cacheable DBs listing the names of their {repo: {key: value}} tables
+    # here are cached record by record in a CacheStore instead of being
+    # pickled as a whole. Such DBs keep the tables in self.tables and set
+    # themselves up from them in load_tables(), which is given lazy views
+    # over the store when the cache is loaded.
+    cache_tables = ()
+
     def __init__(self, cacheable=False, cachedir=None):
         if "initialized" not in self.__dict__:
             self.initialized = False
@@ -58,12 +67,68 @@ class LazyDB(Singleton):
     def __cache_version_file(self):
         return "%s.version" % self.__cache_file()
 
+    def cache_store_file(self):
+        return util.join_path(
+            ctx.config.cache_root_dir(),
+            "%s.db" % self.__class__.__name__.translate(lower_map),
+        )
+
+    def load_tables(self, tables):
+        """Set the DB up from its {name: {repo: {key: value}}} tables.
+
+        Called from init() with the tables generated from the
+        repositories, and with read-only StoredTable views over the
+        store when the cache is loaded, so it must not modify the
+        tables. DBs that only read self.tables need not override it.
+        """
+        pass
+
+    def __store_save(self):
+        if self.__dict__.get("store") is not None:
+            # Loaded from the store, so there is nothing new to write
+            return
+
+        try:
+            store = cachestore.CacheStore(self.cache_store_file())
+            for name in self.cache_tables:
+                store.write_table(name, self.tables[name])
+            store.set_meta("version", LazyDB.cache_version)
+            store.commit()
+            store.close()
+        except cachestore.Error as e:
+            ctx.ui.debug(str(e))
+            cachestore.CacheStore.remove(self.cache_store_file())
+
+    def __store_load(self):
+        path = self.cache_store_file()
+        if not os.path.exists(path):
+            return False
+
+        try:
+            store = cachestore.CacheStore(path, readonly=not os.access(path, os.W_OK))
+            if store.get_meta("version") != LazyDB.cache_version or not all(
+                store.has_table(name) for name in self.cache_tables
+            ):
+                store.close()
+                return False
+        except cachestore.Error as e:
+            ctx.ui.debug(str(e))
+            return False
+
+        self.store = store
+        self.tables = dict((name, store.table(name)) for name in self.cache_tables)
+        self.load_tables(self.tables)
+        return True
+
     def cache_save(self):
         if os.access(ctx.config.cache_root_dir(), os.W_OK) and self.cacheable:
+            if self.cache_tables:
+                self.__store_save()
+                return
+
             with open(self.__cache_version_file(), "w") as f:
                 f.write(LazyDB.cache_version)
-                f.flush()
-                os.fsync(f.fileno())
+                pisi.durability.fsync(f)
             pickle.dump(self._instance, open(self.__cache_file(), "wb"))
 
     def cache_valid(self):
@@ -75,6 +140,9 @@ class LazyDB(Singleton):
         return ver == LazyDB.cache_version
 
     def cache_load(self):
+        if self.cache_tables:
+            return self.__store_load()
+
         if os.path.exists(self.__cache_file()) and self.cache_valid():
             try:
                 # Note that cache_version is checked prior to load,
@@ -93,14 +161,22 @@ class LazyDB(Singleton):
                 return False
         return False
 
+    def __store_close(self):
+        store = self.__dict__.pop("store", None)
+        if store is not None:
+            store.close()
+
     def cache_flush(self):
+        self.__store_close()
         for path in [self.__cache_file(), self.__cache_version_file()]:
             try:
                 os.remove(path)
             except FileNotFoundError:
                 pass
+        cachestore.CacheStore.remove(self.cache_store_file())
 
     def invalidate(self):
+        self.__store_close()
         self._delete()
 
     def cache_regenerate(self):
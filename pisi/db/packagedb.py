@@ -8,14 +8,16 @@ import datetime
 import os
 import re
 import time
-import zlib
 
 import iksemel
 
 import pisi.context
 import pisi.db
+import pisi.db.binaryindex as binaryindex
+import pisi.db.searchindex as searchindex
 import pisi.db.itembyrepo
 import pisi.db.lazydb as lazydb
+import pisi.db.packagerecord as packagerecord
 import pisi.dependency
 import pisi.metadata
 import pisi.package
@@ -25,64 +27,63 @@ from pisi import translate as _
 
 
 class PackageDB(lazydb.LazyDB):
+    cache_tables = ("packages", "versions", "revdeps", "obsoletes", "replaces")
+
     def __init__(self):
         lazydb.LazyDB.__init__(self, cacheable=True)
 
     def init(self):
-        self.__package_nodes = {}  # Packages
-        self.__revdeps = {}  # Reverse dependencies
-        self.__obsoletes = {}  # Obsoletes
-        self.__replaces = {}  # Replaces
+        package_nodes = {}  # Packages
+        versions = {}  # Version, release, distribution and its release
+        revdeps = {}  # Reverse dependencies
+        obsoletes = {}  # Obsoletes
+        replaces = {}  # Replaces
 
         repodb = pisi.db.repodb.RepoDB()
 
         for repo in repodb.list_repos():
-            doc = repodb.get_repo_doc(repo)
-            self.__package_nodes[repo] = self.__generate_packages(doc)
-            self.__revdeps[repo] = self.__generate_revdeps(doc)
-            self.__obsoletes[repo] = self.__generate_obsoletes(doc)
-            self.__replaces[repo] = self.__generate_replaces(doc)
-
-        self.pdb = pisi.db.itembyrepo.ItemByRepo(self.__package_nodes, compressed=True)
-        self.rvdb = pisi.db.itembyrepo.ItemByRepo(self.__revdeps)
-        self.odb = pisi.db.itembyrepo.ItemByRepo(self.__obsoletes)
-        self.rpdb = pisi.db.itembyrepo.ItemByRepo(self.__replaces)
-
-    def __generate_replaces(self, doc):
-        return [
-            x.getTagData("Name")
-            for x in doc.tags("Package")
-            if x.getTagData("Replaces")
-        ]
-
-    def __generate_obsoletes(self, doc):
-        distribution = doc.getTag("Distribution")
-        obsoletes = distribution and distribution.getTag("Obsoletes")
-        src_repo = doc.getTag("SpecFile") is not None
-
-        if not obsoletes or src_repo:
-            return []
-
-        return [x.firstChild().data() for x in obsoletes.tags("Package")]
-
-    def __generate_packages(self, doc):
+            with repodb.get_repo_index(repo) as index:
+                package_nodes[repo] = self.__generate_packages(index)
+                versions[repo] = self.__generate_versions(index)
+                revdeps[repo] = self.__generate_revdeps(index)
+                obsoletes[repo] = dict.fromkeys(
+                    index.get_list("distribution", "Obsoletes")
+                )
+                replaces[repo] = dict.fromkeys(index.keys("replaces"))
+
+        self.tables = {
+            "packages": package_nodes,
+            "versions": versions,
+            "revdeps": revdeps,
+            "obsoletes": obsoletes,
+            "replaces": replaces,
+        }
+        self.load_tables(self.tables)
+
+    def load_tables(self, tables):
+        self.pdb = pisi.db.itembyrepo.ItemByRepo(tables["packages"], compressed=True)
+        self.vdb = pisi.db.itembyrepo.ItemByRepo(tables["versions"])
+        self.rvdb = pisi.db.itembyrepo.ItemByRepo(tables["revdeps"])
+        self.odb = pisi.db.itembyrepo.ItemByRepo(tables["obsoletes"])
+        self.rpdb = pisi.db.itembyrepo.ItemByRepo(tables["replaces"])
+
+    def __generate_packages(self, index):
+        return dict(index.items("packages"))
+
+    def __generate_versions(self, index):
         return dict(
-            [
-                (x.getTagData("Name"), zlib.compress(x.toString().encode()))
-                for x in doc.tags("Package")
-            ]
+            (name, tuple(value or None for value in binaryindex.split_list(value)))
+            for name, value in index.items("versions")
         )
 
-    def __generate_revdeps(self, doc):
+    def __generate_revdeps(self, index):
         revdeps = {}
-        for node in doc.tags("Package"):
-            name = node.getTagData("Name")
-            deps = node.getTag("RuntimeDependencies")
-            if deps:
-                for dep in deps.tags("Dependency"):
-                    revdeps.setdefault(dep.firstChild().data(), set()).add(
-                        (name, dep.toString())
-                    )
+        for dep_name, pairs in index.items("revdeps"):
+            pairs = binaryindex.split_list(pairs)
+            revdeps[dep_name] = set(
+                (name, binaryindex.unpack_attrs(attrs))
+                for name, attrs in zip(pairs[0::2], pairs[1::2])
+            )
         return revdeps
 
     def has_package(self, name, repo=None):
@@ -105,16 +106,11 @@ class PackageDB(lazydb.LazyDB):
         pkgConfigs = dict()
         pkgConfigs32 = dict()
 
-        def map_providers(doc, pkgConfigs: dict, pkgConfigs32: dict):
-            for pkg in doc.tags("Package"):
-                prov = pkg.getTag("Provides")
-                name = pkg.getTagData("Name")
-                if not prov:
-                    continue
-                for node in prov.tags("PkgConfig32"):
-                    pkgConfigs32[node.firstChild().data()] = name
-                for node in prov.tags("PkgConfig"):
-                    pkgConfigs[node.firstChild().data()] = name
+        def map_providers(index, pkgConfigs: dict, pkgConfigs32: dict):
+            for pc, name in index.items("pkgconfig32"):
+                pkgConfigs32[pc] = name.decode()
+            for pc, name in index.items("pkgconfig"):
+                pkgConfigs[pc] = name.decode()
             return (pkgConfigs, pkgConfigs32)
 
         if repo is None:
@@ -124,15 +120,15 @@ class PackageDB(lazydb.LazyDB):
             # original problem, and now we need to reverse it back to the normal order
             repos = repos[::-1] if repos is not None else None
             for repo in repos:
-                doc = repodb.get_repo_doc(repo)
-                pkgConfig, pkgConfigs32 = map_providers(
-                        doc, pkgConfigs, pkgConfigs32)
+                with repodb.get_repo_index(repo) as index:
+                    pkgConfig, pkgConfigs32 = map_providers(
+                            index, pkgConfigs, pkgConfigs32)
         else:
             if repo not in repodb.list_repos(only_active=False):
                 raise Error(_("Repo %s not found.") % repo)
-            doc = repodb.get_repo_doc(repo)
-            pkgConfig, pkgConfigs32 = map_providers(
-                        doc, pkgConfigs, pkgConfigs32)
+            with repodb.get_repo_index(repo) as index:
+                pkgConfig, pkgConfigs32 = map_providers(
+                            index, pkgConfigs, pkgConfigs32)
 
         return (pkgConfigs, pkgConfigs32)
 
@@ -177,63 +173,56 @@ class PackageDB(lazydb.LazyDB):
         if fields is equal to : {'name': True, 'summary': True, 'desc': False}
         This method will return only package that contents terms in the package
         name or summary
+
+        Terms are matched as token prefixes, inside of summary and
+        description tokens, and as regular expressions against package
+        names. The result is ranked by relevance.
         """
-        resum = "<Summary xml:lang=.(%s|en).>.*?%s.*?</Summary>"
-        redesc = "<Description xml:lang=.(%s|en).>.*?%s.*?</Description>"
-        if not lang:
-            lang = pisi.pxml.autoxml.LocalText.get_lang()
-        if not fields:
-            fields = {"name": True, "summary": True, "desc": True}
-        found = []
-        for name, xml in self.pdb.get_items_iter(repo):
-            if terms == [
-                term
-                for term in terms
-                if (fields["name"] and re.compile(term, re.I).search(name))
-                or (
-                    fields["summary"]
-                    and re.compile(resum % (lang, term), re.I).search(xml.decode())
-                )
-                or (
-                    fields["desc"]
-                    and re.compile(redesc % (lang, term), re.I).search(xml.decode())
-                )
-            ]:
-                found.append(name)
-        return found
+        repodb = pisi.db.repodb.RepoDB()
 
-    def __get_version(self, meta_doc):
-        history = meta_doc.getTag("History")
-        version = history.getTag("Update").getTagData("Version")
-        release = history.getTag("Update").getAttribute("release")
+        scores = {}
+        for repo in [repo] if repo else repodb.list_repos():
+            with repodb.get_repo_index(repo) as index:
 
-        # TODO Remove None
-        return version, release, None
+                def prefix_items(prefix):
+                    for key, names in index.prefix_items("search", prefix):
+                        yield key, binaryindex.split_list(names)
 
-    def __get_distro_release(self, meta_doc):
-        distro = meta_doc.getTagData("Distribution")
-        release = meta_doc.getTagData("DistributionRelease")
+                def words(field, lang):
+                    key = searchindex.make_key(field, lang, "")
+                    return index.get("search_words", key, b"").decode()
 
-        return distro, release
+                found = searchindex.search(
+                    prefix_items, terms, lang, fields, index.keys("packages"), words
+                )
+            for name, score in found.items():
+                scores[name] = max(scores.get(name, 0), score)
+
+        return searchindex.rank(scores)
 
     def get_version_and_distro_release(self, name, repo):
-        if not self.has_package(name, repo):
+        if not self.vdb.has_item(name, repo):
             raise Error(_("Package %s not found.") % name)
-        pkg_doc = iksemel.parseString(self.pdb.get_item(name, repo).decode())
-        return self.__get_version(pkg_doc) + self.__get_distro_release(pkg_doc)
+
+        version, release, distro, distro_release = self.vdb.get_item(name, repo)
+        # TODO Remove None
+        return version, release, None, distro, distro_release
 
     def get_version(self, name, repo):
-        if not self.has_package(name, repo):
-            raise Error(_("Package %s not found.") % name)
+        return self.get_version_and_distro_release(name, repo)[:3]
 
-        pkg_doc = iksemel.parseString(self.pdb.get_item(name, repo).decode())
-        return self.__get_version(pkg_doc)
+    def get_version_table(self):
+        """Return {name: (version, release, distribution, distribution
+        release)} of the packages picked from the repositories in order."""
+        table = {}
+        for repo in reversed(pisi.db.repodb.RepoDB().list_repos()):
+            if self.vdb.has_repo(repo):
+                table.update(self.vdb.get_items_iter(repo))
+        return table
 
     def get_package_repo(self, name, repo=None):
         pkg, repo = self.pdb.get_item_repo(name, repo)
-        package = pisi.metadata.Package()
-        package.parse(pkg)
-        return package, repo
+        return packagerecord.PackageRecord(pkg.decode()), repo
 
     def get_resource(self, name, repo=None):
         repodb = pisi.db.repodb.RepoDB()
@@ -297,12 +286,8 @@ class PackageDB(lazydb.LazyDB):
 
         packages = set()
         for repo in repodb.list_repos():
-            doc = repodb.get_repo_doc(repo)
-            for package in doc.tags("Package"):
-                if package.getTagData("IsA"):
-                    for node in package.tags("IsA"):
-                        if node.firstChild().data() == isa:
-                            packages.add(package.getTagData("Name"))
+            with repodb.get_repo_index(repo) as index:
+                packages.update(index.get_list("isa", isa))
         return list(packages)
 
     def get_rev_deps(self, name, repo=None):
@@ -313,16 +298,9 @@ class PackageDB(lazydb.LazyDB):
         ):  # FIXME: what exception could we catch here, replace with that.
             return []
 
-        rev_deps = []
-        for pkg, dep in rvdb:
-            node = iksemel.parseString(dep)
-            dependency = pisi.dependency.Dependency()
-            dependency.package = node.firstChild().data()
-            if node.attributes():
-                attr = node.attributes()[0].decode()
-                dependency.__dict__[attr] = node.getAttribute(attr)
-            rev_deps.append((pkg, dependency))
-        return rev_deps
+        return [
+            (pkg, pisi.dependency.unpack((name, attrs))) for pkg, attrs in rvdb
+        ]
 
     # replacesdb holds the info about the replaced packages (ex. gaim -> pidgin)
     def get_replaces(self, repo=None):
@@ -0,0 +1,121 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Lightweight view of a repository package.
+
+Dependency resolution and fetching only look at a handful of package
+fields, so PackageDB hands out PackageRecord objects which decode just
+those from the index XML. Every other metadata.Package attribute is
+served from a full autoxml decode, made on first use. Assigning such
+an attribute sets it on the full decode, and the eagerly decoded fields
+are kept in sync with it, so a record can be modified like a Package.
+"""
+
+import iksemel
+
+import pisi.conflict
+import pisi.dependency
+import pisi.metadata
+import pisi.replace
+import pisi.specfile
+
+
+def decode_nodes(cls, parent, tag):
+    items = []
+    if parent is not None:
+        for node in parent.tags(tag):
+            item = cls()
+            item.decode(node, [])
+            items.append(item)
+    return items
+
+
+class PackageRecord:
+    __slots__ = (
+        "name",
+        "version",
+        "release",
+        "packageDependencies",
+        "packageAnyDependencies",
+        "componentDependencies",
+        "conflicts",
+        "replaces",
+        "packageURI",
+        "packageHash",
+        "packageSize",
+        "_xml",
+        "_package",
+    )
+
+    def __init__(self, xml):
+        self._xml = xml
+        self._package = None
+
+        node = iksemel.parseString(xml)
+        update = node.getTag("History").getTag("Update")
+
+        self.name = node.getTagData("Name")
+        self.version = update.getTagData("Version")
+        self.release = update.getAttribute("release")
+
+        deps = node.getTag("RuntimeDependencies")
+        self.packageDependencies = decode_nodes(
+            pisi.dependency.Dependency, deps, "Dependency"
+        )
+        self.packageAnyDependencies = decode_nodes(
+            pisi.specfile.AnyDependency, deps, "AnyDependency"
+        )
+        self.componentDependencies = []
+        if deps is not None:
+            self.componentDependencies = [
+                x.firstChild().data() for x in deps.tags("Component")
+            ]
+
+        self.conflicts = decode_nodes(
+            pisi.conflict.Conflict, node.getTag("Conflicts"), "Package"
+        )
+        self.replaces = decode_nodes(
+            pisi.replace.Replace, node.getTag("Replaces"), "Package"
+        )
+
+        self.packageURI = node.getTagData("PackageURI")
+        self.packageHash = node.getTagData("PackageHash")
+        size = node.getTagData("PackageSize")
+        self.packageSize = int(size) if size else None
+
+    def package(self):
+        """Return the fully decoded metadata.Package."""
+        if self._package is None:
+            package = pisi.metadata.Package()
+            package.parse(self._xml)
+            # The fields decoded here may have been assigned since
+            for attr in self.__slots__:
+                if not attr.startswith("_"):
+                    setattr(package, attr, getattr(self, attr))
+            self._package = package
+        return self._package
+
+    def __getattr__(self, attr):
+        # Only reached for attributes which are not decoded eagerly
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return getattr(self.package(), attr)
+
+    def __setattr__(self, attr, value):
+        if attr not in self.__slots__:
+            setattr(self.package(), attr, value)
+            return
+
+        object.__setattr__(self, attr, value)
+        if not attr.startswith("_") and self._package is not None:
+            setattr(self._package, attr, value)
+
+    def __str__(self):
+        return str(self.package())
+
+    runtimeDependencies = pisi.specfile.Package.runtimeDependencies
+    pkg_dir = pisi.specfile.Package.pkg_dir
+    satisfies_runtime_dependencies = (
+        pisi.specfile.Package.satisfies_runtime_dependencies
+    )
+    installable = pisi.specfile.Package.installable
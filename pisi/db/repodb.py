@@ -11,6 +11,7 @@ import pisi
 import pisi.uri
 import pisi.util
 import pisi.context as ctx
+import pisi.db.binaryindex as binaryindex
 import pisi.db.lazydb as lazydb
 import pisi.urlcheck
 from pisi.file import File
@@ -171,7 +172,7 @@ class RepoDB(lazydb.LazyDB):
     def has_repo_url(self, url, only_active=True):
         return url in self.list_repo_urls(only_active)
 
-    def get_repo_doc(self, repo_name):
+    def get_index_path(self, repo_name):
         repo = self.get_repo(repo_name)
 
         index_path = repo.indexuri.get_uri()
@@ -184,6 +185,16 @@ class RepoDB(lazydb.LazyDB):
             if File.is_compressed(index_path):
                 index_path = os.path.splitext(index_path)[0]
 
+        return index_path
+
+    def get_binary_index_path(self, repo_name):
+        return pisi.util.join_path(
+            ctx.config.index_dir(), repo_name, ctx.const.binary_index
+        )
+
+    def get_repo_doc(self, repo_name):
+        index_path = self.get_index_path(repo_name)
+
         if not os.path.exists(index_path):
             ctx.ui.warning(_("%s repository needs to be updated") % repo_name)
             return iksemel.newDocument("PISI")
@@ -197,6 +208,50 @@ class RepoDB(lazydb.LazyDB):
                 )
             )
 
+    def get_repo_index(self, repo_name):
+        """Return the index sections of a repository.
+
+        The binary index is used when it is up to date with the XML index,
+        otherwise the XML document is parsed and, if possible, a new binary
+        index is written for the next run.
+        """
+        index_path = self.get_index_path(repo_name)
+        binary_path = self.get_binary_index_path(repo_name)
+
+        if os.path.exists(binary_path):
+            try:
+                index = binaryindex.BinaryIndex(binary_path)
+                if index.is_current(index_path):
+                    return index
+                index.close()
+            except binaryindex.Error as e:
+                ctx.ui.debug(str(e))
+
+        if not os.path.exists(index_path):
+            ctx.ui.warning(_("%s repository needs to be updated") % repo_name)
+            return binaryindex.MemoryIndex()
+
+        index = binaryindex.from_doc(self.get_repo_doc(repo_name))
+        if os.access(os.path.dirname(binary_path), os.W_OK):
+            binaryindex.write(binary_path, index, index_path)
+
+        return index
+
+    def regenerate_index(self, repo_name, doc=None):
+        """Write the binary index of a freshly updated repository.
+
+        doc may be the already parsed index document, as left by applying
+        index deltas.
+        """
+        index_path = self.get_index_path(repo_name)
+        if not os.path.exists(index_path):
+            return
+
+        if doc is None:
+            doc = self.get_repo_doc(repo_name)
+        index = binaryindex.from_doc(doc)
+        binaryindex.write(self.get_binary_index_path(repo_name), index, index_path)
+
     def get_repo(self, repo):
         return Repo(pisi.uri.URI(self.get_repo_url(repo)))
 
@@ -237,15 +292,17 @@ class RepoDB(lazydb.LazyDB):
     def get_source_repos(self, only_active=True):
         repos = []
         for r in self.list_repos(only_active):
-            if self.get_repo_doc(r).getTag("SpecFile"):
-                repos.append(r)
+            with self.get_repo_index(r) as index:
+                if index.get("distribution", "SpecFile") is not None:
+                    repos.append(r)
         return repos
 
     def get_binary_repos(self, only_active=True):
         repos = []
         for r in self.list_repos(only_active):
-            if not self.get_repo_doc(r).getTag("SpecFile"):
-                repos.append(r)
+            with self.get_repo_index(r) as index:
+                if index.get("distribution", "SpecFile") is None:
+                    repos.append(r)
         return repos
 
     def list_repos(self, only_active=True):
@@ -279,14 +336,14 @@ class RepoDB(lazydb.LazyDB):
         return self.repoorder.get_status(name) == "active"
 
     def get_distribution(self, name):
-        doc = self.get_repo_doc(name)
-        distro = doc.getTag("Distribution")
-        return distro and distro.getTagData("SourceName")
+        with self.get_repo_index(name) as index:
+            distro = index.get("distribution", "SourceName")
+        return None if distro is None else distro.decode()
 
     def get_distribution_release(self, name):
-        doc = self.get_repo_doc(name)
-        distro = doc.getTag("Distribution")
-        return distro and distro.getTagData("Version")
+        with self.get_repo_index(name) as index:
+            release = index.get("distribution", "Version")
+        return None if release is None else release.decode()
 
     def check_distribution(self, name):
         if ctx.get_option("ignore_check"):
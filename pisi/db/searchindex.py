@@ -0,0 +1,196 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Inverted token index for package searches.
+
+Package names, summaries and descriptions are split into lowercase
+tokens. Every token is stored under a "field NUL language NUL token" key
+mapping to the names of the packages containing it, so that a search
+term is resolved with a prefix range query over the sorted keys instead
+of scanning every package.
+
+Package names are additionally matched against every term as a regular
+expression, as searches always did, so that "office" still finds
+"libreoffice". Only the name list is scanned for that. Likewise, terms
+are found inside summary and description tokens by scanning the newline
+separated list of the distinct tokens of a field, not the texts.
+"""
+
+import bisect
+import re
+
+import pisi.pxml.autoxml
+
+# Score of a prefix match per field, exact token matches count double
+WEIGHTS = {"name": 4, "summary": 2, "desc": 1}
+
+# Score of a name matching a term only as a regular expression
+NAME_PATTERN_WEIGHT = 1
+
+# Score of a summary or description token containing a term past its start
+SUBSTRING_WEIGHT = 1
+
+_token_re = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return _token_re.findall(text.lower())
+
+
+def make_key(field, lang, token):
+    return "%s\0%s\0%s" % (field, lang, token)
+
+
+def package_keys(name, summary, description):
+    """Return the index keys of a package.
+
+    summary and description are {language: text} dictionaries.
+    """
+    keys = set(make_key("name", "", token) for token in tokenize(name))
+    keys.add(make_key("name", "", name.lower()))
+    for field, texts in (("summary", summary), ("desc", description)):
+        for lang, text in texts.items():
+            keys.update(make_key(field, lang, token) for token in tokenize(text))
+    return keys
+
+
+def word_lists(keys):
+    """Return the summary and description tokens of index keys as a
+    {make_key(field, lang, ""): words} dictionary, words being newline
+    separated."""
+    words = {}
+    for key in keys:
+        field, lang, token = key.split("\0")
+        if field != "name":
+            words.setdefault(make_key(field, lang, ""), []).append(token)
+    return dict((key, "\n".join(sorted(tokens))) for key, tokens in words.items())
+
+
+def intersect(scores, matches):
+    """Keep the names in both score dictionaries, adding up their scores."""
+    if scores is None:
+        return matches
+
+    return dict(
+        (name, scores[name] + score)
+        for name, score in matches.items()
+        if name in scores
+    )
+
+
+def compile_term(term):
+    try:
+        return re.compile(term, re.I)
+    except re.error:
+        return re.compile(re.escape(term), re.I)
+
+
+def match_tokens(prefix_items, tokens, lang, fields, words):
+    scores = None
+    for token in tokens:
+        matches = {}
+        for field, weight in WEIGHTS.items():
+            if not fields.get(field):
+                continue
+            for field_lang in ("",) if field == "name" else set((lang, "en")):
+                prefix = make_key(field, field_lang, token)
+                for key, names in prefix_items(prefix):
+                    score = weight * 2 if key == prefix else weight
+                    for name in names:
+                        matches[name] = max(matches.get(name, 0), score)
+
+                if field == "name" or words is None:
+                    continue
+                pattern = re.compile(r"^.+%s.*$" % re.escape(token), re.M)
+                for word in pattern.findall(words(field, field_lang)):
+                    key = make_key(field, field_lang, word)
+                    for name in dict(prefix_items(key)).get(key, ()):
+                        matches.setdefault(name, SUBSTRING_WEIGHT)
+
+        scores = intersect(scores, matches)
+        if not scores:
+            break
+
+    return scores or {}
+
+
+def search(prefix_items, terms, lang=None, fields=None, names=(), words=None):
+    """Search an index for packages matching all of the terms.
+
+    prefix_items(prefix) must return the (key, names) pairs of all index
+    keys starting with prefix. names are all package names of the index,
+    which are matched against the terms as regular expressions.
+    words(field, lang) must return the tokens of a field as word_lists()
+    does, to find terms inside of them. Returns a {name: score} dictionary.
+    """
+    if not fields:
+        fields = {"name": True, "summary": True, "desc": True}
+    if not lang:
+        lang = pisi.pxml.autoxml.LocalText.get_lang()
+
+    scores = None
+    for term in terms:
+        matches = match_tokens(prefix_items, tokenize(term), lang, fields, words)
+        if fields.get("name"):
+            pattern = compile_term(term)
+            for name in names:
+                if name not in matches and pattern.search(name):
+                    matches[name] = NAME_PATTERN_WEIGHT
+
+        scores = intersect(scores, matches)
+        if not scores:
+            break
+
+    return scores or {}
+
+
+def rank(scores):
+    """Sort the names of a search result by descending score."""
+    return sorted(scores, key=lambda name: (-scores[name], name))
+
+
+class SearchIndex:
+    """In-memory token index that can be updated package by package."""
+
+    def __init__(self):
+        self.tokens = {}
+        self.packages = {}
+        self.sorted_keys = None
+
+    def add(self, name, summary, description):
+        self.remove(name)
+        keys = package_keys(name, summary, description)
+        self.packages[name] = keys
+        for key in keys:
+            self.tokens.setdefault(key, set()).add(name)
+        self.sorted_keys = None
+
+    def remove(self, name):
+        keys = self.packages.pop(name, None)
+        if keys is None:
+            return
+
+        for key in keys:
+            names = self.tokens[key]
+            names.discard(name)
+            if not names:
+                del self.tokens[key]
+        self.sorted_keys = None
+
+    def prefix_items(self, prefix):
+        if self.sorted_keys is None:
+            self.sorted_keys = sorted(self.tokens)
+
+        i = bisect.bisect_left(self.sorted_keys, prefix)
+        while i < len(self.sorted_keys) and self.sorted_keys[i].startswith(prefix):
+            yield self.sorted_keys[i], self.tokens[self.sorted_keys[i]]
+            i += 1
+
+    def words(self, field, lang):
+        prefix = make_key(field, lang, "")
+        return "\n".join(key[len(prefix) :] for key, names in self.prefix_items(prefix))
+
+    def search(self, terms, lang=None, fields=None):
+        return search(
+            self.prefix_items, terms, lang, fields, self.packages, self.words
+        )
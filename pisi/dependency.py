@@ -62,9 +62,29 @@ class Dependency(pisi.relation.Relation):
         if not packagedb.has_package(self.package):
             return False
         else:
-            pkg = packagedb.get_package(self.package)
-            return self.satisfies_relation(pkg.version, pkg.release)
+            version, release, build = packagedb.get_version(self.package, None)
+            return self.satisfies_relation(version, release)
 
     # Added for AnyDependency, single Dependency always returns False
     def satisfied_by_any_installed_other_than(self, package):
         return False
+
+
+def pack(node):
+    """Return the (package, ((attribute, value), ...)) tuple of a
+    Dependency node, from which unpack() builds the Dependency without
+    parsing any XML."""
+    attrs = tuple(
+        (attr.decode(), node.getAttribute(attr.decode()))
+        for attr in node.attributes()
+    )
+    return node.firstChild().data(), attrs
+
+
+def unpack(packed):
+    package, attrs = packed
+    dependency = Dependency()
+    dependency.package = package
+    for attr, value in attrs:
+        dependency.__dict__[attr] = value
+    return dependency
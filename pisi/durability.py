@@ -0,0 +1,214 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Batched syncing of the files written by multi-package operations.
+
+Outside of a transaction, files which have to reach the disk are synced
+one at a time as they are written. Inside a transaction() the written
+paths are collected instead, and the file systems holding them are
+synced once when the transaction ends, with syncfs(2) where available
+and a single sync(2) otherwise.
+
+The packages of a running transaction are listed in an intent log in
+the info directory, which is removed once their files are synced. If the
+log is found when the next transaction starts, the previous operation
+was interrupted before that point. The files of the listed packages are
+then verified against their recorded hashes, and the packages whose
+files did not make it to the disk are reported so that they can be
+reinstalled.
+"""
+
+import contextlib
+import ctypes
+import os
+import time
+
+import pisi
+import pisi.context as ctx
+import pisi.util as util
+from pisi import translate as _
+
+_libc = None
+
+# The running transaction
+_current = None
+
+
+def syncfs(path):
+    """Sync the file system holding path.
+
+    Returns False if syncfs(2) is not available.
+    """
+    global _libc
+    if _libc is None:
+        try:
+            _libc = ctypes.CDLL(None, use_errno=True)
+        except OSError:
+            _libc = False
+
+    if not _libc or not hasattr(_libc, "syncfs"):
+        return False
+
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if _libc.syncfs(fd) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+    finally:
+        os.close(fd)
+
+    return True
+
+
+class Transaction:
+    def __init__(self):
+        self.paths = []
+        # {directory: device} and {device: a directory on it}
+        self.dirs = {}
+        self.devices = {}
+
+    def add(self, path):
+        self.paths.append(path)
+
+        directory = os.path.dirname(path)
+        if directory not in self.dirs:
+            try:
+                device = os.stat(directory).st_dev
+            except OSError:
+                return
+            self.dirs[directory] = device
+            self.devices.setdefault(device, directory)
+
+    def commit(self):
+        start = time.time()
+
+        synced = True
+        for directory in self.devices.values():
+            if not syncfs(directory):
+                synced = False
+                break
+
+        if not synced and self.paths:
+            # One sync(2) is cheaper than an fdatasync(2) per file
+            os.sync()
+
+        ctx.ui.debug(
+            _(
+                "Synced %(files)d files on %(devices)d file systems "
+                "in %(secs).2f seconds."
+            )
+            % {
+                "files": len(self.paths),
+                "devices": len(self.devices),
+                "secs": time.time() - start,
+            }
+        )
+
+
+def intent_log():
+    return util.join_path(ctx.config.info_dir(), ctx.const.sync_intent)
+
+
+def damaged(package):
+    """Check if the files of an installed package are missing or differ
+    from their recorded hashes."""
+    import pisi.operations.check
+
+    try:
+        results = pisi.operations.check.check_package(package)
+    except Exception as e:
+        ctx.ui.debug(str(e))
+        return True
+
+    return bool(results["missing"] or results["corrupted"])
+
+
+def recover():
+    """Verify the packages of a transaction which never got synced, and
+    report the ones which have to be reinstalled."""
+    path = intent_log()
+    if not os.path.exists(path):
+        return
+
+    with open(path) as f:
+        packages = f.read().split()
+
+    if packages:
+        ctx.ui.info(_("Verifying the packages of an interrupted operation..."))
+        installdb = pisi.db.installdb.InstallDB()
+        packages = [
+            package
+            for package in sorted(set(packages))
+            if installdb.has_package(package) and damaged(package)
+        ]
+
+    if packages:
+        ctx.ui.warning(
+            _(
+                "A previous operation was interrupted before its files were "
+                "written to disk. Reinstallation of the following packages "
+                "is strongly recommended:"
+            )
+        )
+        for package in packages:
+            ctx.ui.warning("    - %s" % package)
+
+    os.unlink(path)
+
+
+def fsync(f):
+    """Flush the file object f to disk, or leave it to the transaction."""
+    f.flush()
+    if _current is None:
+        os.fsync(f.fileno())
+    else:
+        _current.add(os.path.abspath(f.name))
+
+
+def written(path):
+    """Note a file the running transaction has to sync, if any."""
+    if _current is not None:
+        _current.add(path)
+
+
+@contextlib.contextmanager
+def transaction(packages):
+    """Sync the files written by an operation on packages once, at the end."""
+    global _current
+    if _current is not None:
+        yield
+        return
+
+    recover()
+
+    path = intent_log()
+    util.ensure_dirs(os.path.dirname(path))
+    with open(path, "w") as f:
+        f.write("\n".join(packages) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    fd = os.open(os.path.dirname(path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+    _current = Transaction()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        current, _current = _current, None
+        # Whatever got written has to reach the disk, even if the
+        # operation failed halfway. The intent log is only removed once
+        # that succeeded, so that the next operation verifies the packages
+        try:
+            current.commit()
+        except Exception as e:
+            if not failed:
+                raise
+            # Do not hide the error of the operation
+            ctx.ui.warning(_("Cannot sync the written files: %s") % e)
+        else:
+            os.unlink(path)
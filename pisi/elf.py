@@ -0,0 +1,287 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Minimal ELF reader for package generation.
+
+Reads just what the builder needs from an ELF file: its type, the
+SONAME, NEEDED, RPATH and RUNPATH entries of the dynamic section and the
+GNU build ID note. Files are mapped into memory and only the headers,
+the dynamic section, its string table and the notes are touched, which
+is much cheaper than running readelf and parsing its output.
+
+Results are cached per inode, size and modification time, so a file
+looked at by several build steps is only read once unless it changed
+in between (as stripping does).
+"""
+
+import mmap
+import os
+import stat
+import struct
+
+ET_REL = 1
+ET_EXEC = 2
+ET_DYN = 3
+
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_NOTE = 4
+
+SHT_NOTE = 7
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_SONAME = 14
+DT_RPATH = 15
+DT_RUNPATH = 29
+DT_FLAGS_1 = 0x6FFFFFFB
+
+DF_1_PIE = 0x08000000
+
+NT_GNU_BUILD_ID = 3
+
+# {(device, inode, size, mtime): ELFFile or None}
+_cache = {}
+
+
+class ELFFile:
+    __slots__ = (
+        "elfclass",
+        "little_endian",
+        "type",
+        "pie",
+        "soname",
+        "needed",
+        "rpath",
+        "runpath",
+        "build_id",
+    )
+
+    def __init__(self, elfclass, little_endian, type):
+        self.elfclass = elfclass
+        self.little_endian = little_endian
+        self.type = type
+        self.pie = False
+        self.soname = None
+        self.needed = []
+        self.rpath = []
+        self.runpath = []
+        self.build_id = None
+
+    def is_shared_object(self):
+        return self.type == ET_DYN and not self.pie
+
+    def is_executable(self):
+        return self.type == ET_EXEC or (self.type == ET_DYN and self.pie)
+
+
+class _Layout:
+    """Struct formats of one ELF class and byte order."""
+
+    def __init__(self, elfclass, order):
+        if elfclass == 32:
+            self.ehdr = struct.Struct(order + "16xHHIIIIIHHHHHH")
+            self.phdr = struct.Struct(order + "IIIIIIII")
+            self.shdr = struct.Struct(order + "IIIIIIIIII")
+            self.dyn = struct.Struct(order + "iI")
+        else:
+            self.ehdr = struct.Struct(order + "16xHHIQQQIHHHHHH")
+            self.phdr = struct.Struct(order + "IIQQQQQQ")
+            self.shdr = struct.Struct(order + "IIQQQQIIQQ")
+            self.dyn = struct.Struct(order + "qQ")
+        self.elfclass = elfclass
+        self.note = struct.Struct(order + "III")
+
+    def program_header(self, data, offset):
+        """Return (type, offset, vaddr, filesz, align)."""
+        if self.elfclass == 32:
+            ptype, poffset, vaddr, paddr, filesz, memsz, flags, align = (
+                self.phdr.unpack_from(data, offset)
+            )
+        else:
+            ptype, flags, poffset, vaddr, paddr, filesz, memsz, align = (
+                self.phdr.unpack_from(data, offset)
+            )
+        return ptype, poffset, vaddr, filesz, align
+
+    def section_header(self, data, offset):
+        """Return (type, offset, size, align)."""
+        name, stype, flags, addr, soffset, size, link, info, align, entsize = (
+            self.shdr.unpack_from(data, offset)
+        )
+        return stype, soffset, size, align
+
+
+_layouts = dict(
+    ((elfclass, order), _Layout(elfclass, order))
+    for elfclass in (32, 64)
+    for order in ("<", ">")
+)
+
+
+def _string(data, offset):
+    end = data.find(b"\0", offset)
+    if end < 0:
+        raise IndexError(offset)
+    return data[offset:end].decode("utf-8", "surrogateescape")
+
+
+def _notes(data, layout, offset, size, align):
+    align = 8 if align == 8 else 4
+    end = min(offset + size, len(data))
+    while offset + layout.note.size <= end:
+        namesz, descsz, ntype = layout.note.unpack_from(data, offset)
+        offset += layout.note.size
+        name = data[offset : offset + namesz]
+        offset += (namesz + align - 1) & ~(align - 1)
+        desc = data[offset : offset + descsz]
+        offset += (descsz + align - 1) & ~(align - 1)
+        yield name, ntype, desc
+
+
+def parse(data):
+    """Parse the ELF file in data, a bytes-like object.
+
+    Returns None if data is not an ELF file.
+    """
+    if data[:4] != b"\x7fELF" or len(data) < 16:
+        return None
+
+    elfclass = {1: 32, 2: 64}.get(data[4])
+    order = {1: "<", 2: ">"}.get(data[5])
+    if elfclass is None or order is None:
+        return None
+    layout = _layouts[(elfclass, order)]
+
+    try:
+        (
+            etype,
+            machine,
+            version,
+            entry,
+            phoff,
+            shoff,
+            flags,
+            ehsize,
+            phentsize,
+            phnum,
+            shentsize,
+            shnum,
+            shstrndx,
+        ) = layout.ehdr.unpack_from(data, 0)
+
+        elf = ELFFile(elfclass, order == "<", etype)
+
+        segments = []
+        if phoff:
+            segments = [
+                layout.program_header(data, phoff + i * phentsize)
+                for i in range(phnum)
+            ]
+
+        note_areas = []
+        if shoff and shnum:
+            for i in range(shnum):
+                stype, offset, size, align = layout.section_header(
+                    data, shoff + i * shentsize
+                )
+                if stype == SHT_NOTE:
+                    note_areas.append((offset, size, align))
+        else:
+            note_areas = [
+                (offset, size, align)
+                for ptype, offset, vaddr, size, align in segments
+                if ptype == PT_NOTE
+            ]
+
+        for offset, size, align in note_areas:
+            for name, ntype, desc in _notes(data, layout, offset, size, align):
+                if ntype == NT_GNU_BUILD_ID and name == b"GNU\0":
+                    elf.build_id = desc.hex()
+                    break
+            if elf.build_id is not None:
+                break
+
+        dynamic = [s for s in segments if s[0] == PT_DYNAMIC]
+        if dynamic:
+            ptype, offset, vaddr, size, align = dynamic[0]
+            entries = []
+            end = min(offset + size, len(data))
+            while offset + layout.dyn.size <= end:
+                tag, value = layout.dyn.unpack_from(data, offset)
+                if tag == DT_NULL:
+                    break
+                entries.append((tag, value))
+                offset += layout.dyn.size
+
+            # DT_STRTAB is an address, find it in the loaded segments
+            strtab = None
+            for tag, value in entries:
+                if tag == DT_STRTAB:
+                    for ptype, offset, vaddr, size, align in segments:
+                        if ptype == PT_LOAD and vaddr <= value < vaddr + size:
+                            strtab = value - vaddr + offset
+                            break
+                    break
+
+            for tag, value in entries:
+                if tag == DT_FLAGS_1:
+                    elf.pie = bool(value & DF_1_PIE)
+                elif strtab is None:
+                    continue
+                elif tag == DT_NEEDED:
+                    elf.needed.append(_string(data, strtab + value))
+                elif tag == DT_SONAME:
+                    elf.soname = _string(data, strtab + value)
+                elif tag == DT_RPATH:
+                    elf.rpath.append(_string(data, strtab + value))
+                elif tag == DT_RUNPATH:
+                    elf.runpath.append(_string(data, strtab + value))
+    except (struct.error, IndexError):
+        # Truncated or corrupt
+        return None
+
+    return elf
+
+
+def read(path):
+    """Read the ELF file at path, returns None if it is not one."""
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            return None
+
+    try:
+        return parse(data)
+    finally:
+        data.close()
+
+
+def get(path, st=None):
+    """Return the cached ELFFile of a regular file, None for anything else.
+
+    st is the lstat() result of path, if the caller already has it.
+    """
+    if st is None:
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+
+    key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    if key not in _cache:
+        try:
+            _cache[key] = read(path)
+        except OSError:
+            return None
+
+    return _cache[key]
+
+
+def clear_cache():
+    _cache.clear()
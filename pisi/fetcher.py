@@ -1,13 +1,17 @@
 # SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project, 2026 Solus Project
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import hashlib
+import json
 import os
 import signal
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import requests
 from requests import HTTPError
+from requests.exceptions import ChunkedEncodingError, ConnectionError
 from requests.adapters import HTTPAdapter
 from rich.console import Group
 from rich.live import Live
@@ -25,6 +29,7 @@ from rich.rule import Rule
 
 import pisi
 import pisi.context as ctx
+import pisi.util as util
 from pisi import translate as _
 from pisi.uri import URI
 from pisi.util import human_readable_rate
@@ -32,6 +37,160 @@ from pisi.util import human_readable_rate
 """Maximum size in bytes of a download chunk to process at a time."""
 MAX_CHUNK_SIZE = 8192
 
+"""Size in bytes of the blocks read to hash an existing file."""
+HASH_CHUNK_SIZE = 1024 * 1024
+
+"""Number of times a download is attempted if it fails verification."""
+VERIFY_ATTEMPTS = 2
+
+"""Size in bytes of the chunks verified when resuming a partial download."""
+RESUME_CHUNK_SIZE = 1024 * 1024
+
+
+def content_range_start(resp) -> int | None:
+    """Return the first byte position of a 206 response, if it has one."""
+    value = resp.headers.get("Content-Range", "")
+    unit, _sep, byte_range = value.partition(" ")
+    if unit != "bytes":
+        return None
+    try:
+        return int(byte_range.split("-", 1)[0])
+    except ValueError:
+        return None
+
+
+class PartialDownload:
+    """A download in progress, kept next to its destination.
+
+    Data is written to "<destination>.part". Its state is kept in the
+    sidecar "<destination>.part.state": a JSON header line with the URL
+    and the ETag or Last-Modified validator of the response, followed by
+    the SHA-1 of every complete chunk of RESUME_CHUNK_SIZE bytes, one
+    per line. Chunk digests are appended as the download goes, so that
+    an interrupted download can be resumed with an HTTP range request
+    after checking the data already on disk.
+    """
+
+    def __init__(self, destination: str, url: str):
+        self.destination = destination
+        self.path = f"{destination}.part"
+        self.state_path = f"{destination}.part.state"
+        self.url = url
+        self.validator = None
+        self.chunks = []
+        self.file = None
+        self.state_file = None
+        self.chunk_digest = hashlib.sha1()
+        self.chunk_len = 0
+
+    def resume(self):
+        """Check the partial data on disk against the recorded chunks.
+
+        Returns the number of bytes that can be kept and the SHA-1 object
+        of those bytes.
+        """
+        digest = hashlib.sha1()
+        try:
+            with open(self.state_path) as f:
+                state = json.loads(f.readline())
+                # A line cut short by an interruption ends the list
+                chunks = [line.strip() for line in f]
+            if state["url"] != self.url or state["chunk_size"] != RESUME_CHUNK_SIZE:
+                return self.reset()
+            self.validator = state["validator"]
+        except (OSError, ValueError, KeyError):
+            return self.reset()
+
+        self.chunks = []
+        try:
+            with open(self.path, "rb") as f:
+                for expected in chunks:
+                    data = f.read(RESUME_CHUNK_SIZE)
+                    if len(data) < RESUME_CHUNK_SIZE:
+                        break
+                    if hashlib.sha1(data).hexdigest() != expected:
+                        break
+                    digest.update(data)
+                    self.chunks.append(expected)
+        except OSError:
+            return self.reset()
+
+        return len(self.chunks) * RESUME_CHUNK_SIZE, digest
+
+    def reset(self):
+        """Start over from the first byte."""
+        self.validator = None
+        self.chunks = []
+        return 0, hashlib.sha1()
+
+    def open(self, offset: int, validator: str | None) -> None:
+        if validator:
+            self.validator = validator
+        self.file = open(self.path, "r+b" if offset else "wb")
+        self.file.truncate(offset)
+        self.file.seek(offset)
+        self.chunk_digest = hashlib.sha1()
+        self.chunk_len = 0
+
+        # Start the state over with the chunks that are kept
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w") as f:
+            header = {
+                "url": self.url,
+                "validator": self.validator,
+                "chunk_size": RESUME_CHUNK_SIZE,
+            }
+            f.write(json.dumps(header) + "\n")
+            f.writelines(f"{chunk}\n" for chunk in self.chunks)
+        os.replace(tmp, self.state_path)
+        self.state_file = open(self.state_path, "a")
+
+    def write(self, data: bytes) -> int:
+        size = self.file.write(data)
+        while data:
+            part = data[: RESUME_CHUNK_SIZE - self.chunk_len]
+            data = data[len(part) :]
+            self.chunk_digest.update(part)
+            self.chunk_len += len(part)
+            if self.chunk_len == RESUME_CHUNK_SIZE:
+                self.chunks.append(self.chunk_digest.hexdigest())
+                self.chunk_digest = hashlib.sha1()
+                self.chunk_len = 0
+                self.save()
+        return size
+
+    def save(self) -> None:
+        """Record the last complete chunk after its data."""
+        self.file.flush()
+        self.state_file.write(f"{self.chunks[-1]}\n")
+        self.state_file.flush()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.state_file is not None:
+            self.state_file.close()
+            self.state_file = None
+
+    def discard(self) -> None:
+        """Remove the partial data and its state."""
+        self.close()
+        for path in (self.path, self.state_path):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def finish(self) -> None:
+        """Move the complete file to its destination."""
+        self.close()
+        os.replace(self.path, self.destination)
+        try:
+            os.unlink(self.state_path)
+        except FileNotFoundError:
+            pass
+
 
 class Fetcher:
     """Handles an HTTP session for making one or more download requests.
@@ -54,8 +213,9 @@ class Fetcher:
 
         self.session = requests.Session()
 
-        self.session.mount("http://", HTTPAdapter(max_retries=self.max_retries))
-        self.session.mount("https://", HTTPAdapter(max_retries=self.max_retries))
+        # Failed requests are retried by fetch, resuming where they stopped
+        self.session.mount("http://", HTTPAdapter(max_retries=0))
+        self.session.mount("https://", HTTPAdapter(max_retries=0))
         self.session.headers.update({"User-Agent": f"eopkg Fetcher/{pisi.__version__}"})
 
         proxies = self._get_proxies()
@@ -89,6 +249,9 @@ class Fetcher:
         )
         self.overall_task = None
 
+        # Set to stop running downloads when fetch_iter is abandoned
+        self.abort_event = threading.Event()
+
         self.live = Live(
             Group(
                 self.progress,
@@ -103,14 +266,21 @@ class Fetcher:
         url: URI,
         destination: str,
         description: str | None = None,
-    ) -> None:
+        verify: bool = False,
+    ) -> str | None:
         """
         Download a remote resource to a local file.
 
         :param URI url: The URI of the resource to download.
         :param str destination: The destination file to download to.
         :param str description: The description for the task.
+        :param bool verify: Compute the SHA-1 hash of the data as it is
+            written.
+        :returns: The SHA-1 hex digest of the file if verify is set,
+            otherwise None.
         """
+        digest = hashlib.sha1() if verify else None
+
         ctx.sig.catch_signal(signal.SIGINT)
         try:
             if url.is_local_file():
@@ -132,6 +302,7 @@ class Fetcher:
                         source,
                         destination,
                         task_id,
+                        digest,
                     )
                 finally:
                     self.progress.remove_task(task_id)
@@ -139,39 +310,77 @@ class Fetcher:
                         _(f"[green]Copied[reset] {os.path.basename(destination)}"),
                         highlight=False,
                     )
-
-            with self.session.get(url.get_uri(), stream=True, timeout=15) as resp:
-                resp.raise_for_status()
-                start_time = time.time()
-
-                total = int(resp.headers.get("Content-Length") or 0)
-                task_id = self.progress.add_task(
-                    description or os.path.basename(destination),
-                    total=total,
-                )
-                try:
-                    self._download_to_file(
-                        resp,
-                        destination,
-                        start_time,
-                        task_id,
+            else:
+                # Resume a previously interrupted download if possible
+                partial = PartialDownload(destination, url.get_uri())
+                offset, resumed_digest = partial.resume()
+                resp = self._get_range(url, offset, partial.validator)
+                if (
+                    offset
+                    and resp.status_code == 206
+                    and content_range_start(resp) != offset
+                ):
+                    # Not resumed where asked for, start over
+                    resp.close()
+                    offset, resumed_digest = partial.reset()
+                    resp = self._get_range(url, offset, None)
+
+                with resp:
+                    resp.raise_for_status()
+                    start_time = time.time()
+
+                    if offset and resp.status_code == 206:
+                        if digest is not None:
+                            digest = resumed_digest
+                    else:
+                        # The server sent the whole file
+                        offset, resumed_digest = partial.reset()
+
+                    partial.open(
+                        offset,
+                        resp.headers.get("ETag") or resp.headers.get("Last-Modified"),
                     )
-                finally:
-                    self.progress.remove_task(task_id)
-                    self.progress.console.print(
-                        _(f"[green]Downloaded[reset] {os.path.basename(destination)}"),
-                        highlight=False,
+
+                    total = int(resp.headers.get("Content-Length") or 0)
+                    task_id = self.progress.add_task(
+                        description or os.path.basename(destination),
+                        total=total + offset if total else 0,
+                        completed=offset,
                     )
+                    if offset and self.overall_task is not None:
+                        self.overall_progress.update(self.overall_task, advance=offset)
+                    try:
+                        complete = self._download_to_file(
+                            resp,
+                            partial,
+                            start_time,
+                            task_id,
+                            digest,
+                        )
+                        if complete:
+                            partial.finish()
+                    finally:
+                        partial.close()
+                        self.progress.remove_task(task_id)
+                        self.progress.console.print(
+                            _(
+                                f"[green]Downloaded[reset] {os.path.basename(destination)}"
+                            ),
+                            highlight=False,
+                        )
         finally:
             ctx.sig.enable_signal(signal.SIGINT)
 
         ctx.sig.check_signals()
 
+        return digest.hexdigest() if digest else None
+
     def _copy_to_file(
         self,
         source: str,
         destination: str,
         task_id: TaskID,
+        digest=None,
     ) -> None:
         # Try hardlinking first
         try:
@@ -179,6 +388,10 @@ class Fetcher:
                 os.unlink(destination)
             os.link(source, destination)
             size = os.path.getsize(source)
+            if digest is not None:
+                with open(source, "rb") as src:
+                    for chunk in iter(lambda: src.read(HASH_CHUNK_SIZE), b""):
+                        digest.update(chunk)
             self.progress.update(task_id, completed=size)
             if self.overall_task is not None:
                 self.overall_progress.update(self.overall_task, advance=size)
@@ -194,6 +407,8 @@ class Fetcher:
                     if not chunk:
                         break
                     dst.write(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
                     size = len(chunk)
                     self.progress.update(task_id, advance=size)
                     if self.overall_task is not None:
@@ -202,36 +417,44 @@ class Fetcher:
     def _download_to_file(
         self,
         resp: requests.Response,
-        destination: str,
+        partial: PartialDownload,
         start_time: float,
         task_id: TaskID,
-    ) -> None:
-        with open(destination, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=MAX_CHUNK_SIZE):
-                if not chunk:
-                    break
+        digest=None,
+    ) -> bool:
+        """Write the response body to a partial download.
+
+        Returns False if the download was interrupted.
+        """
+        for chunk in resp.iter_content(chunk_size=MAX_CHUNK_SIZE):
+            if not chunk:
+                break
+
+            size = partial.write(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            self.progress.update(task_id, advance=size)
+            if self.overall_task is not None:
+                self.overall_progress.update(self.overall_task, advance=size)
 
-                size = f.write(chunk)
-                self.progress.update(task_id, advance=size)
-                if self.overall_task is not None:
-                    self.overall_progress.update(self.overall_task, advance=size)
+            # Handle bandwidth limiting, if set
+            if self.bandwidth_limit:
+                elapsed = time.time() - start_time
+                # Calculate the time this chunk "should" take to stay
+                # under the limit
+                expected_time = MAX_CHUNK_SIZE / self.bandwidth_limit
 
-                # Handle bandwidth limiting, if set
-                if self.bandwidth_limit:
-                    elapsed = time.time() - start_time
-                    # Calculate the time this chunk "should" take to stay
-                    # under the limit
-                    expected_time = MAX_CHUNK_SIZE / self.bandwidth_limit
+                # Sleep the difference
+                if elapsed < expected_time:
+                    time.sleep(expected_time - elapsed)
 
-                    # Sleep the difference
-                    if elapsed < expected_time:
-                        time.sleep(expected_time - elapsed)
+                    start_time = time.time()
 
-                        start_time = time.time()
+            # Handle SIGINT in ThreadPoolExecutor context
+            if ctx.sig.done_event.is_set() or self.abort_event.is_set():
+                return False
 
-                # Handle SIGINT in ThreadPoolExecutor context
-                if ctx.sig.done_event.is_set():
-                    return
+        return True
 
     def fetch(
         self,
@@ -239,16 +462,27 @@ class Fetcher:
         dest_dir: str,
         filename: str | None = None,
         description: str | None = None,
+        expected_hash: str | None = None,
+        expected_size: int | None = None,
     ) -> None:
         """
         Fetches a remote resource.
 
+        If an expected SHA-1 hash is given, it is computed while the file
+        is downloaded and the download is retried if the result does not
+        match, so that no second read of the file is needed to verify it.
+
         :param url: The file to fetch.
         :type url: pisi.uri.URI | str
         :param str dest_dir: The directory to save the downloaded file to.
         :param filename: The name of the file to use.
         :type filename: str | None
         :param str description: The description for the task.
+        :param expected_hash: The SHA-1 hex digest the file must have.
+        :type expected_hash: str | None
+        :param expected_size: The size the file must have.
+        :type expected_size: int | None
+        :raises pisi.Error: If the file does not match after all attempts.
         """
         # This is silly and I hate it.
         if type(url) is str:
@@ -265,14 +499,55 @@ class Fetcher:
         if os.path.exists(archive_file) and not os.access(archive_file, os.W_OK):
             raise IOError(_(f"Unable to access destination file '{archive_file}'"))
 
-        try:
-            self.download_file(
-                url,
-                archive_file,
-                description,
-            )
-        except HTTPError:
-            raise
+        for attempt in range(VERIFY_ATTEMPTS):
+            for retry in range(self.max_retries + 1):
+                try:
+                    digest = self.download_file(
+                        url,
+                        archive_file,
+                        description,
+                        verify=expected_hash is not None,
+                    )
+                    break
+                except HTTPError as e:
+                    # The partial file does not fit the remote one anymore
+                    if e.response is None or e.response.status_code != 416:
+                        raise
+                    PartialDownload(archive_file, url.get_uri()).discard()
+                except (ConnectionError, ChunkedEncodingError):
+                    # Interrupted in the middle of the transfer
+                    if retry == self.max_retries:
+                        raise
+                    ctx.ui.warning(
+                        _("Download of %s was interrupted, resuming...")
+                        % os.path.basename(archive_file)
+                    )
+            else:
+                raise pisi.Error(
+                    _("Download Error: Could not fetch %s.")
+                    % os.path.basename(archive_file)
+                )
+
+            if self.abort_event.is_set() or ctx.sig.done_event.is_set():
+                return
+
+            size = os.path.getsize(archive_file)
+            if (expected_size is None or size == expected_size) and (
+                expected_hash is None or digest == expected_hash
+            ):
+                return
+
+            os.unlink(archive_file)
+            if attempt + 1 < VERIFY_ATTEMPTS:
+                ctx.ui.warning(
+                    _("%s does not match the expected size or hash, retrying...")
+                    % os.path.basename(archive_file)
+                )
+
+        raise pisi.Error(
+            _("Download Error: %s does not match the repository package.")
+            % os.path.basename(archive_file)
+        )
 
     def fetch_multi(self, items: list["pisi.package.PackageResource"]) -> None:
         """
@@ -311,6 +586,8 @@ class Fetcher:
                                 os.path.dirname(resource.local_path),
                                 os.path.basename(resource.local_path),
                                 description,
+                                resource.expected_hash,
+                                resource.size,
                             )
                         )
 
@@ -335,6 +612,125 @@ class Fetcher:
 
         ctx.sig.check_signals()
 
+    def fetch_iter(
+        self,
+        items: list["pisi.package.PackageResource"],
+        depends: dict[str, set[str]] | None = None,
+    ):
+        """
+        Fetches and verifies multiple package resources concurrently,
+        yielding each one as soon as it is ready.
+
+        A ready resource is yielded once the resources it depends on have
+        been yielded, while the others keep downloading in the background.
+        Only dependencies listed before a resource in items are waited for,
+        so the order of items is never inverted between dependencies.
+        Without depends, every resource depends on all the ones before it
+        and resources are yielded strictly in order. Packages that are
+        already in the cache with the expected hash are not fetched again.
+
+        The progress display is taken off the screen while the consumer
+        handles a yielded resource, so that its output is not mixed into it.
+
+        :param items: A list of PackageResource objects.
+        :param depends: Maps resource names to the names of the resources
+            they depend on.
+        """
+        max_workers = int(
+            ctx.config.options.download_workers
+            or ctx.config.values.general.download_workers
+        )
+        max_workers = max(1, min(max_workers, 64))
+        ctx.ui.debug(_(f"Setting {max_workers} concurrent download workers"))
+
+        total_size = sum(item.size for item in items)
+        self.overall_task = self.overall_progress.add_task("Overall", total=total_size)
+        self.abort_event.clear()
+
+        self.live.transient = True
+        with self.live:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                pending = [
+                    (resource, executor.submit(self._fetch_resource, resource))
+                    for resource in items
+                ]
+                try:
+                    while pending:
+                        i = self._next_ready(pending, depends)
+                        if i is None:
+                            wait(
+                                [f for r, f in pending if not f.done()],
+                                return_when=FIRST_COMPLETED,
+                            )
+                            continue
+
+                        resource = pending.pop(i)[0]
+                        self.live.stop()
+                        try:
+                            yield resource
+                        finally:
+                            self.live.start()
+                finally:
+                    # Stop the remaining downloads if we were abandoned
+                    for resource, future in pending:
+                        future.cancel()
+                    self.abort_event.set()
+
+                self.live.update(Group())
+
+    @staticmethod
+    def _next_ready(pending, depends):
+        """Return the index of the first (resource, future) pair of pending
+        that can be yielded, or None. Raises the error of failed fetches."""
+        earlier = set()
+        for i, (resource, future) in enumerate(pending):
+            if future.done():
+                future.result()
+                if depends is None:
+                    waiting = earlier
+                else:
+                    waiting = earlier.intersection(depends.get(resource.name, ()))
+                if not waiting:
+                    return i
+            earlier.add(resource.name)
+        return None
+
+    def _fetch_resource(self, resource: "pisi.package.PackageResource") -> None:
+        if resource.uri.is_remote_file():
+            path = resource.local_path
+            if os.path.exists(path) and util.sha1_file(path) == resource.expected_hash:
+                self.overall_progress.update(self.overall_task, advance=resource.size)
+                return
+
+            description = f"{resource.name} ({resource.repo})"
+            if resource.is_delta:
+                description += " [delta]"
+
+            # Verified while downloading
+            self.fetch(
+                resource.uri,
+                os.path.dirname(path),
+                os.path.basename(path),
+                description,
+                resource.expected_hash,
+                resource.size,
+            )
+        elif util.sha1_file(resource.pkg_path) != resource.expected_hash:
+            raise pisi.Error(
+                _("Download Error: Package %s does not match the repository package.")
+                % resource.name
+            )
+
+    def _get_range(self, url: URI, offset: int, validator: str | None):
+        """Request url from offset on, if the validator still matches."""
+        headers = {}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            if validator:
+                headers["If-Range"] = validator
+
+        return self.session.get(url.get_uri(), stream=True, timeout=15, headers=headers)
+
     def _get_bandwidth_limit(self) -> int:
         bandwidth_limit = (
             ctx.config.options.bandwidth_limit
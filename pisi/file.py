@@ -149,7 +149,8 @@ class File:
                 ctx.ui.info(
                     _("Copying %s to transfer dir") % uri.get_uri(), verbose=True
                 )
-                shutil.copy(uri.get_uri(), localfile)
+                pisi.util.clone_file(uri.get_uri(), localfile)
+                shutil.copymode(uri.get_uri(), localfile)
         else:
             localfile = uri.get_uri()  # TODO: use a special function here?
             if not os.path.exists(localfile):
@@ -159,7 +160,8 @@ class File:
                 localfile = pisi.util.join_path(
                     transfer_dir, os.path.basename(localfile)
                 )
-                shutil.copy(oldfn, localfile)
+                pisi.util.clone_file(oldfn, localfile)
+                shutil.copymode(oldfn, localfile)
 
         def clean_temporary():
             temp_files = []
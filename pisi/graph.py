@@ -94,25 +94,36 @@ class Digraph(object):
                 self.dfs_visit(u, finish_hook)
 
     def dfs_visit(self, u, finish_hook):
+        # Iterative, so that deep graphs cannot exhaust the recursion limit;
+        # vertices are discovered and finished in the same order as by the
+        # recursive algorithm
         self.color[u] = "g"  # mark green (discovered)
         self.d[u] = self.time = self.time + 1
-        for v in self.adj(u):
-            if self.color[v] == "w":  # explore unexplored vertices
-                self.p[v] = u
-                self.dfs_visit(v, finish_hook)
-            elif self.color[v] == "g":  # cycle detected
-                cycle = [u]
-                while self.p[u]:
-                    u = self.p[u]
-                    cycle.append(u)
-                    if self.has_edge(cycle[0], u):
-                        break
-                cycle.reverse()
-                raise CycleException(cycle)
-        self.color[u] = "b"  # mark black (completed)
-        if finish_hook:
-            finish_hook(u)
-        self.f[u] = self.time = self.time + 1
+        stack = [(u, iter(self.adj(u)))]
+        while stack:
+            u, children = stack[-1]
+            for v in children:
+                if self.color[v] == "w":  # explore unexplored vertices
+                    self.p[v] = u
+                    self.color[v] = "g"
+                    self.d[v] = self.time = self.time + 1
+                    stack.append((v, iter(self.adj(v))))
+                    break
+                elif self.color[v] == "g":  # cycle detected
+                    cycle = [u]
+                    while self.p[u]:
+                        u = self.p[u]
+                        cycle.append(u)
+                        if self.has_edge(cycle[0], u):
+                            break
+                    cycle.reverse()
+                    raise CycleException(cycle)
+            else:
+                stack.pop()
+                self.color[u] = "b"  # mark black (completed)
+                if finish_hook:
+                    finish_hook(u)
+                self.f[u] = self.time = self.time + 1
 
     def cycle_free(self):
         try:
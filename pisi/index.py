@@ -175,12 +175,41 @@ def add_package(params):
         package = pisi.package.Package(path, "r")
         md = package.get_metadata()
         md.package.packageSize = int(os.path.getsize(path))
-        md.package.packageHash = util.sha1_file(path)
         if ctx.config.options and ctx.config.options.absolute_urls:
             md.package.packageURI = os.path.realpath(path)
         else:
             md.package.packageURI = util.removepathprefix(repo_uri, path)
 
+        delta_paths = []
+        if md.package.name in deltas:
+            name, version, release, distro_id, arch = util.split_package_filename(path)
+
+            for delta_path in deltas[md.package.name]:
+                (
+                    src_release,
+                    dst_release,
+                    delta_distro_id,
+                    delta_arch,
+                ) = util.split_delta_package_filename(delta_path)[1:]
+
+                # Add only delta to latest build of the package
+                if dst_release != md.package.release or (
+                    delta_distro_id,
+                    delta_arch,
+                ) != (distro_id, arch):
+                    continue
+
+                delta_paths.append((delta_path, src_release))
+
+        # Hash the package and its deltas together, on a pool of threads
+        paths = [path] + [delta_path for delta_path, src_release in delta_paths]
+        hashes = {}
+        for hash_path, value, error in util.sha1_files(paths, len(paths)):
+            if error is not None:
+                raise error
+            hashes[hash_path] = value
+        md.package.packageHash = hashes[path]
+
         # check package semantics
         errs = md.errors()
         if md.errors():
@@ -194,33 +223,14 @@ def add_package(params):
             md.package.files = None
             md.package.additionalFiles = None
 
-            if md.package.name in deltas:
-                name, version, release, distro_id, arch = util.split_package_filename(
-                    path
-                )
-
-                for delta_path in deltas[md.package.name]:
-                    (
-                        src_release,
-                        dst_release,
-                        delta_distro_id,
-                        delta_arch,
-                    ) = util.split_delta_package_filename(delta_path)[1:]
-
-                    # Add only delta to latest build of the package
-                    if dst_release != md.package.release or (
-                        delta_distro_id,
-                        delta_arch,
-                    ) != (distro_id, arch):
-                        continue
-
-                    delta = metadata.Delta()
-                    delta.packageURI = util.removepathprefix(repo_uri, delta_path)
-                    delta.packageSize = int(os.path.getsize(delta_path))
-                    delta.packageHash = util.sha1_file(delta_path)
-                    delta.releaseFrom = src_release
-
-                    md.package.deltaPackages.append(delta)
+            for delta_path, src_release in delta_paths:
+                delta = metadata.Delta()
+                delta.packageURI = util.removepathprefix(repo_uri, delta_path)
+                delta.packageSize = int(os.path.getsize(delta_path))
+                delta.packageHash = hashes[delta_path]
+                delta.releaseFrom = src_release
+
+                md.package.deltaPackages.append(delta)
 
         return md.package
 
@@ -0,0 +1,334 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Incremental repository index updates.
+
+Every time "eopkg index" writes a changed index, the index generation is
+bumped and the packages added, changed or removed since the previous
+generation are written to a small delta file next to it:
+
+    eopkg-index.xml.deltas       manifest, "generation sha1sum digest"
+                                 on the first line, then "generation
+                                 sha1sum" of every available delta file
+    eopkg-index.xml.delta-N.xz   changes from generation N-1 to N
+
+Clients remember the generation of their local index and, when only a
+few generations behind, fetch and apply the missing deltas instead of
+downloading the whole index again. Changes outside of the package list
+(distribution, components, groups) cannot be expressed as a delta and
+restart the chain, which makes clients fall back to a full download.
+
+The digest in the manifest hashes the contents of the index independent
+of how it is serialized (see index_digest()), so that clients can verify
+a patched index, which is not byte-identical to the published one.
+"""
+
+import os
+
+import iksemel
+import lzma_mt
+
+import pisi
+import pisi.context as ctx
+import pisi.file
+import pisi.uri
+import pisi.util as util
+from pisi import translate as _
+
+# Number of deltas kept next to the index
+MAX_DELTAS = 48
+
+# {index uri: manifest} fetched by update_index(), for record_generation()
+_manifests = {}
+
+
+class Error(pisi.Error):
+    pass
+
+
+def base_name(index_uri):
+    """Return the uncompressed index name the delta files are named after."""
+    if pisi.file.File.is_compressed(index_uri):
+        return os.path.splitext(index_uri)[0]
+    return index_uri
+
+
+def manifest_name(index_name):
+    return index_name + ctx.const.index_deltas_suffix
+
+
+def delta_name(index_name, generation):
+    return "%s.delta-%d.xz" % (index_name, generation)
+
+
+def read_manifest(path):
+    """Return (generation, sha1sum, digest, {generation: delta sha1sum}).
+
+    digest is None for manifests written before it was recorded.
+    """
+    with open(path) as f:
+        lines = [line.split() for line in f if line.strip()]
+
+    try:
+        generation, sha1sum = int(lines[0][0]), lines[0][1]
+        digest = lines[0][2] if len(lines[0]) > 2 else None
+        deltas = dict((int(gen), sha1) for gen, sha1 in lines[1:])
+    except (IndexError, ValueError):
+        raise Error(_("Index delta manifest %s is malformed.") % path)
+
+    return generation, sha1sum, digest, deltas
+
+
+def write_manifest(path, generation, sha1sum, digest, deltas):
+    tmp = "%s.tmp" % path
+    with open(tmp, "w") as f:
+        f.write("%d %s %s\n" % (generation, sha1sum, digest))
+        for gen in sorted(deltas):
+            f.write("%d %s\n" % (gen, deltas[gen]))
+    os.replace(tmp, path)
+
+
+def package_nodes(doc):
+    return dict((node.getTagData("Name"), node) for node in doc.tags("Package"))
+
+
+def other_nodes(doc):
+    """Serialize everything a delta cannot carry."""
+    return "".join(
+        node.toString()
+        for tag in ("Distribution", "SpecFile", "Component", "Group")
+        for node in doc.tags(tag)
+    )
+
+
+def index_digest(doc, packages=None):
+    """Hash the contents of an index document.
+
+    Packages are hashed in name order and hidden nodes are left out, so
+    an index patched by apply_delta() has the digest of the index it was
+    brought up to. packages is the {name: node} dictionary of doc, if
+    the caller keeps one.
+    """
+    if packages is None:
+        packages = package_nodes(doc)
+
+    return util.sha1_data(
+        other_nodes(doc)
+        + "".join(packages[name].toString() for name in sorted(packages))
+    )
+
+
+def load_previous(output):
+    """Parse the index about to be replaced by "eopkg index".
+
+    Returns None unless the index is the one the delta manifest describes.
+    """
+    try:
+        generation, sha1sum, digest, deltas = read_manifest(manifest_name(output))
+        if util.sha1_file(output) != sha1sum:
+            return None
+        return iksemel.parse(output)
+    except (OSError, pisi.Error, iksemel.ParseError):
+        return None
+
+
+def publish(output, previous):
+    """Bump the index generation and write the delta from previous."""
+    manifest = manifest_name(output)
+    sha1sum = util.sha1_file(output)
+
+    generation, old_sha1sum, old_deltas = 0, None, {}
+    if os.path.exists(manifest):
+        try:
+            generation, old_sha1sum, digest, old_deltas = read_manifest(manifest)
+        except Error as e:
+            ctx.ui.warning(str(e))
+
+    if old_sha1sum == sha1sum:
+        return
+
+    doc = iksemel.parse(output)
+    generation += 1
+
+    deltas = {}
+    if previous is not None and other_nodes(previous) == other_nodes(doc):
+        path = delta_name(output, generation)
+        write_delta(path, generation, previous, doc)
+        deltas = dict(sorted(old_deltas.items())[1 - MAX_DELTAS :])
+        deltas[generation] = util.sha1_file(path)
+    # Otherwise clients have to fetch the whole index to get past this
+    # generation, so the delta chain starts over
+
+    # Remove the delta files which left the chain
+    for gen in set(old_deltas) - set(deltas):
+        if os.path.exists(delta_name(output, gen)):
+            os.unlink(delta_name(output, gen))
+
+    write_manifest(manifest, generation, sha1sum, index_digest(doc), deltas)
+    ctx.ui.info(
+        _("Index generation %d written with %d deltas.") % (generation, len(deltas))
+    )
+
+
+def write_delta(path, generation, previous, doc):
+    old = package_nodes(previous)
+    new = package_nodes(doc)
+
+    delta = iksemel.newDocument("PISIDelta")
+    delta.insertTag("From").insertData(str(generation - 1))
+    delta.insertTag("To").insertData(str(generation))
+
+    for name in sorted(set(old) - set(new)):
+        delta.insertTag("Removed").insertData(name)
+
+    for name, node in sorted(new.items()):
+        if name not in old or old[name].toString() != node.toString():
+            delta.insertNode(node)
+
+    with lzma_mt.open(path, "w") as f:
+        f.write(delta.toString().encode())
+
+
+def apply_delta(doc, packages, delta):
+    """Apply a parsed delta to the index document in place.
+
+    packages is the {name: node} dictionary of doc and is kept up to date.
+    """
+    names = [node.firstChild().data() for node in delta.tags("Removed")]
+    names.extend(node.getTagData("Name") for node in delta.tags("Package"))
+    for name in names:
+        node = packages.pop(name, None)
+        if node is not None:
+            node.hide()
+
+    for node in delta.tags("Package"):
+        packages[node.getTagData("Name")] = doc.insertNode(node)
+
+
+def generation_path(repo):
+    return util.join_path(ctx.config.index_dir(), repo, ctx.const.index_generation)
+
+
+def local_generation(repo):
+    try:
+        with open(generation_path(repo)) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def fetch_manifest(index_uri, tmpdir):
+    uri = pisi.uri.URI(manifest_name(base_name(index_uri)))
+    manifest = read_manifest(pisi.file.File.download(uri, tmpdir))
+    _manifests[index_uri] = manifest
+    return manifest
+
+
+def record_generation(index_uri, repo):
+    """Remember the generation of a fully downloaded index."""
+    tmpdir = os.path.join(ctx.config.index_dir(), repo)
+    index_path = util.join_path(tmpdir, os.path.basename(base_name(index_uri)))
+
+    generation = None
+    try:
+        # Reuse the manifest update_index() fetched, if it got that far.
+        # If the index changed since, its sha1sum does not match below
+        manifest = _manifests.pop(index_uri, None)
+        if manifest is None:
+            manifest = fetch_manifest(index_uri, tmpdir)
+            _manifests.pop(index_uri, None)
+        remote, sha1sum, digest, deltas = manifest
+        if util.sha1_file(index_path) == sha1sum:
+            generation = remote
+    except KeyboardInterrupt:
+        raise
+    except Exception as e:
+        ctx.ui.debug(_("No index deltas available: %s") % e)
+
+    if generation is None:
+        if os.path.exists(generation_path(repo)):
+            os.unlink(generation_path(repo))
+    else:
+        with open(generation_path(repo), "w") as f:
+            f.write("%d\n" % generation)
+
+
+def update_index(index_uri, repo):
+    """Bring the local index of a repository up to date with deltas.
+
+    Returns the patched index document, or None if the index has to be
+    downloaded in full. Raises pisi.file.AlreadyHaveException if the local
+    index is already current.
+    """
+    uri = pisi.uri.URI(index_uri)
+    if not (uri.is_remote_file() or pisi.file.File.is_compressed(index_uri)):
+        # Local uncompressed indexes are used in place
+        return None
+
+    tmpdir = os.path.join(ctx.config.index_dir(), repo)
+    index_path = util.join_path(tmpdir, os.path.basename(base_name(index_uri)))
+    generation = local_generation(repo)
+    if generation is None or not os.path.exists(index_path):
+        return None
+
+    try:
+        remote, sha1sum, digest, deltas = fetch_manifest(index_uri, tmpdir)
+        if remote == generation:
+            raise pisi.file.AlreadyHaveException(uri, index_path)
+
+        missing = list(range(generation + 1, remote + 1))
+        if not missing or any(gen not in deltas for gen in missing):
+            return None
+        if digest is None:
+            # The result could not be verified
+            return None
+
+        ctx.ui.info(
+            _("Applying %d index deltas (generation %d to %d).")
+            % (len(missing), generation, remote)
+        )
+
+        doc = iksemel.parse(index_path)
+        packages = package_nodes(doc)
+        for gen in missing:
+            delta_uri = pisi.uri.URI(delta_name(base_name(index_uri), gen))
+            path = pisi.file.File.download(
+                delta_uri,
+                tmpdir,
+                compress=pisi.file.File.COMPRESSION_TYPE_AUTO,
+                copylocal=True,
+            )
+            try:
+                if util.sha1_file(path + ".xz") != deltas[gen]:
+                    raise Error(_("File integrity of %s compromised.") % delta_uri)
+                delta = iksemel.parse(path)
+            finally:
+                for f in (path, path + ".xz"):
+                    if os.path.exists(f):
+                        os.unlink(f)
+
+            span = (delta.getTagData("From"), delta.getTagData("To"))
+            if span != (str(gen - 1), str(gen)):
+                raise Error(_("Index delta %s does not apply.") % delta_uri)
+            apply_delta(doc, packages, delta)
+
+        if index_digest(doc, packages) != digest:
+            raise Error(_("Index patched with deltas does not match the repository."))
+    except pisi.file.AlreadyHaveException:
+        raise
+    except KeyboardInterrupt:
+        raise
+    except Exception as e:
+        ctx.ui.debug(_("Cannot update index with deltas: %s") % e)
+        return None
+
+    tmp = "%s.tmp" % index_path
+    with open(tmp, "w") as f:
+        f.write(doc.toString())
+    os.replace(tmp, index_path)
+
+    with open(generation_path(repo), "w") as f:
+        f.write("%d\n" % remote)
+    _manifests.pop(index_uri, None)
+
+    return doc
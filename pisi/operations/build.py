@@ -11,6 +11,9 @@ import os
 import pwd
 import re
 import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import magic
 from requests import HTTPError
@@ -22,6 +25,7 @@ import pisi.component as component
 import pisi.context as ctx
 import pisi.db
 import pisi.dependency as dependency
+import pisi.elf
 import pisi.file
 import pisi.files
 import pisi.metadata
@@ -54,36 +58,143 @@ debug_map = dict()
 
 
 # Helper Functions
-def get_file_type(path, pinfo_list):
-    """Return the file type of a path according to the given PathInfo
-    list"""
+class PathMatcher:
+    """The <Path> entries of the packages of a spec, compiled once.
+
+    Literal entries are looked up by the path and each of its parent
+    directories, and glob entries are only tried one by one if a single
+    regex combining all of them matches, so finding the entry of a path
+    costs O(depth) instead of three fnmatch calls per entry. Entries are
+    also kept in a tree of path components to find overlapping entries
+    of different packages.
+    """
+
+    _magic = re.compile(r"[*?[]")
+
+    def __init__(self, packages):
+        self.packages = list(packages)
+        self.all = self.__compile(
+            [pinfo for package in self.packages for pinfo in package.files]
+        )
+        self.own = dict(
+            (id(package), self.__compile(package.files)) for package in self.packages
+        )
 
-    path = "/%s" % path
-    info = None
-    glob_match = parent_match = None
+        # {component: [{component: ...}, [(package index, path index, PathInfo)]]}
+        self.tree = {}
+        for i, package in enumerate(self.packages):
+            for j, pinfo in enumerate(package.files):
+                node = [self.tree, None]
+                for component in util.splitpath(pinfo.path):
+                    node = node[0].setdefault(component, [{}, []])
+                node[1].append((i, j, pinfo))
+
+    def __compile(self, pinfo_list):
+        exact = {}
+        # {parent directory with trailing slash: [(index, PathInfo)]}
+        parents = {}
+        globs = []
+        for i, pinfo in enumerate(pinfo_list):
+            exact.setdefault(pinfo.path, pinfo)
+            parent = util.join_path(pinfo.path, "*")
+            if self._magic.search(pinfo.path):
+                globs.append(
+                    (
+                        i,
+                        pinfo,
+                        re.compile(fnmatch.translate(pinfo.path)).match,
+                        re.compile(fnmatch.translate(parent)).match,
+                    )
+                )
+            else:
+                parents.setdefault(parent[:-1], []).append((i, pinfo))
+
+        any_glob = None
+        if globs:
+            any_glob = re.compile(
+                "|".join(
+                    "(?:%s)" % fnmatch.translate(pattern)
+                    for i, pinfo, full, parent in globs
+                    for pattern in (pinfo.path, util.join_path(pinfo.path, "*"))
+                )
+            ).match
 
-    for pinfo in pinfo_list:
-        if path == pinfo.path:
-            info = pinfo
-            break
+        return exact, parents, globs, any_glob
 
-        elif fnmatch.fnmatch(path, pinfo.path):
-            glob_match = pinfo
+    def match(self, path, package=None):
+        """Return the PathInfo of package path belongs to, or of any
+        package if package is None.
 
-        elif fnmatch.fnmatch(path, util.join_path(pinfo.path, "*")):
+        An entry equal to path wins, then the last glob entry matching
+        it, then the greatest entry path is under. None is returned if
+        no entry matches.
+        """
+        if package is None:
+            exact, parents, globs, any_glob = self.all
+        else:
+            exact, parents, globs, any_glob = self.own[id(package)]
+
+        if path in exact:
+            return exact[path]
+
+        candidates = []
+        if any_glob is not None and any_glob(path):
+            glob_match = None
+            for i, pinfo, full, parent in globs:
+                if full(path):
+                    glob_match = pinfo
+                elif parent(path):
+                    candidates.append((i, pinfo))
+            if glob_match is not None:
+                return glob_match
+
+        end = -1
+        while end is not None:
+            candidates.extend(parents.get(path[: end + 1], ()))
+            end = path.find("/", end + 1)
+            if end < 0:
+                end = None
+
+        parent_match = None
+        for i, pinfo in sorted(candidates, key=lambda candidate: candidate[0]):
             if parent_match is None or parent_match.path < pinfo.path:
                 parent_match = pinfo
 
-    else:
-        info = glob_match or parent_match
+        return parent_match
+
+    def subpaths(self, pinfo):
+        """Return the entries of all packages pinfo is a parent of, in
+        package and entry order."""
+        node = [self.tree, None]
+        for component in util.splitpath(pinfo.path):
+            if component not in node[0]:
+                return []
+            node = node[0][component]
+
+        entries = []
+        pending = [node]
+        while pending:
+            children, node_entries = pending.pop()
+            entries.extend(node_entries)
+            pending.extend(children.values())
+
+        entries.sort(key=lambda entry: entry[:2])
+        return [(self.packages[i], pinfo) for i, j, pinfo in entries]
+
+
+def get_file_type(path, package, matcher):
+    """Return the file type of a path according to the PathInfo list of
+    package, looked up in a PathMatcher of the spec"""
+
+    info = matcher.match("/%s" % path, package)
 
     return info.fileType, info.permanent
 
 
-def check_path_collision(package, pkgList):
+def check_path_collision(package, matcher):
     """This function will check for collision of paths in a package with
-    the paths of packages in pkgList. The return value will be the
-    list containing the paths that collide."""
+    the paths of the other packages of a PathMatcher. The return value
+    will be the list containing the paths that collide."""
     create_static = ctx.get_option("create_static")
     create_debug = ctx.config.values.build.generatedebug
     ar_suffix = ctx.const.ar_file_suffix
@@ -91,30 +202,31 @@ def check_path_collision(package, pkgList):
 
     collisions = []
     for pinfo in package.files:
-        for pkg in pkgList:
+        # if pinfo.path is a subpath of path.path like
+        # the example below. path.path is marked as a
+        # collide. Exp:
+        # pinfo.path: /usr/share
+        # path.path: /usr/share/doc
+        for pkg, path in matcher.subpaths(pinfo):
             if pkg is package:
                 continue
-            for path in pkg.files:
-                # if pinfo.path is a subpath of path.path like
-                # the example below. path.path is marked as a
-                # collide. Exp:
-                # pinfo.path: /usr/share
-                # path.path: /usr/share/doc
-
-                if (create_static and path.path.endswith(ar_suffix)) or (
-                    create_debug and path.path.endswith(debug_suffix)
-                ):
-                    # don't throw collision error for these files.
-                    # we'll handle this in gen_files_xml..
-                    continue
 
-                if util.subpath(pinfo.path, path.path):
-                    collisions.append(path.path.rstrip("/"))
-                    ctx.ui.debug(_("Path %s belongs in multiple packages") % path.path)
+            if (create_static and path.path.endswith(ar_suffix)) or (
+                create_debug and path.path.endswith(debug_suffix)
+            ):
+                # don't throw collision error for these files.
+                # we'll handle this in gen_files_xml..
+                continue
+
+            collisions.append(path.path.rstrip("/"))
+            ctx.ui.debug(_("Path %s belongs in multiple packages") % path.path)
     return collisions
 
 
 def exclude_special_files(filepath, fileinfo, ag):
+    """Clean up or remove libtool, byte-compiled python and perl pod
+    files, return True if the file was changed."""
+    changed = False
     keeplist = ag.get("KeepSpecial", [])
     patterns = {
         "libtool": "libtool library file",
@@ -136,6 +248,7 @@ def exclude_special_files(filepath, fileinfo, ag):
             )
             if new_ladata != ladata:
                 open(filepath, "w").write(new_ladata)
+                changed = True
 
     for name, pattern in list(patterns.items()):
         if name in keeplist:
@@ -146,9 +259,12 @@ def exclude_special_files(filepath, fileinfo, ag):
             os.unlink(filepath)
             # Remove dir if it becomes empty (Bug #11588)
             util.rmdirs(os.path.dirname(filepath))
+            return True
+
+    return changed
 
 
-def get_debug_path(filepath, fileinfo, install_dir):
+def get_debug_path(filepath, fileinfo, install_dir, timings=None):
     """Query ELF files for the correct BuildID based location"""
 
     if (
@@ -158,42 +274,41 @@ def get_debug_path(filepath, fileinfo, install_dir):
     ):
         return (None, None)
 
-    code, out, err = pisi.util.run_batch('LC_ALL=C readelf -n "%s"' % filepath)
-    if code != 0 or not out:
+    with util.timed(timings, "elf"):
+        elf = pisi.elf.get(filepath)
+    if elf is None or elf.build_id is None:
         return (None, None)
-    for line in out.split("\n"):
-        if "Build ID:" not in line:
-            continue
-        val = line.split(":")[1].strip()
+    val = elf.build_id
 
-        suffix = util.join_path(
-            ctx.const.debug_files_suffix, ".build-id", val[0:2], val[2:]
-        )
+    suffix = util.join_path(
+        ctx.const.debug_files_suffix, ".build-id", val[0:2], val[2:]
+    )
 
-        path = util.join_path(
-            os.path.dirname(install_dir),
-            ctx.const.debug_dir_suffix,
-            ctx.const.debug_files_suffix,
-            ".build-id",
-            val[0:2],
-            val[2:],
-        )
+    path = util.join_path(
+        os.path.dirname(install_dir),
+        ctx.const.debug_dir_suffix,
+        ctx.const.debug_files_suffix,
+        ".build-id",
+        val[0:2],
+        val[2:],
+    )
 
-        return (path, suffix)
+    return (path, suffix)
 
 
-def strip_debug_action(filepath, fileinfo, install_dir, ag):
+def get_strip_target(filepath, fileinfo, install_dir, ag, timings=None):
+    """Return the (debug output path, BuildID based debug path) of a file
+    to be stripped, or None if the file must not be stripped. The second
+    item is None if the file has no BuildID."""
     excludelist = tuple(ag.get("NoStrip", []))
-    global debug_map
 
     # real path in .pisi package
     path = "/" + util.removepathprefix(install_dir, filepath)
 
     if path.startswith(excludelist):
-        return
+        return None
 
-    outputpath, outclean = get_debug_path(filepath, fileinfo, install_dir)
-    buildID = None
+    outputpath, outclean = get_debug_path(filepath, fileinfo, install_dir, timings)
 
     if outputpath is None:
         # Resort to old debug paths
@@ -203,17 +318,352 @@ def strip_debug_action(filepath, fileinfo, install_dir, ag):
             ctx.const.debug_files_suffix,
             path,
         )
-    else:
-        clean = filepath.split(install_dir)[1]
-        if clean[0] != "/":
-            clean = "/%s" % clean
 
-        debug_map[clean] = outclean
-        buildID = True
-    if util.strip_file(filepath, fileinfo, outputpath):
-        ctx.ui.debug("%s [%s]" % (path, "stripped"))
-        if not buildID:
-            ctx.ui.warning("%s [%s]" % (path, "missing buildID"))
+    return outputpath, outclean
+
+
+class FileCatalogue:
+    """The files of an install directory, shared by the build stages.
+
+    The directory is walked once, and the lstat() result, file type and
+    SHA1 hash of every path are kept, so that each stage of the build
+    does not walk and read the whole tree again. Stages which change
+    files in the tree must refresh() them.
+    """
+
+    def __init__(self, top, jobs):
+        self.top = os.path.normpath(top)
+        self.jobs = jobs
+        self.local = threading.local()
+
+        self.stats = {}
+        # {directory: (subdirectories, files)}, split the way os.walk does
+        self.entries = {}
+        self.types = {}
+        self.hashes = {}
+        self.hashed_all = False
+
+        self.hashed_files = 0
+        self.hashed_bytes = 0
+        self.timings = {}
+
+        with util.timed(self.timings, "walk"):
+            self.__scan()
+
+    def __scan(self):
+        try:
+            self.stats[self.top] = os.lstat(self.top)
+        except OSError:
+            return
+
+        pending = [self.top]
+        while pending:
+            root = pending.pop()
+            dirs, files = [], []
+            try:
+                with os.scandir(root) as it:
+                    for entry in it:
+                        try:
+                            self.stats[entry.path] = entry.stat(follow_symlinks=False)
+                            is_dir = entry.is_dir()
+                        except OSError:
+                            continue
+                        if is_dir:
+                            dirs.append(entry.name)
+                            if not entry.is_symlink():
+                                pending.append(entry.path)
+                        else:
+                            files.append(entry.name)
+            except OSError:
+                continue
+            self.entries[root] = (dirs, files)
+
+    def walk(self, top):
+        """Like os.walk(top), without following symlinks."""
+        pending = [os.path.normpath(top)]
+        while pending:
+            root = pending.pop()
+            if root not in self.entries:
+                continue
+            dirs, files = self.entries[root]
+            yield root, list(dirs), list(files)
+            pending.extend(
+                os.path.join(root, name)
+                for name in reversed(dirs)
+                if not self.islink(os.path.join(root, name))
+            )
+
+    def lstat(self, path):
+        """Return the lstat() result of path, None if it is not known."""
+        if path in self.stats:
+            return self.stats[path]
+        return self.stats.get(os.path.normpath(path))
+
+    def isdir(self, path):
+        path = os.path.normpath(path)
+        if path in self.entries:
+            return True
+        return self.islink(path) and os.path.isdir(path)
+
+    def islink(self, path):
+        st = self.lstat(path)
+        return st is not None and stat.S_ISLNK(st.st_mode)
+
+    def file_type(self, path):
+        """Return the libmagic description of path."""
+        path = os.path.normpath(path)
+        if path not in self.types:
+            # magic.Magic serializes its calls, use one per thread
+            if not hasattr(self.local, "magic"):
+                self.local.magic = magic.Magic()
+            self.types[path] = self.local.magic.from_file(path)
+        return self.types[path]
+
+    def size(self, path):
+        """Return what util.dir_size(path) would."""
+        st = self.lstat(path)
+        if st is None:
+            return util.dir_size(path)
+        if stat.S_ISLNK(st.st_mode):
+            return len(util.read_link(path))
+        if not stat.S_ISDIR(st.st_mode):
+            return st.st_size
+
+        size = 0
+        for root, dirs, files in self.walk(path):
+            for name in files:
+                st = self.stats[os.path.join(root, name)]
+                if not stat.S_ISLNK(st.st_mode):
+                    size += st.st_size
+        return size
+
+    def __hashed(self, path, value):
+        self.hashes[path] = value
+        self.hashed_files += 1
+        self.hashed_bytes += self.stats[path].st_size
+
+    def hash_all(self):
+        """Hash all regular files not hashed yet, on a pool of threads."""
+        if self.hashed_all:
+            return
+
+        paths = [
+            path
+            for path, st in self.stats.items()
+            if stat.S_ISREG(st.st_mode) and path not in self.hashes
+        ]
+        sizes = [self.stats[path].st_size for path in paths]
+
+        with util.timed(self.timings, "hash"):
+            for path, value, error in util.sha1_files(paths, self.jobs, sizes):
+                # Errors are raised again when the hash is asked for
+                if error is None:
+                    self.__hashed(path, value)
+
+        self.hashed_all = True
+
+    def calculate_hash(self, path):
+        """Return what util.calculate_hash(path) would."""
+        st = self.lstat(path)
+        if st is None or not stat.S_ISREG(st.st_mode):
+            return util.calculate_hash(path)
+
+        key = os.path.normpath(path)
+        if key not in self.hashes:
+            with util.timed(self.timings, "hash"):
+                self.__hashed(key, util.sha1_file(path))
+        return (path, self.hashes[key])
+
+    def refresh(self, path):
+        """Update a path created, changed or removed since the scan."""
+        path = os.path.normpath(path)
+        self.types.pop(path, None)
+        self.hashes.pop(path, None)
+        self.hashed_all = False
+
+        try:
+            st = os.lstat(path)
+        except OSError:
+            self.__drop(path)
+            return
+        self.stats[path] = st
+
+        if path == self.top or not path.startswith(self.top + "/"):
+            return
+
+        parent, name = os.path.split(path)
+        if parent not in self.entries:
+            self.refresh(parent)
+        dirs, files = self.entries[parent]
+        if os.path.isdir(path):
+            if name not in dirs:
+                dirs.append(name)
+            if not stat.S_ISLNK(st.st_mode):
+                self.entries.setdefault(path, ([], []))
+        elif name not in files:
+            files.append(name)
+
+    def __drop(self, path):
+        if path not in self.stats:
+            return
+
+        if path in self.entries:
+            prefix = path + "/"
+            for key in [k for k in self.stats if k.startswith(prefix)]:
+                del self.stats[key]
+                self.entries.pop(key, None)
+                self.types.pop(key, None)
+                self.hashes.pop(key, None)
+            del self.entries[path]
+        del self.stats[path]
+
+        parent, name = os.path.split(path)
+        if parent in self.entries:
+            for names in self.entries[parent]:
+                if name in names:
+                    names.remove(name)
+        # Empty parents may have been removed along with it
+        if parent != self.top and not os.path.lexists(parent):
+            self.__drop(parent)
+
+    def report(self):
+        """Print the walk and hash cost in the build summary."""
+        ctx.ui.info(
+            _(
+                "Scanned %(files)d paths under %(dir)s in %(walk).2f seconds, "
+                "hashed %(hashed)d files (%(size).1f MB) in %(hash).2f seconds."
+            )
+            % {
+                "files": len(self.stats),
+                "dir": self.top,
+                "walk": self.timings.get("walk", 0),
+                "hashed": self.hashed_files,
+                "size": self.hashed_bytes / (1024 * 1024),
+                "hash": self.timings.get("hash", 0),
+            }
+        )
+
+
+class FileActions:
+    """Strips and cleans up the files of an install directory.
+
+    File types and BuildIDs are looked up on a pool of threads first.
+    The files are then stripped on the pool too, files sharing a debug
+    output path by the same job one after another, so that objcopy never
+    writes one debug file twice at the same time. Results are merged in
+    the order the files were given, so the outcome does not depend on
+    the number of jobs.
+    """
+
+    def __init__(self, install_dir, ag, jobs, catalogue):
+        self.install_dir = install_dir
+        self.ag = ag
+        self.jobs = jobs
+        self.catalogue = catalogue
+        self.timings = {}
+
+    def __identify(self, filepath):
+        timings = {}
+        try:
+            with util.timed(timings, "magic"):
+                fileinfo = self.catalogue.file_type(filepath)
+            target = get_strip_target(
+                filepath, fileinfo, self.install_dir, self.ag, timings
+            )
+        except Exception:
+            return None, timings
+
+        return (fileinfo, target), timings
+
+    def __strip(self, group):
+        timings = {}
+        results = []
+        for filepath, fileinfo, outputpath in group:
+            try:
+                results.append(
+                    util.strip_file(filepath, fileinfo, outputpath, timings)
+                )
+            except Exception:
+                results.append(None)
+
+        return results, timings
+
+    def __merge_timings(self, timings):
+        for tool, secs in timings.items():
+            self.timings[tool] = self.timings.get(tool, 0) + secs
+
+    def run(self, paths):
+        """Process the files, return the debug_map entries for them."""
+        start = time.time()
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            identified = list(executor.map(self.__identify, paths))
+
+            groups = {}
+            for filepath, (info, timings) in zip(paths, identified):
+                self.__merge_timings(timings)
+                if info is not None and info[1] is not None:
+                    fileinfo, (outputpath, outclean) = info
+                    groups.setdefault(outputpath, []).append(
+                        (filepath, fileinfo, outputpath)
+                    )
+
+            stripped = {}
+            groups = list(groups.values())
+            for group, (results, timings) in zip(
+                groups, executor.map(self.__strip, groups)
+            ):
+                self.__merge_timings(timings)
+                for (filepath, fileinfo, outputpath), result in zip(group, results):
+                    stripped[filepath] = result
+
+        entries = {}
+        for filepath, (info, timings) in zip(paths, identified):
+            if info is None:
+                continue
+
+            fileinfo, target = info
+            if target is not None:
+                outputpath, outclean = target
+                if outclean is not None:
+                    clean = filepath.split(self.install_dir)[1]
+                    if clean[0] != "/":
+                        clean = "/%s" % clean
+                    entries[clean] = outclean
+
+                self.catalogue.refresh(filepath)
+                if stripped[filepath] is None:
+                    # Stripping failed, leave the file alone
+                    continue
+
+                if stripped[filepath]:
+                    path = "/" + util.removepathprefix(self.install_dir, filepath)
+                    ctx.ui.debug("%s [%s]" % (path, "stripped"))
+                    if outclean is None:
+                        ctx.ui.warning("%s [%s]" % (path, "missing buildID"))
+
+            try:
+                if exclude_special_files(filepath, fileinfo, self.ag):
+                    self.catalogue.refresh(filepath)
+            except Exception:
+                pass
+
+        ctx.ui.debug(
+            _(
+                "Processed %(files)d files with %(jobs)d jobs "
+                "in %(secs).2f seconds (%(tools)s)."
+            )
+            % {
+                "files": len(paths),
+                "jobs": self.jobs,
+                "secs": time.time() - start,
+                "tools": ", ".join(
+                    "%s %.2f" % item for item in sorted(self.timings.items())
+                ),
+            }
+        )
+
+        return entries
 
 
 class Builder:
@@ -227,14 +677,14 @@ class Builder:
         self.packagedb = pisi.db.packagedb.PackageDB()
         self.filesdb = pisi.db.filesdb.FilesDB()
 
-        self.v_dyn = re.compile(r"ELF (64|32)\-bit LSB shared object,")
-        self.v_bin = re.compile(r"ELF (64|32)\-bit LSB executable,")
-        self.shared_lib = re.compile(r".*Shared library: \[(.*)\].*")
-        self.r_path = re.compile(r".*Library rpath: \[(.*)\].*")
-        self.r_soname = re.compile(r".*Library soname: \[(.*)\].*")
         # Currently don't differentiate between internal and public
         self.soname_providers = None
 
+        # {directory: FileCatalogue} of the trees packages are built from
+        self.catalogues = {}
+        # PathMatcher of the <Path> entries of all packages
+        self.path_matcher = None
+
         # process args
         if not isinstance(specuri, pisi.uri.URI):
             specuri = pisi.uri.URI(specuri)
@@ -604,40 +1054,23 @@ class Builder:
         # return the files those are not collected from the install dir
 
         install_dir = self.pkg_install_dir()
+        len_install_dir = len(install_dir)
         abandoned_files = []
-        all_paths_in_packages = []
 
-        for package in self.spec.packages:
-            for path in package.files:
-                path = util.join_path(install_dir, path.path)
-                all_paths_in_packages.append(path)
-
-        def is_included(path1, path2):
-            "Return True if path2 includes path1"
-            return (
-                path1 == path2
-                or fnmatch.fnmatch(path1, path2)
-                or fnmatch.fnmatch(path1, util.join_path(path2, "*"))
-            )
+        def is_included(path):
+            "Return True if a package includes path"
+            return self.path_matcher.match(path[len_install_dir:]) is not None
 
-        for root, dirs, files in os.walk(install_dir):
+        for root, dirs, files in self.file_catalogue(install_dir).walk(install_dir):
             if not dirs and not files:
-                for _path in all_paths_in_packages:
-                    if is_included(root, _path):
-                        break
-                else:
+                if not is_included(root):
                     abandoned_files.append(root)
 
             for file_ in files:
                 fpath = util.join_path(root, file_)
-                for _path in all_paths_in_packages:
-                    if is_included(fpath, _path):
-                        break
-
-                else:
+                if not is_included(fpath):
                     abandoned_files.append(fpath)
 
-        len_install_dir = len(install_dir)
         return [x[len_install_dir:] for x in abandoned_files]
 
     def copy_additional_source_files(self):
@@ -951,7 +1384,8 @@ class Builder:
 
     def generate_static_package_object(self):
         ar_files = []
-        for root, dirs, files in os.walk(self.pkg_install_dir()):
+        install_dir = self.pkg_install_dir()
+        for root, dirs, files in self.file_catalogue(install_dir).walk(install_dir):
             for f in files:
                 if f.endswith(ctx.const.ar_file_suffix) and util.is_ar_file(
                     util.join_path(root, f)
@@ -1020,13 +1454,14 @@ class Builder:
             term = term[1:]
         return self.filesdb.search_file(term)
 
-    def get_binary_deps(self, fullpath, magic_token):
+    def get_binary_deps(self, fullpath):
         """Obtain and resolve binary dependencies for a given path"""
         bin_deps = set()
-        if not os.path.exists(fullpath):
+        elf = pisi.elf.get(fullpath)
+        if elf is None:
             return bin_deps
 
-        emul32 = magic_token.startswith("ELF 32")
+        emul32 = elf.elfclass == 32
         so_deps = self.accumulate_dependencies(fullpath, emul32)
 
         for dep in so_deps:
@@ -1077,7 +1512,6 @@ class Builder:
 
         # Detect any installed pkg-config files
         pkgconfigExec = pisi.util.search_executable("pkg-config")
-        import magic
 
         # Refresh db's here otherwise we might have out of date information
         # on new installed build dependencies
@@ -1152,20 +1586,12 @@ class Builder:
                 # searching providers that way.. ala RPM.
                 installdir = self.pkg_install_dir()
                 fullpath = util.join_path(installdir, path)
-                if not os.path.exists(fullpath):
-                    # Dodgy symlinks
+                st = self.file_catalogue(installdir).lstat(fullpath)
+                if st is None:
                     continue
-                filemagic = None
-                try:
-                    filemagic = magic.from_file(fullpath)
-                except:
-                    pass
-
-                if filemagic is not None and self.is_dynamic_binary(
-                    fullpath, filemagic
-                ):
+                if self.is_dynamic_binary(fullpath, st):
                     ctx.ui.debug("Checking %s for binary dependencies" % fullpath)
-                    bindeps = self.get_binary_deps(fullpath, filemagic)
+                    bindeps = self.get_binary_deps(fullpath)
                     for dep in bindeps:
                         found = False
                         for depen in metadata.package.packageDependencies:
@@ -1327,16 +1753,21 @@ class Builder:
 
         # we'll exclude collisions in get_file_hashes. Having a
         # collisions list is not wrong, we must just handle it :).
-        collisions = check_path_collision(package, self.spec.packages)
+        collisions = check_path_collision(package, self.path_matcher)
         # FIXME: material collisions after expanding globs could be
         # reported as errors
 
         # Use a dict to avoid duplicate entries in files.xml.
         d = {}
 
+        catalogue = self.file_catalogue(install_dir)
+        catalogue.hash_all()
+
         def add_path(path):
             # add the files under material path
-            for fpath, fhash in util.get_file_hashes(path, collisions, install_dir):
+            for fpath, fhash in util.get_file_hashes(
+                path, collisions, install_dir, catalogue
+            ):
                 if (
                     ctx.get_option("create_static")
                     and fpath.endswith(ctx.const.ar_file_suffix)
@@ -1347,12 +1778,9 @@ class Builder:
                     # don't include this file into the package.
                     continue
                 frpath = util.removepathprefix(install_dir, fpath)  # relative path
-                ftype, permanent = get_file_type(frpath, package.files)
-                fsize = int(util.dir_size(fpath))
-                if not os.path.islink(fpath):
-                    st = os.stat(fpath)
-                else:
-                    st = os.lstat(fpath)
+                ftype, permanent = get_file_type(frpath, package, self.path_matcher)
+                fsize = int(catalogue.size(fpath))
+                st = catalogue.lstat(fpath) or os.lstat(fpath)
 
                 d[frpath] = pisi.files.FileInfo(
                     path=frpath,
@@ -1382,65 +1810,61 @@ class Builder:
         self.files = files
 
     def file_actions(self):
+        global debug_map
+
         install_dir = self.pkg_install_dir()
 
-        for root, dirs, files in os.walk(install_dir):
-            for fn in files:
-                filepath = util.join_path(root, fn)
-                try:
-                    fileinfo = magic.from_file(filepath)
-                    strip_debug_action(
-                        filepath, fileinfo, install_dir, self.actionGlobals
-                    )
-                    exclude_special_files(filepath, fileinfo, self.actionGlobals)
-                except Exception:
-                    pass
+        # Scan the trees again, in case this is not the first run
+        self.catalogues = {}
+        catalogue = self.file_catalogue(install_dir)
 
-    def get_soname(self, path):
-        """Get the soname for a given path"""
-        code, out, err = pisi.util.run_batch(
-            "LC_ALL=C /usr/bin/readelf -d {}".format(path)
+        paths = []
+        for root, dirs, files in catalogue.walk(install_dir):
+            paths.extend(util.join_path(root, fn) for fn in files)
+
+        actions = FileActions(
+            install_dir, self.actionGlobals, catalogue.jobs, catalogue
         )
+        debug_map.update(actions.run(paths))
+
+    def file_catalogue(self, top):
+        """Return the FileCatalogue of a directory, scanning it if needed."""
+        if top not in self.catalogues:
+            jobs = util.parse_jobs(ctx.config.values.build.jobs)
+            self.catalogues[top] = FileCatalogue(top, jobs or os.cpu_count() or 1)
+        return self.catalogues[top]
 
-        if code != 0:
+    def get_soname(self, path):
+        """Get the soname for a given path"""
+        elf = pisi.elf.get(path)
+        if elf is None:
             return None
-        for line in out.split(b"\n"):
-            line = line.strip()
-            g = self.r_soname.match(str(line))
-            if g:
-                return g.group(1)
-        return None
+        return elf.soname
 
-    def is_dynamic_library(self, path):
+    def is_dynamic_library(self, path, st=None):
         """Similar to is_dynamic_binary, but only for libraries"""
-        if not os.path.exists(path) or not os.path.isfile(path):
-            return False
-        try:
-            mg = magic.from_file(path)
-        except Exception as e:
-            return False
-        if self.v_dyn.match(mg):
-            return True
-        return False
+        elf = pisi.elf.get(path, st)
+        return elf is not None and elf.little_endian and elf.is_shared_object()
 
-    def is_dynamic_binary(self, path, mg):
-        """Determine if the given path is a dynamic binary file"""
-        if not os.path.exists(path) or not os.path.isfile(path):
+    def is_dynamic_binary(self, path, st=None):
+        """Determine if the given path is a dynamic binary file
+
+        Shared objects and executables, including PIE executables, which
+        the libmagic based check used before skipped."""
+        elf = pisi.elf.get(path, st)
+        if elf is None or not elf.little_endian:
             return False
-        if self.v_dyn.match(mg):
-            return True
-        if self.v_bin.match(mg):
-            return True
-        return False
+        return elf.is_shared_object() or elf.is_executable()
 
     def accumulate_providers(self, directory):
         """Accumulate all providers from the package root"""
         self.soname_providers = set()
 
-        for root, dirs, files in os.walk(directory):
+        catalogue = self.file_catalogue(directory)
+        for root, dirs, files in catalogue.walk(directory):
             for f in files:
                 p = os.path.join(root, f)
-                if not self.is_dynamic_library(p):
+                if not self.is_dynamic_library(p, catalogue.lstat(p)):
                     continue
                 s = self.get_soname(p)
                 if s is not None:
@@ -1448,15 +1872,12 @@ class Builder:
 
     def accumulate_dependencies(self, path, emul32=False):
         """Accumulate all shared dependencies of a given path"""
-        code, out, err = pisi.util.run_batch(
-            "LC_ALL=C /usr/bin/readelf -d {}".format(path)
-        )
-
-        if code != 0:
+        elf = pisi.elf.get(path)
+        if elf is None:
             return []
 
         check_deps = set()
-        r_paths = set()
+        r_paths = set(elf.rpath)
         valid_libs = set()
 
         if emul32:
@@ -1465,19 +1886,11 @@ class Builder:
             # Currently on Solus this is the same thing as /usr/lib.
             valid_libs.update(["/usr/lib64", "/lib64"])
 
-        for line in out.decode().split("\n"):
-            line = line.strip()
-            g = self.shared_lib.match(line)
-            if g:
-                lib = g.group(1)
-                # Skip internally provided symbols
-                if lib in self.soname_providers:
-                    continue
-                check_deps.add(lib)
+        for lib in elf.needed:
+            # Skip internally provided symbols
+            if lib in self.soname_providers:
                 continue
-            r = self.r_path.match(line)
-            if r:
-                r_paths.add(r.group(1))
+            check_deps.add(lib)
 
         dirname = os.path.dirname(path)
 
@@ -1566,8 +1979,13 @@ class Builder:
                         ctx.ui.warning(
                             _("No group named '%s' found on the system") % afile.group
                         )
+                self.file_catalogue(install_dir).refresh(dest)
         os.chdir(c)
 
+        # All packages are known now, compile their paths for the lookups
+        # below
+        self.path_matcher = PathMatcher(self.spec.packages)
+
         # Show the files those are not collected from the install dir
         abandoned_files = self.get_abandoned_files()
         if abandoned_files:
@@ -1587,6 +2005,7 @@ class Builder:
         self._bindeps_cache = dict()
 
         # Grab all the providers now
+        pisi.elf.clear_cache()
         self.accumulate_providers(self.pkg_install_dir())
 
         for package in self.spec.packages:
@@ -1683,6 +2102,9 @@ class Builder:
 
             pkg.close()
 
+        for catalogue in self.catalogues.values():
+            catalogue.report()
+
         self.set_state("buildpackages")
 
         if ctx.config.values.general.autoclean is True:
@@ -79,6 +79,7 @@ def ignorance_is_bliss(f):
 def check_files(files, check_config=False):
     results = deepcopy(_empty_results)
 
+    checked = []
     for f in files:
         if not check_config and f.type == "config":
             continue
@@ -86,12 +87,26 @@ def check_files(files, check_config=False):
             continue
         if ignorance_is_bliss(f.path):
             continue
+        checked.append((f, os.path.join(ctx.config.dest_dir(), f.path)))
 
+    # Hash the files on a pool of threads up front, symlinks are checked
+    # by their target below
+    hashes = {}
+    regular = [path for f, path in checked if not os.path.islink(path)]
+    for path, value, error in pisi.util.sha1_files(regular):
+        hashes[path] = (value, error)
+
+    for f, path in checked:
         is_file_corrupted = False
 
-        path = os.path.join(ctx.config.dest_dir(), f.path)
         try:
-            is_file_corrupted = file_corrupted(f)
+            if path in hashes:
+                value, error = hashes[path]
+                if error is not None:
+                    raise error
+                is_file_corrupted = value != f.hash
+            else:
+                is_file_corrupted = file_corrupted(f)
 
         except pisi.util.FilePermissionDeniedError as e:
             # Can't read file, probably because of permissions, skip
@@ -143,9 +143,46 @@ def get_download_info(order):
     return [packagedb.get_resource(name) for name in order]
 
 
+def pipelined_install():
+    """Check if packages should be installed while the rest are downloading."""
+    if ctx.get_option("fetch_only"):
+        return False
+    return bool(
+        ctx.get_option("pipeline") or ctx.config.values.general.pipelined_install
+    )
+
+
+def fetch_install_ops(resources, **kwargs):
+    """
+    Yields an atomicoperations.Install for each of the resources as soon
+    as its package has been downloaded and verified, and the packages it
+    depends on have been yielded. The other packages keep downloading in
+    the background meanwhile.
+
+    The resources are in installation order. A package may be yielded
+    before others listed ahead of it, but never before its runtime
+    dependencies among them.
+    """
+    import pisi.atomicoperations as atomicoperations
+    from pisi.fetcher import Fetcher
+
+    packagedb = pisi.db.packagedb.PackageDB()
+    depends = {}
+    for r in resources:
+        depends[r.name] = set(
+            dep.package for dep in packagedb.get_package(r.name).runtimeDependencies()
+        )
+
+    for r in Fetcher().fetch_iter(resources, depends):
+        yield atomicoperations.Install(r.pkg_path, **kwargs)
+
+
 def fetch_packages(order):
     """
     Fetches all packages in order concurrently if they are not already cached.
+
+    Downloads are verified while they are written, so all the packages
+    match their repository hash once this returns.
     """
     resources = get_download_info(order)
     items_to_fetch = []
@@ -159,6 +196,11 @@ def fetch_packages(order):
 
         if r.uri.is_remote_file():
             items_to_fetch.append(r)
+        else:
+            raise Error(
+                _("Download Error: Package %s does not match the repository package.")
+                % r.name
+            )
 
     ctx.ui.info(
         util.colorize(
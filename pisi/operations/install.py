@@ -12,8 +12,11 @@ import pisi
 import pisi.atomicoperations as atomicoperations
 import pisi.context as ctx
 import pisi.db
+import pisi.db.filesdb
+import pisi.durability
 import pisi.operations as operations
 import pisi.pgraph as pgraph
+import pisi.resolver
 import pisi.signalhandler as signalhandler
 import pisi.ui as ui
 import pisi.util as util
@@ -128,24 +131,21 @@ def install_pkg_names(packages, reinstall=False):
     # Resolve resources
     resources = operations.helper.get_download_info(order)
 
-    # Fetch packages concurrently
-    operations.helper.fetch_packages(order)
+    # Packages are either all fetched up front, or installed one by one
+    # as soon as they are downloaded when pipelining
+    pipelined = operations.helper.pipelined_install()
+    if not pipelined:
+        # Fetch packages concurrently
+        operations.helper.fetch_packages(order)
 
-    # Verify hashes and instantiate Install objects
-    install_ops = []
-    for r in resources:
-        if util.sha1_file(r.pkg_path) != r.expected_hash:
-            raise Error(
-                _("Download Error: Package %s does not match the repository package.")
-                % r.name
-            )
-        install_ops.append(atomicoperations.Install(r.pkg_path))
+        # Fetched packages are verified, instantiate Install objects
+        install_ops = [atomicoperations.Install(r.pkg_path) for r in resources]
 
-    ctx.ui.status(_("Finished downloading packages."))
+        ctx.ui.status(_("Finished downloading packages."))
 
-    # Don't actually install if --fetch-only was set
-    if ctx.get_option("fetch_only"):
-        return True
+        # Don't actually install if --fetch-only was set
+        if ctx.get_option("fetch_only"):
+            return True
 
     # Remove conflicting packages
     if not ctx.get_option("ignore_package_conflicts"):
@@ -160,20 +160,31 @@ def install_pkg_names(packages, reinstall=False):
 
     automatic = operations.helper.extract_automatic(packages, order)
 
+    if pipelined:
+        install_ops = operations.helper.fetch_install_ops(resources)
+
+    # Commit the files database and sync the written files once for the
+    # whole operation
+    filesdb = pisi.db.filesdb.FilesDB()
+
     try:
-        for i, install_op in enumerate(install_ops):
-            ctx.ui.info(
-                util.colorize(
-                    _("Installing %d / %d") % (i + 1, len(install_ops)),
-                    "yellow",
+        with filesdb.transaction(), pisi.durability.transaction(order):
+            for i, install_op in enumerate(install_ops):
+                ctx.ui.info(
+                    util.colorize(
+                        _("Installing %d / %d") % (i + 1, len(resources)),
+                        "yellow",
+                    )
                 )
-            )
-            if install_op.pkginfo.name in automatic:
-                install_op.automatic = True
-            install_op.install(False)
+                if install_op.pkginfo.name in automatic:
+                    install_op.automatic = True
+                install_op.install(False)
     except Exception as e:
         raise e
     finally:
+        if pipelined:
+            # Stop the downloads if the installation was aborted
+            install_ops.close()
         ctx.exec_usysconf()
 
     return True
@@ -381,9 +392,10 @@ def plan_install_pkg_names(A):
     # Check if updates are available to opt into the slow path
     available_updates = []
     if not ctx.get_option("ignore_revdeps_of_deps_check"):
-        available_updates = pisi.api.list_upgradable()
+        available_updates = frozenset(pisi.api.list_upgradable())
 
-    G_f = pgraph.PGraph(packagedb)  # construct G_f
+    resolver = pisi.resolver.Resolver(packagedb)
+    G_f = pgraph.PGraph(resolver)  # construct G_f
 
     # find the "install closure" graph of G_f by package
     # set A using packagedb
@@ -391,38 +403,41 @@ def plan_install_pkg_names(A):
         G_f.add_package(x)
     B = A
 
-    while len(B) > 0:
-        Bp = set()
-        checked = list()
-        for x in B:
-            pkg = packagedb.get_package(x)
-            for dep in pkg.runtimeDependencies():
-                ctx.ui.debug("checking %s" % str(dep))
-                # we don't deal with already *satisfied* dependencies
-                if not dep.satisfied_by_installed():
-                    if not dep.satisfied_by_repo():
-                        raise Error(
-                            _("%s dependency of package %s is not satisfied")
-                            % (dep, pkg.name)
-                        )
-                    if not dep.package in G_f.vertices():
-                        Bp.add(str(dep.package))
-                    G_f.add_dep(x, dep)
-                # Check for updates in the revdeps of the deps of the pkg(s) we're installing to avoid breakage.
-                if dep.package in available_updates and not dep.package in checked:
-                    for name, revdep in packagedb.get_rev_deps(dep.package):
-                        if (
-                            installdb.has_package(name)
-                            and not revdep.satisfied_by_installed()
-                        ):
-                            checked.append(dep.package)
-                            if not name in G_f.vertices():
-                                Bp.add(name)
-                            G_f.add_dep(name, revdep)
-        B = Bp
+    with resolver.timed("closure"):
+        while len(B) > 0:
+            Bp = set()
+            checked = list()
+            for x in B:
+                pkg = resolver.get_package(x)
+                for dep in pkg.runtimeDependencies():
+                    ctx.ui.debug("checking %s" % str(dep))
+                    # we don't deal with already *satisfied* dependencies
+                    if not resolver.satisfied_by_installed(dep):
+                        if not resolver.satisfied_by_repo(dep):
+                            raise Error(
+                                _("%s dependency of package %s is not satisfied")
+                                % (dep, pkg.name)
+                            )
+                        if not dep.package in G_f.vertices():
+                            Bp.add(str(dep.package))
+                        G_f.add_dep(x, dep)
+                    # Check for updates in the revdeps of the deps of the pkg(s) we're installing to avoid breakage.
+                    if dep.package in available_updates and not dep.package in checked:
+                        for name, revdep in packagedb.get_rev_deps(dep.package):
+                            if (
+                                installdb.has_package(name)
+                                and not resolver.satisfied_by_installed(revdep)
+                            ):
+                                checked.append(dep.package)
+                                if not name in G_f.vertices():
+                                    Bp.add(name)
+                                G_f.add_dep(name, revdep)
+            B = Bp
     if ctx.config.get_option("debug"):
         G_f.write_graphviz(sys.stdout)
-    order = G_f.topological_sort()
+    with resolver.timed("sort"):
+        order = G_f.topological_sort()
+    resolver.report(_("Installation"))
     if len(order) > 1 and ctx.config.get_option("debug"):
         ctx.ui.info(_("topological_sort() order: %s" % order))
     order = plan_deterministic_install_order(order)
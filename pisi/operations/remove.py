@@ -11,10 +11,13 @@ import pisi
 import pisi.context as ctx
 import pisi.atomicoperations as atomicoperations
 import pisi.pgraph as pgraph
+import pisi.resolver
 import pisi.signalhandler as signalhandler
 import pisi.util as util
 import pisi.ui as ui
 import pisi.db
+import pisi.db.filesdb
+import pisi.durability
 
 
 def remove(
@@ -126,12 +129,19 @@ in the respective order to satisfy dependencies:
     ctx.ui.info(_("Disabling keyboard interrupts for file operations."))
     signal_handler.disable_signal(signal.SIGINT)
 
+    # Commit the files database and sync the written files once for the
+    # whole operation
+    filesdb = pisi.db.filesdb.FilesDB()
+
     try:
-        for package in order:
-            if installdb.has_package(package):
-                atomicoperations.remove_single(package)
-            else:
-                ctx.ui.info(_("Package %s is not installed. Cannot remove.") % package)
+        with filesdb.transaction(), pisi.durability.transaction(order):
+            for package in order:
+                if installdb.has_package(package):
+                    atomicoperations.remove_single(package)
+                else:
+                    ctx.ui.info(
+                        _("Package %s is not installed. Cannot remove.") % package
+                    )
     except Exception as e:
         raise e
     finally:
@@ -155,33 +165,37 @@ def plan_remove(A):
 
     installdb = pisi.db.installdb.InstallDB()
 
-    G_f = pgraph.PGraph(installdb)  # construct G_f
+    resolver = pisi.resolver.Resolver(installdb)
+    G_f = pgraph.PGraph(resolver)  # construct G_f
 
     # find the (install closure) graph of G_f by package
     # set A using packagedb
     for x in A:
         G_f.add_package(x)
     B = A
-    while len(B) > 0:
-        Bp = set()
-        for x in B:
-            rev_deps = installdb.get_rev_deps(x)
-            for rev_dep, depinfo in rev_deps:
-                # we don't deal with uninstalled rev deps
-                # and unsatisfied dependencies (this is important, too)
-                # satisfied_by_any_installed_other_than is for AnyDependency
-                if (
-                    installdb.has_package(rev_dep)
-                    and depinfo.satisfied_by_installed()
-                    and not depinfo.satisfied_by_any_installed_other_than(x)
-                ):
-                    if not rev_dep in G_f.vertices():
-                        Bp.add(rev_dep)
-                        G_f.add_plain_dep(rev_dep, x)
-        B = Bp
+    with resolver.timed("closure"):
+        while len(B) > 0:
+            Bp = set()
+            for x in B:
+                rev_deps = installdb.get_rev_deps(x)
+                for rev_dep, depinfo in rev_deps:
+                    # we don't deal with uninstalled rev deps
+                    # and unsatisfied dependencies (this is important, too)
+                    # satisfied_by_any_installed_other_than is for AnyDependency
+                    if (
+                        installdb.has_package(rev_dep)
+                        and resolver.satisfied_by_installed(depinfo)
+                        and not depinfo.satisfied_by_any_installed_other_than(x)
+                    ):
+                        if not rev_dep in G_f.vertices():
+                            Bp.add(rev_dep)
+                            G_f.add_plain_dep(rev_dep, x)
+            B = Bp
     if ctx.config.get_option("debug"):
         G_f.write_graphviz(sys.stdout)
-    order = G_f.topological_sort()
+    with resolver.timed("sort"):
+        order = G_f.topological_sort()
+    resolver.report(_("Removal"))
     return G_f, order
 
 
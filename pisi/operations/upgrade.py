@@ -11,8 +11,11 @@ import pisi.atomicoperations as atomicoperations
 import pisi.blacklist
 import pisi.context as ctx
 import pisi.db
+import pisi.db.filesdb
+import pisi.durability
 import pisi.operations as operations
 import pisi.pgraph as pgraph
+import pisi.resolver
 import pisi.signalhandler as signalhandler
 import pisi.ui as ui
 import pisi.util as util
@@ -207,26 +210,24 @@ def upgrade(packages=[], repo=None):
     # Resolve resources
     resources = operations.helper.get_download_info(order)
 
-    # Fetch packages concurrently
-    operations.helper.fetch_packages(order)
+    # Packages are either all fetched up front, or installed one by one
+    # as soon as they are downloaded when pipelining
+    pipelined = operations.helper.pipelined_install()
+    if not pipelined:
+        # Fetch packages concurrently
+        operations.helper.fetch_packages(order)
 
-    # Verify hashes and instantiate Install objects
-    install_ops = []
-    for r in resources:
-        if util.sha1_file(r.pkg_path) != r.expected_hash:
-            raise Error(
-                _("Download Error: Package %s does not match the repository package.")
-                % r.name
-            )
-        install_ops.append(
+        # Fetched packages are verified, instantiate Install objects
+        install_ops = [
             atomicoperations.Install(r.pkg_path, ignore_file_conflicts=True)
-        )
+            for r in resources
+        ]
 
-    ctx.ui.status(_("Finished downloading package upgrades."))
+        ctx.ui.status(_("Finished downloading package upgrades."))
 
-    # Don't actually install if --fetch-only was set
-    if ctx.get_option("fetch_only"):
-        return True
+        # Don't actually install if --fetch-only was set
+        if ctx.get_option("fetch_only"):
+            return True
 
     # Detect package conflicts
     conflicts = []
@@ -245,20 +246,33 @@ def upgrade(packages=[], repo=None):
 
     automatic = operations.helper.extract_automatic(packages, order)
 
+    if pipelined:
+        install_ops = operations.helper.fetch_install_ops(
+            resources, ignore_file_conflicts=True
+        )
+
+    # Commit the files database and sync the written files once for the
+    # whole operation
+    filesdb = pisi.db.filesdb.FilesDB()
+
     try:
-        for i, install_op in enumerate(install_ops):
-            ctx.ui.info(
-                util.colorize(
-                    _("Installing %d / %d") % (i + 1, len(install_ops)),
-                    "yellow",
+        with filesdb.transaction(), pisi.durability.transaction(order):
+            for i, install_op in enumerate(install_ops):
+                ctx.ui.info(
+                    util.colorize(
+                        _("Installing %d / %d") % (i + 1, len(resources)),
+                        "yellow",
+                    )
                 )
-            )
-            if install_op.pkginfo.name in automatic:
-                install_op.automatic = True
-            install_op.install(True)
+                if install_op.pkginfo.name in automatic:
+                    install_op.automatic = True
+                install_op.install(True)
     except Exception as e:
         raise e
     finally:
+        if pipelined:
+            # Stop the downloads if the installation was aborted
+            install_ops.close()
         ctx.exec_usysconf()
 
     # Prior to 2c63650, this function had no return statement at all on the "complete" codepath.
@@ -275,7 +289,8 @@ def plan_upgrade(A, force_replaced=True, replaces=None):
 
     packagedb = pisi.db.packagedb.PackageDB()
 
-    G_f = pgraph.PGraph(packagedb)  # construct G_f
+    resolver = pisi.resolver.Resolver(packagedb)
+    G_f = pgraph.PGraph(resolver)  # construct G_f
 
     A = set(A)
 
@@ -299,10 +314,11 @@ def plan_upgrade(A, force_replaced=True, replaces=None):
     def add_runtime_deps(pkg, Bp):
         for dep in pkg.runtimeDependencies():
             # add packages that can be upgraded
-            if installdb.has_package(dep.package) and dep.satisfied_by_installed():
-                continue
+            if installdb.has_package(dep.package):
+                if resolver.satisfied_by_installed(dep):
+                    continue
 
-            if dep.satisfied_by_repo():
+            if resolver.satisfied_by_repo(dep):
                 if not dep.package in G_f.vertices():
                     Bp.add(str(dep.package))
 
@@ -338,7 +354,7 @@ def plan_upgrade(A, force_replaced=True, replaces=None):
                 # Installed package will be removed.
                 continue
 
-            new_pkg = packagedb.get_package(conflict.package)
+            new_pkg = resolver.get_package(conflict.package)
             if conflict.satisfies_relation(new_pkg.version, new_pkg.release):
                 # Package still conflicts with the repo package.
                 # Installed package will be removed.
@@ -355,7 +371,7 @@ def plan_upgrade(A, force_replaced=True, replaces=None):
         rev_deps = installdb.get_rev_deps(pkg.name)
         for rev_dep, depinfo in rev_deps:
             # add only installed but unsatisfied reverse dependencies
-            if rev_dep in G_f.vertices() or depinfo.satisfied_by_repo():
+            if rev_dep in G_f.vertices() or resolver.satisfied_by_repo(depinfo):
                 continue
 
             if is_upgradable(rev_dep, installdb, packagedb):
@@ -380,25 +396,28 @@ def plan_upgrade(A, force_replaced=True, replaces=None):
                     Bp.add(name)
                     G_f.add_plain_dep(name, target_package)
 
-    while A:
-        Bp = set()
+    with resolver.timed("closure"):
+        while A:
+            Bp = set()
 
-        for x in A:
-            pkg = packagedb.get_package(x)
+            for x in A:
+                pkg = resolver.get_package(x)
 
-            add_runtime_deps(pkg, Bp)
-            add_resolvable_conflicts(pkg, Bp)
+                add_runtime_deps(pkg, Bp)
+                add_resolvable_conflicts(pkg, Bp)
 
-            if installdb.has_package(x):
-                add_broken_revdeps(pkg, Bp)
-                add_needed_revdeps(pkg, Bp)
+                if installdb.has_package(x):
+                    add_broken_revdeps(pkg, Bp)
+                    add_needed_revdeps(pkg, Bp)
 
-        A = Bp
+            A = Bp
 
     if ctx.config.get_option("debug"):
         G_f.write_graphviz(sys.stdout)
 
-    order = G_f.topological_sort()
+    with resolver.timed("sort"):
+        order = G_f.topological_sort()
+    resolver.report(_("Upgrade"))
     order = operations.install.plan_deterministic_install_order(order)
     order.reverse()
     return G_f, order
@@ -484,6 +503,20 @@ def upgrade_base(A=set()):
     return set()
 
 
+def is_newer(available, installed):
+    """Compare (version, release, distribution, distribution release)
+    tuples of an available and an installed package."""
+    version, release, distro, distro_release = available
+    i_version, i_release, i_distro, i_distro_release = installed
+
+    if distro == i_distro and pisi.version.make_version(
+        distro_release
+    ) > pisi.version.make_version(i_distro_release):
+        return True
+
+    return int(i_release) < int(release)
+
+
 def is_upgradable(
     name: str,
     installdb: pisi.db.installdb.InstallDB,
@@ -515,9 +548,24 @@ def is_upgradable(
     except Exception:
         return False
 
-    if distro == i_distro and pisi.version.make_version(
-        distro_release
-    ) > pisi.version.make_version(i_distro_release):
-        return True
+    return is_newer(
+        (version, release, distro, distro_release),
+        (i_version, i_release, i_distro, i_distro_release),
+    )
 
-    return int(i_release) < int(release)
+
+def list_upgradable(
+    installdb: pisi.db.installdb.InstallDB,
+    packagedb: pisi.db.packagedb.PackageDB,
+):
+    """Return the installed packages with a newer build in the repositories.
+
+    Works on the version tables of both databases instead of looking up
+    the packages one by one.
+    """
+    available = packagedb.get_version_table()
+    return [
+        name
+        for name, installed in installdb.get_version_table().items()
+        if name in available and is_newer(available[name], installed)
+    ]
@@ -8,6 +8,7 @@ import os.path
 import pisi
 import pisi.archive as archive
 import pisi.context as ctx
+import pisi.durability
 import pisi.files
 import pisi.metadata
 import pisi.uri
@@ -185,8 +186,7 @@ class Package:
 
         with open(fpath, "wb") as f:
             f.write(data)
-            f.flush()
-            os.fsync(f.fileno())
+            pisi.durability.fsync(f)
 
     def extract_dir(self, dir, outdir):
         """Extract directory recursively, this function
@@ -227,9 +227,9 @@ class Package:
 
     def _files(self):
         if self.files is None:
-            return []
+            return set()
 
-        return [f.path for f in self.files.list]
+        return set(f.path for f in self.files.list)
 
     def extract_dir_flat(self, dir, outdir):
         """Extract directory recursively, this function
@@ -10,24 +10,75 @@ import pisi.util
 from pisi.files import FileInfo
 
 
+# Top level directories which are symlinks into /usr on usr merged systems
+USR_MERGED_DIRS = ['bin', 'sbin', 'lib', 'lib32', 'lib64']
+
+# Symlink probes per destination directory, {dest_dir: {path: is a link}}
+_links = {}
+
+
+def _layout():
+    dest_dir = ctx.config.dest_dir()
+    links = _links.get(dest_dir)
+    if links is None:
+        links = _links[dest_dir] = dict(
+            (d, os.path.islink(pisi.util.join_path(dest_dir, d)))
+            for d in USR_MERGED_DIRS
+        )
+
+    return links
+
+
 def _islink(path):
-    return os.path.islink(pisi.util.join_path(ctx.config.dest_dir(), path))
+    links = _layout()
+    if path not in links:
+        links[path] = os.path.islink(pisi.util.join_path(ctx.config.dest_dir(), path))
+
+    return links[path]
+
+
+def invalidate_links(path=None):
+    """
+    Forget the cached symlink probes of the destination directory.
+
+    :param path: Path that was changed, relative to the destination directory.
+                 Only the probes of this path and the paths below it are
+                 forgotten. If None, the whole cache is dropped.
+    """
+    links = _links.get(ctx.config.dest_dir())
+    if not links:
+        return
+
+    if path is None:
+        del _links[ctx.config.dest_dir()]
+        return
+
+    path = os.path.normpath(path).strip('/')
+    if path not in links:
+        # Paths are probed from the top, so nothing below can be cached
+        return
+
+    prefix = path + '/'
+    for key in [key for key in links if key == path or key.startswith(prefix)]:
+        del links[key]
 
 
 def is_usr_merged(path):
     """
     Check if the given path is usr merged by symlink.
 
+    Symlink probes are cached per destination directory, see invalidate_links().
+
     :param path: Path to check. Must be relative to the destination directory.
     :return: Boolean indicating if the file has been usr merged.
     """
     components = normpath(path).split('/')
 
-    if components[0] not in ['bin', 'sbin', 'lib', 'lib32', 'lib64']:
+    if components[0] not in USR_MERGED_DIRS:
         return False
 
-    for i, _ in enumerate(components[:-1]):
-        if _islink(os.path.join(*components[0:i + 1])):
+    for i in range(1, len(components)):
+        if _islink('/'.join(components[0:i])):
             return True
 
     return False
@@ -38,17 +89,19 @@ def is_usr_merged_duplicate(files, path):
     Check if the given path is usr merged *and* a duplicate of an existing file.
     All paths must be relative to the destination directory.
 
-    :param files: List of files to search in.
+    :param files: Set of paths to search in. A list of paths or of FileInfo
+                  objects is accepted too, but has to be converted on every call.
     :param path: Path to check.
     :return: Boolean indicating if the file is usr merged and a duplicate.
     """
-    if not is_usr_merged(path):
-        return False
+    if not isinstance(files, (set, frozenset, dict)):
+        files = set(f.path if isinstance(f, FileInfo) else f for f in files)
 
-    if len(files) > 0 and isinstance(files[0], FileInfo):
-        files = [f.path for f in files]
+    # The set lookup is much cheaper than the symlink probes, so do it first
+    if usr_merged_path(path) not in files:
+        return False
 
-    return usr_merged_path(path) in files
+    return is_usr_merged(path)
 
 
 def usr_merged_path(path):
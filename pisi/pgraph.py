@@ -3,40 +3,40 @@
 
 """eopkg package relation graph that represents the state of packagedb"""
 
-from . import graph
+from . import graph, resolver
 
 # Cache the results from packagedb queries in a graph
 
 
 class PGraph(graph.Digraph):
     def __init__(self, packagedb):
+        """packagedb is a PackageDB, an InstallDB or the pisi.resolver.Resolver
+        of the current operation."""
         super(PGraph, self).__init__()
-        self.packagedb = packagedb
+        if not isinstance(packagedb, resolver.Resolver):
+            packagedb = resolver.Resolver(packagedb)
+        self.resolver = packagedb
+        self.packagedb = packagedb.db
 
     def add_package(self, pkg):
-        pkg1 = self.packagedb.get_package(pkg)
-        self.add_vertex(str(pkg), (pkg1.version, pkg1.release))
+        self.add_vertex(str(pkg), self.resolver.version(pkg))
 
     def add_plain_dep(self, pkg1name, pkg2name):
         pkg1data = None
         if not pkg1name in self.vertices():
-            pkg1 = self.packagedb.get_package(pkg1name)
-            pkg1data = (pkg1.version, pkg1.release)
+            pkg1data = self.resolver.version(pkg1name)
         pkg2data = None
         if not pkg2name in self.vertices():
-            pkg2 = self.packagedb.get_package(pkg2name)
-            pkg2data = (pkg2.version, pkg2.release)
+            pkg2data = self.resolver.version(pkg2name)
         self.add_edge(str(pkg1name), str(pkg2name), ("d", None), pkg1data, pkg2data)
 
     def add_dep(self, pkg, depinfo):
         pkg1data = None
         if not pkg in self.vertices():
-            pkg1 = self.packagedb.get_package(pkg)
-            pkg1data = (pkg1.version, pkg1.release)
+            pkg1data = self.resolver.version(pkg)
         pkg2data = None
         if not depinfo.package in self.vertices():
-            pkg2 = self.packagedb.get_package(depinfo.package)
-            pkg2data = (pkg2.version, pkg2.release)
+            pkg2data = self.resolver.version(depinfo.package)
         self.add_edge(
             str(pkg), str(depinfo.package), ("d", depinfo), pkg1data, pkg2data
         )
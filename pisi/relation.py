@@ -60,5 +60,5 @@ def installed_package_satisfies(relation):
     if not installdb.has_package(pkg_name):
         return False
     else:
-        pkg = installdb.get_package(pkg_name)
-        return relation.satisfies_relation(pkg.version, pkg.release)
+        version, release, build = installdb.get_version(pkg_name)
+        return relation.satisfies_relation(version, release)
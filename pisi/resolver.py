@@ -0,0 +1,101 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Memoized package lookups for install, upgrade and remove planning.
+
+Planning walks the same packages and dependencies many times while the
+package databases do not change, so a Resolver created for one
+operation remembers packages, versions and the outcome of every
+dependency check, and records how long each planning phase took.
+"""
+
+import contextlib
+import time
+
+import pisi.context as ctx
+import pisi.db
+from pisi import translate as _
+
+
+def relation_key(dep):
+    """Return a hashable key identifying a Dependency or AnyDependency."""
+    if hasattr(dep, "dependencies"):
+        return tuple(relation_key(x) for x in dep.dependencies)
+
+    return (
+        dep.package,
+        dep.version,
+        dep.versionFrom,
+        dep.versionTo,
+        dep.release,
+        dep.releaseFrom,
+        dep.releaseTo,
+        getattr(dep, "type", None),
+    )
+
+
+class Resolver:
+    def __init__(self, db):
+        """db is the PackageDB or InstallDB packages are looked up in."""
+        self.db = db
+        self.installed = isinstance(db, pisi.db.installdb.InstallDB)
+
+        self.packages = {}
+        self.versions = {}
+        self.satisfied = {}
+
+        self.checks = 0
+        self.timings = {}
+
+    def get_package(self, name):
+        if name not in self.packages:
+            self.packages[name] = self.db.get_package(name)
+        return self.packages[name]
+
+    def version(self, name):
+        """Return the (version, release) of a package."""
+        if name not in self.versions:
+            if self.installed:
+                version, release, build = self.db.get_version(name)
+            else:
+                version, release, build = self.db.get_version(name, None)
+            self.versions[name] = (version, release)
+        return self.versions[name]
+
+    def __check(self, kind, dep, check):
+        self.checks += 1
+        key = (kind, relation_key(dep))
+        if key not in self.satisfied:
+            self.satisfied[key] = check()
+        return self.satisfied[key]
+
+    def satisfied_by_installed(self, dep):
+        return self.__check("installed", dep, dep.satisfied_by_installed)
+
+    def satisfied_by_repo(self, dep):
+        return self.__check("repo", dep, dep.satisfied_by_repo)
+
+    @contextlib.contextmanager
+    def timed(self, phase):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0) + time.time() - start
+
+    def report(self, operation):
+        ctx.ui.debug(
+            _(
+                "%(operation)s planned in %(secs).3f seconds (%(phases)s), "
+                "%(checks)d dependency checks, %(cached)d cached."
+            )
+            % {
+                "operation": operation,
+                "secs": sum(self.timings.values()),
+                "phases": ", ".join(
+                    "%s %.3f" % item for item in sorted(self.timings.items())
+                ),
+                "checks": self.checks,
+                "cached": self.checks - len(self.satisfied),
+            }
+        )
@@ -5,6 +5,7 @@
 
 # standard python modules
 
+import contextlib
 import fcntl
 import fnmatch
 import hashlib
@@ -16,7 +17,9 @@ import struct
 import subprocess
 import sys
 import termios
+import time
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 
 from pisi import translate as _
@@ -194,6 +197,18 @@ def search_executable(executable):
     return None
 
 
+@contextlib.contextmanager
+def timed(timings, name):
+    """Add the time spent in the block to timings[name], if timings is
+    not None."""
+    start = time.time()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[name] = timings.get(name, 0) + time.time() - start
+
+
 def run_batch(cmd):
     """Run command and report return value and output."""
     ctx.ui.info(_("Running ") + cmd, verbose=True)
@@ -390,18 +405,65 @@ def dir_size(_dir):
     return sum(sizes())
 
 
+# ioctl request cloning a whole file, from linux/fs.h
+FICLONE = 0x40049409
+
+
+def clone_file(src, dest, follow_symlinks=True):
+    """Copy the contents of src to dest, sharing data blocks if possible.
+
+    On file systems with copy-on-write support (btrfs, XFS) the file is
+    cloned without copying any data. Otherwise the data is copied inside
+    the kernel with copy_file_range(2), falling back to a regular copy.
+    The signature matches shutil.copyfile so that this can be used as the
+    copy_function of shutil.move and shutil.copytree.
+    """
+    if not follow_symlinks and os.path.islink(src):
+        os.symlink(os.readlink(src), dest)
+        return dest
+
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return dest
+        except OSError:
+            pass
+
+        try:
+            while os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30):
+                pass
+        except OSError:
+            # Start over with a plain copy
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+
+        # Copies whatever copy_file_range left, which is nothing if it
+        # succeeded
+        shutil.copyfileobj(fsrc, fdst)
+
+    return dest
+
+
+def clone_file_stat(src, dest, follow_symlinks=True):
+    """Like clone_file, also copying the stat info like shutil.copy2."""
+    clone_file(src, dest, follow_symlinks=follow_symlinks)
+    shutil.copystat(src, dest, follow_symlinks=follow_symlinks)
+    return dest
+
+
 def copy_file(src, dest):
     """Copy source file to the destination file."""
     check_file(src)
     ensure_dirs(os.path.dirname(dest))
-    shutil.copyfile(src, dest)
+    clone_file(src, dest)
 
 
 def copy_file_stat(src, dest):
     """Copy source file to the destination file with all stat info."""
     check_file(src)
     ensure_dirs(os.path.dirname(dest))
-    shutil.copy2(src, dest)
+    clone_file_stat(src, dest)
 
 
 def read_link(link):
@@ -446,7 +508,7 @@ def calculate_hash(path):
     return (path, value)
 
 
-def get_file_hashes(top, excludePrefix=None, removePrefix=None):
+def get_file_hashes(top, excludePrefix=None, removePrefix=None, tree=None):
     """Yield (path, hash) tuples for given directory tree.
 
     Generator function iterates over a toplevel path and returns the
@@ -455,7 +517,17 @@ def get_file_hashes(top, excludePrefix=None, removePrefix=None):
     matching those prefixes. The removePrefix string parameter will be
     used to remove prefix from filePath while matching excludes, if
     given.
+
+    If tree is given, its walk, isdir, islink and calculate_hash methods
+    are used in place of the file system functions of the same name, so
+    that an already scanned tree is not walked and hashed again.
     """
+    if tree is None:
+        walk, isdir, islink = os.walk, os.path.isdir, os.path.islink
+        hash_path = calculate_hash
+    else:
+        walk, isdir, islink = tree.walk, tree.isdir, tree.islink
+        hash_path = tree.calculate_hash
 
     def is_included(path):
         if excludePrefix:
@@ -467,17 +539,17 @@ def get_file_hashes(top, excludePrefix=None, removePrefix=None):
         return True
 
     # single file/symlink case
-    if not os.path.isdir(top) or os.path.islink(top):
+    if not isdir(top) or islink(top):
         if is_included(top):
-            yield calculate_hash(top)
+            yield hash_path(top)
         return
 
-    for root, dirs, files in os.walk(top):
+    for root, dirs, files in walk(top):
         # Hash files and file symlinks
         for name in files:
             path = os.path.join(root, name)
             if is_included(path):
-                yield calculate_hash(path)
+                yield hash_path(path)
 
         # Hash symlink dirs
         # os.walk doesn't enter them, we don't want to follow them either
@@ -485,15 +557,15 @@ def get_file_hashes(top, excludePrefix=None, removePrefix=None):
         # Discussed in bug #339
         for name in dirs:
             path = os.path.join(root, name)
-            if os.path.islink(path):
+            if islink(path):
                 if is_included(path):
-                    yield calculate_hash(path)
+                    yield hash_path(path)
 
         # Hash empty dir
         # Discussed in bug #340
         if len(files) == 0 and len(dirs) == 0:
             if is_included(root):
-                yield calculate_hash(root)
+                yield hash_path(root)
 
 
 def check_file_hash(filename, hash):
@@ -501,25 +573,48 @@ def check_file_hash(filename, hash):
     return sha1_file(filename) == hash
 
 
+# Files at least this big are read into a reused buffer of
+# SHA1_LARGE_BLOCK bytes. They are not mapped, as a file truncated while
+# being hashed, e.g. by check_files(), would raise SIGBUS
+SHA1_LARGE_SIZE = 4 * 1024 * 1024
+SHA1_LARGE_BLOCK = 4 * 1024 * 1024
+# Bytes of small files hashed by one job of sha1_files()
+SHA1_BATCH_SIZE = 4 * 1024 * 1024
+
+
 def sha1_file(filename):
     """Calculate sha1 hash of file."""
     # Broken links can cause problem!
     try:
         m = hashlib.sha1()
-        f = open(filename, "rb")
-        while True:
-            # 256 KB seems ideal for speed/memory tradeoff
-            # It wont get much faster with bigger blocks, but
-            # heap peak grows
-            block = f.read(256 * 1024)
-            if len(block) == 0:
-                # end of file
-                break
-            m.update(block)
-            # Simple trick to keep total heap even lower
-            # Delete the previous block, so while next one is read
-            # we wont have two allocated blocks with same size
-            del block
+        with open(filename, "rb") as f:
+            if os.fstat(f.fileno()).st_size >= SHA1_LARGE_SIZE:
+                # Big files are hashed in blocks large enough for hashlib
+                # to release the GIL for long, without allocating each one
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                buf = bytearray(SHA1_LARGE_BLOCK)
+                with memoryview(buf) as view:
+                    while True:
+                        size = f.readinto(buf)
+                        if not size:
+                            break
+                        m.update(view[:size])
+                return m.hexdigest()
+
+            while True:
+                # 256 KB seems ideal for speed/memory tradeoff
+                # It wont get much faster with bigger blocks, but
+                # heap peak grows
+                block = f.read(256 * 1024)
+                if len(block) == 0:
+                    # end of file
+                    break
+                m.update(block)
+                # Simple trick to keep total heap even lower
+                # Delete the previous block, so while next one is read
+                # we wont have two allocated blocks with same size
+                del block
         return m.hexdigest()
     except IOError as e:
         if e.errno == 13:
@@ -534,6 +629,70 @@ def sha1_file(filename):
             raise FileError(_("Cannot calculate SHA1 hash of %s") % filename)
 
 
+def _sha1_batch(paths):
+    results = []
+    for path in paths:
+        try:
+            results.append((path, sha1_file(path), None))
+        except Error as e:
+            results.append((path, None, e))
+    return results
+
+
+def sha1_files(paths, jobs=None, sizes=None):
+    """Yield a (path, hash, error) tuple for each of the paths, in order.
+
+    The files are hashed by sha1_file() on a pool of jobs threads, the
+    number of CPUs by default. error is the exception sha1_file() raised
+    for a path, in which case hash is None. sizes may give the size of
+    each path, if the caller already knows them.
+    """
+    paths = list(paths)
+    if sizes is None:
+        sizes = []
+        for path in paths:
+            try:
+                sizes.append(os.stat(path).st_size)
+            except OSError:
+                # sha1_file() will report it
+                sizes.append(0)
+
+    # Big files get a job of their own, consecutive small files share
+    # one so that handing them to the pool does not cost more than
+    # hashing them
+    batches = []
+    for path, size in zip(paths, sizes):
+        if (
+            not batches
+            or batches[-1][0] + size > SHA1_BATCH_SIZE
+            or len(batches[-1][1]) >= 256
+        ):
+            batches.append([0, []])
+        batches[-1][0] += size
+        batches[-1][1].append(path)
+
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    if jobs <= 1 or len(batches) <= 1:
+        for size, batch in batches:
+            yield from _sha1_batch(batch)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    try:
+        # Biggest jobs first, so that one does not finish alone at the end
+        futures = {}
+        for i in sorted(range(len(batches)), key=lambda i: -batches[i][0]):
+            futures[i] = executor.submit(_sha1_batch, batches[i][1])
+
+        for i in range(len(batches)):
+            yield from futures.pop(i).result()
+    finally:
+        # Do not hash the rest if the caller stopped early
+        executor.shutdown(cancel_futures=True)
+
+
 def sha1_data(data: str) -> str:
     """Calculate sha1 hash of the given string and return its hex representation."""
     m = hashlib.sha1()
@@ -607,12 +766,15 @@ def do_patch(sourceDir, patchFile, level=0, name=None, reverse=False):
     os.chdir(cwd)
 
 
-def strip_file(filepath, fileinfo, outpath):
-    """Strip an elf file from debug symbols."""
+def strip_file(filepath, fileinfo, outpath, timings=None):
+    """Strip an elf file from debug symbols.
+
+    The time spent in strip and objcopy is added to timings, if given."""
 
     def run_strip(f, flags=""):
-        p = os.popen("strip %s %s" % (flags, f))
-        ret = p.close()
+        with timed(timings, "strip"):
+            p = os.popen("strip %s %s" % (flags, f))
+            ret = p.close()
         if ret:
             ctx.ui.warning(_("strip command failed for file '%s'!") % f)
 
@@ -625,18 +787,22 @@ def strip_file(filepath, fileinfo, outpath):
 
     def save_elf_debug(f, o):
         """copy debug info into file.debug file"""
-        p = os.popen(
-            "objcopy --only-keep-debug %s %s%s" % (f, o, ctx.const.debug_file_suffix)
-        )
-        ret = p.close()
+        with timed(timings, "objcopy"):
+            p = os.popen(
+                "objcopy --only-keep-debug %s %s%s"
+                % (f, o, ctx.const.debug_file_suffix)
+            )
+            ret = p.close()
         if ret:
             ctx.ui.warning(_("objcopy (keep-debug) command failed for file '%s'!") % f)
 
         """mark binary/shared objects to use file.debug"""
-        p = os.popen(
-            "objcopy --add-gnu-debuglink=%s%s %s" % (o, ctx.const.debug_file_suffix, f)
-        )
-        ret = p.close()
+        with timed(timings, "objcopy"):
+            p = os.popen(
+                "objcopy --add-gnu-debuglink=%s%s %s"
+                % (o, ctx.const.debug_file_suffix, f)
+            )
+            ret = p.close()
         if ret:
             ctx.ui.warning(
                 _("objcopy (add-debuglink) command failed for file '%s'!") % f
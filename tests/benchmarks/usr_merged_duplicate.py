@@ -0,0 +1,71 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Time pisi.path.is_usr_merged_duplicate() against the old list scan.
+
+Every path of a package file list is checked, as Remove does, with half
+of the paths under the usr merged directories. The destination is a
+temporary usr merged tree, so the symlink probes are real.
+
+    python tests/benchmarks/usr_merged_duplicate.py [sizes...]
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+
+import pisi.api
+import pisi.config
+import pisi.path
+
+
+def list_is_usr_merged_duplicate(files, path):
+    """is_usr_merged_duplicate() as it was, scanning a list of paths."""
+    if not pisi.path.is_usr_merged(path):
+        return False
+
+    return pisi.path.usr_merged_path(path) in files
+
+
+def file_list(size):
+    paths = []
+    for i in range(size // 2):
+        top = ("bin", "lib")[i % 2]
+        paths.append("%s/file%d" % (top, i))
+        paths.append("usr/share/pkg/file%d" % i)
+    return paths
+
+
+def per_file(func, files, paths, number):
+    seconds = timeit.timeit(
+        lambda: [func(files, path) for path in paths], number=number
+    )
+    return seconds / number / len(paths) * 1e6
+
+
+def main(sizes):
+    with tempfile.TemporaryDirectory() as root:
+        for d in ("bin", "lib"):
+            os.makedirs(os.path.join(root, "usr", d))
+            os.symlink(os.path.join("usr", d), os.path.join(root, d))
+
+        options = pisi.config.Options()
+        options.destdir = root
+        pisi.api.set_options(options)
+
+        print("%8s %12s %12s" % ("files", "list", "set"))
+        for size in sizes:
+            paths = file_list(size)
+            number = max(1, 200000 // size)
+            before = per_file(list_is_usr_merged_duplicate, paths, paths, number)
+            after = per_file(
+                pisi.path.is_usr_merged_duplicate, set(paths), paths, number
+            )
+            print("%8d %9.1f us %9.1f us" % (size, before, after))
+
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or [1000, 5000, 20000])
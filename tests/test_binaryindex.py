@@ -0,0 +1,211 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Generate binary indexes from XML and read them back."""
+
+import zlib
+
+import iksemel
+import pytest
+
+from pisi.db import binaryindex, searchindex
+
+INDEX = """<PISI>
+<Distribution>
+    <SourceName>Solus</SourceName>
+    <Version>1</Version>
+    <Obsoletes><Package>old</Package></Obsoletes>
+</Distribution>
+<Package>
+    <Name>libfoo</Name>
+    <Summary xml:lang="en">Foo library</Summary>
+    <Summary xml:lang="de">Foo Bibliothek</Summary>
+    <Description>Shared parts of foo.</Description>
+    <PartOf>system.base</PartOf>
+    <IsA>library</IsA>
+    <Provides><PkgConfig>foo</PkgConfig><PkgConfig32>foo</PkgConfig32></Provides>
+    <History><Update release="3"><Version>1.2</Version></Update></History>
+    <Distribution>Solus</Distribution>
+    <DistributionRelease>1</DistributionRelease>
+</Package>
+<Package>
+    <Name>foo</Name>
+    <Summary>Foo tool</Summary>
+    <PartOf>system.utils</PartOf>
+    <Replaces><Package>oldfoo</Package></Replaces>
+    <RuntimeDependencies>
+        <Dependency releaseFrom="3">libfoo</Dependency>
+    </RuntimeDependencies>
+    <History><Update release="1"><Version>0.1</Version></Update></History>
+</Package>
+<Package>
+    <Name>orphan</Name>
+    <Summary>No component</Summary>
+    <RuntimeDependencies>
+        <Dependency>libfoo</Dependency>
+    </RuntimeDependencies>
+    <History><Update release="1"><Version>1</Version></Update></History>
+</Package>
+<Component>
+    <Name>system.base</Name>
+    <Group>system</Group>
+</Component>
+<Component>
+    <Name>system.utils</Name>
+</Component>
+<Group><Name>system</Name></Group>
+</PISI>
+"""
+
+
+@pytest.fixture
+def memory():
+    return binaryindex.from_doc(iksemel.parseString(INDEX))
+
+
+@pytest.fixture
+def paths(tmp_path):
+    source = tmp_path / "eopkg-index.xml"
+    source.write_text(INDEX)
+    return str(source), str(tmp_path / "eopkg-index.bin")
+
+
+def test_from_doc(memory):
+    assert memory.get("distribution", "SourceName") == b"Solus"
+    assert memory.get_list("distribution", "Obsoletes") == ["old"]
+    assert memory.get("distribution", "SpecFile") is None
+
+    assert sorted(memory.keys("packages")) == ["foo", "libfoo", "orphan"]
+    xml = zlib.decompress(memory.get("packages", "foo")).decode()
+    assert iksemel.parseString(xml).getTagData("Name") == "foo"
+    assert memory.get_list("versions", "libfoo") == ["1.2", "3", "Solus", "1"]
+    assert memory.get_list("versions", "foo") == ["0.1", "1", "", ""]
+
+    assert memory.get_list("revdeps", "libfoo") == [
+        "foo",
+        "releaseFrom=3",
+        "orphan",
+        "",
+    ]
+    assert binaryindex.unpack_attrs("releaseFrom=3") == (("releaseFrom", "3"),)
+    assert memory.get("pkgconfig", "foo") == b"libfoo"
+    assert memory.get("pkgconfig32", "foo") == b"libfoo"
+    assert memory.get_list("isa", "library") == ["libfoo"]
+
+    assert memory.get_list("component_packages", "system.base") == ["libfoo"]
+    assert memory.get_list("component_packages", "system.utils") == ["foo"]
+    # Packages without a component are still listed
+    assert memory.get_list("component_packages", "") == ["orphan"]
+    assert memory.get_list("group_components", "system") == ["system.base"]
+    assert memory.get_list("group_components", "unknown") == ["system.utils"]
+    assert sorted(memory.keys("groups")) == ["system"]
+
+    assert memory.get("missing", "key") is None
+    assert memory.keys("missing") == []
+
+
+def test_round_trip(memory, paths):
+    source, path = paths
+    binaryindex.write(path, memory, source)
+
+    with binaryindex.BinaryIndex(path) as index:
+        assert index.is_current(source)
+        assert sorted(index.sections) == sorted(memory.sections)
+        for section, items in memory.sections.items():
+            assert index.keys(section) == sorted(items)
+            assert dict(index.items(section)) == items
+            for key, value in items.items():
+                assert index.get(section, key) == value
+        assert index.get("packages", "bar") is None
+        assert index.get("packages", "zzz", b"") == b""
+        assert index.get("missing", "foo") is None
+
+        for prefix in ("", "f", "foo", "lib", "o", "x"):
+            assert list(index.prefix_items("packages", prefix)) == list(
+                memory.prefix_items("packages", prefix)
+            )
+
+    assert index._map is None
+
+
+def test_is_current(memory, paths):
+    source, path = paths
+    binaryindex.write(path, memory, source)
+
+    with open(source, "a") as f:
+        f.write("\n")
+    with binaryindex.BinaryIndex(path) as index:
+        assert not index.is_current(source)
+        assert not index.is_current(source + ".missing")
+
+
+def test_invalid(memory, paths, tmp_path):
+    source, path = paths
+
+    empty = tmp_path / "empty"
+    empty.write_bytes(b"")
+    with pytest.raises(binaryindex.Error):
+        binaryindex.BinaryIndex(str(empty))
+
+    binaryindex.write(path, memory, source)
+    with open(path, "rb") as f:
+        data = f.read()
+
+    truncated = tmp_path / "truncated"
+    truncated.write_bytes(data[:20])
+    with pytest.raises(binaryindex.Error):
+        binaryindex.BinaryIndex(str(truncated))
+
+    old = tmp_path / "old"
+    old.write_bytes(data[:8] + b"\1\0\0\0" + data[12:])
+    with pytest.raises(binaryindex.Error):
+        binaryindex.BinaryIndex(str(old))
+
+
+def test_search(memory, paths):
+    """The search section finds what a SearchIndex of the packages finds."""
+    source, path = paths
+    binaryindex.write(path, memory, source)
+
+    packages = searchindex.SearchIndex()
+    doc = iksemel.parseString(INDEX)
+    for node in doc.tags("Package"):
+
+        def texts(tag):
+            return dict(
+                (x.getAttribute("xml:lang") or "en", x.firstChild().data())
+                for x in node.tags(tag)
+            )
+
+        packages.add(node.getTagData("Name"), texts("Summary"), texts("Description"))
+
+    with binaryindex.BinaryIndex(path) as index:
+
+        def prefix_items(prefix):
+            for key, names in index.prefix_items("search", prefix):
+                yield key, binaryindex.split_list(names)
+
+        def words(field, lang):
+            key = searchindex.make_key(field, lang, "")
+            return index.get("search_words", key, b"").decode()
+
+        for terms in (
+            ["foo"],
+            ["lib"],
+            ["bibliothek"],
+            ["shared", "foo"],
+            ["^or"],
+            ["ared"],
+            ["ibrar"],
+        ):
+            for lang in ("en", "de"):
+                assert searchindex.search(
+                    prefix_items, terms, lang, names=index.keys("packages"), words=words
+                ) == packages.search(terms, lang)
+        assert packages.search(["ared"], "en") == {"libfoo": 1}
+
+
+def test_split_list():
+    assert binaryindex.split_list(b"") == []
+    assert binaryindex.split_list(None) == []
+    assert binaryindex.split_list(binaryindex.join_list(["a", "b"])) == ["a", "b"]
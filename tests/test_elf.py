@@ -0,0 +1,300 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Compare pisi.elf with readelf.
+
+The fixtures are written by hand so that 32-bit and big-endian files can
+be tested on any host. If gcc is around, real binaries are checked too.
+"""
+
+import os
+import re
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+from pisi import elf
+
+BASE = 0x400000
+
+# (elfclass, order, machine)
+LAYOUTS = [
+    (32, "<", 3),  # EM_386
+    (64, "<", 62),  # EM_X86_64
+    (32, ">", 20),  # EM_PPC
+    (64, ">", 21),  # EM_PPC64
+]
+
+FIXTURES = {
+    "library": dict(
+        type=elf.ET_DYN,
+        soname="libfoo.so.1",
+        needed=["libc.so.6", "libm.so.6"],
+        runpath=["$ORIGIN/../lib"],
+        build_id="0123456789abcdef0123456789abcdef01234567",
+    ),
+    "pie": dict(
+        type=elf.ET_DYN,
+        pie=True,
+        needed=["libfoo.so.1"],
+        rpath=["/usr/lib/foo:/opt/lib"],
+        build_id="cafe",
+    ),
+    "executable": dict(type=elf.ET_EXEC, needed=["libc.so.6"]),
+    "static": dict(type=elf.ET_EXEC, dynamic=False, build_id="00ff"),
+}
+
+
+def make_elf(
+    elfclass,
+    order,
+    machine,
+    type=elf.ET_DYN,
+    pie=False,
+    soname=None,
+    needed=(),
+    rpath=(),
+    runpath=(),
+    build_id=None,
+    dynamic=True,
+):
+    """Return the bytes of a minimal ELF file without section headers."""
+    if elfclass == 32:
+        ehdr = struct.Struct(order + "16sHHIIIIIHHHHHH")
+        phdr = struct.Struct(order + "IIIIIIII")
+        dyn = struct.Struct(order + "iI")
+    else:
+        ehdr = struct.Struct(order + "16sHHIQQQIHHHHHH")
+        phdr = struct.Struct(order + "IIQQQQQQ")
+        dyn = struct.Struct(order + "qQ")
+    note = struct.Struct(order + "III")
+
+    def pad(blob, align):
+        return blob + b"\0" * (-len(blob) % align)
+
+    strings = bytearray(b"\0")
+
+    def string(value):
+        strings.extend(value.encode() + b"\0")
+        return len(strings) - len(value) - 1
+
+    entries = [(elf.DT_NEEDED, string(name)) for name in needed]
+    if soname is not None:
+        entries.append((elf.DT_SONAME, string(soname)))
+    entries += [(elf.DT_RPATH, string(path)) for path in rpath]
+    entries += [(elf.DT_RUNPATH, string(path)) for path in runpath]
+    if pie:
+        entries.append((elf.DT_FLAGS_1, elf.DF_1_PIE))
+
+    segments = 2 + dynamic + (build_id is not None)
+    offset = ehdr.size + segments * phdr.size
+    strtab_offset = offset
+    strtab = pad(bytes(strings), 8)
+    offset += len(strtab)
+
+    entries += [(elf.DT_STRTAB, BASE + strtab_offset), (10, len(strings))]
+    entries.append((elf.DT_NULL, 0))
+    dynamic_offset = offset
+    dynamic_data = b"".join(dyn.pack(tag, value) for tag, value in entries)
+    offset += len(dynamic_data)
+
+    note_offset = offset
+    note_data = b""
+    if build_id is not None:
+        desc = bytes.fromhex(build_id)
+        note_data = note.pack(4, len(desc), elf.NT_GNU_BUILD_ID) + b"GNU\0"
+        note_data += pad(desc, 4)
+    size = offset + len(note_data)
+
+    def program_header(ptype, offset, size, align):
+        flags = 4  # PF_R
+        if elfclass == 32:
+            return phdr.pack(
+                ptype, offset, BASE + offset, BASE + offset, size, size, flags, align
+            )
+        return phdr.pack(
+            ptype, flags, offset, BASE + offset, BASE + offset, size, size, align
+        )
+
+    headers = [
+        program_header(6, ehdr.size, segments * phdr.size, 8),  # PT_PHDR
+        program_header(elf.PT_LOAD, 0, size, 0x1000),
+    ]
+    if dynamic:
+        headers.append(
+            program_header(elf.PT_DYNAMIC, dynamic_offset, len(dynamic_data), 8)
+        )
+    if build_id is not None:
+        headers.append(program_header(elf.PT_NOTE, note_offset, len(note_data), 4))
+
+    ident = bytes([0x7F]) + b"ELF"
+    ident += bytes([elfclass // 32, 1 if order == "<" else 2, 1])
+    header = ehdr.pack(
+        pad(ident, 16),
+        type,
+        machine,
+        1,
+        BASE,
+        ehdr.size,
+        0,
+        0,
+        ehdr.size,
+        phdr.size,
+        len(headers),
+        0,
+        0,
+        0,
+    )
+
+    data = header + b"".join(headers) + strtab
+    if dynamic:
+        data += dynamic_data
+    else:
+        data += b"\0" * len(dynamic_data)
+    return data + note_data
+
+
+def readelf(path):
+    """Return what readelf tells about path, in the shape of an ELFFile."""
+    output = subprocess.run(
+        ["readelf", "--wide", "-h", "-l", "-d", "-n", path],
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, LC_ALL="C"),
+    ).stdout
+
+    def values(tag, label):
+        pattern = r"\(%s\)\s+%s: \[(.*)\]" % (tag, label)
+        return re.findall(pattern, output)
+
+    soname = values("SONAME", "Library soname")
+    build_id = re.findall(r"Build ID: ([0-9a-f]+)", output)
+    return dict(
+        elfclass=int(re.search(r"Class:\s+ELF(\d+)", output).group(1)),
+        little_endian="little endian" in output,
+        type=int(re.search(r"Type:\s+(\w+)", output).group(1) == "DYN") + 2,
+        pie=bool(re.search(r"\(FLAGS_1\)\s+Flags:.*\bPIE\b", output)),
+        soname=soname[0] if soname else None,
+        needed=values("NEEDED", "Shared library"),
+        rpath=values("RPATH", "Library rpath"),
+        runpath=values("RUNPATH", "Library runpath"),
+        build_id=build_id[0] if build_id else None,
+    )
+
+
+def fields(info):
+    return dict((name, getattr(info, name)) for name in elf.ELFFile.__slots__)
+
+
+needs_readelf = pytest.mark.skipif(
+    shutil.which("readelf") is None, reason="readelf is not installed"
+)
+
+
+@pytest.mark.parametrize("layout", LAYOUTS, ids=lambda l: "%d%s" % l[:2])
+@pytest.mark.parametrize("name", sorted(FIXTURES))
+def test_parse(layout, name):
+    elfclass, order, machine = layout
+    fixture = FIXTURES[name]
+    info = elf.parse(make_elf(elfclass, order, machine, **fixture))
+
+    assert info.elfclass == elfclass
+    assert info.little_endian == (order == "<")
+    assert info.type == fixture["type"]
+    assert info.pie == fixture.get("pie", False)
+    assert info.soname == fixture.get("soname")
+    assert info.needed == fixture.get("needed", [])
+    assert info.rpath == fixture.get("rpath", [])
+    assert info.runpath == fixture.get("runpath", [])
+    assert info.build_id == fixture.get("build_id")
+
+
+@needs_readelf
+@pytest.mark.parametrize("layout", LAYOUTS, ids=lambda l: "%d%s" % l[:2])
+@pytest.mark.parametrize("name", sorted(FIXTURES))
+def test_fixtures_match_readelf(tmp_path, layout, name):
+    path = tmp_path / name
+    path.write_bytes(make_elf(*layout, **FIXTURES[name]))
+
+    assert fields(elf.read(str(path))) == readelf(str(path))
+
+
+@needs_readelf
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="gcc is not installed")
+def test_compiled_match_readelf(tmp_path):
+    source = tmp_path / "foo.c"
+    source.write_text("int foo(void) { return 0; }\nint main(void) { return 0; }\n")
+    builds = {
+        "libfoo.so.1": ["-shared", "-fPIC", "-Wl,-soname,libfoo.so.1"],
+        "pie": ["-fPIE", "-pie", "-Wl,--enable-new-dtags,-rpath,/opt/a:/opt/b"],
+        "exec": ["-no-pie", "-Wl,--disable-new-dtags,-rpath,$ORIGIN"],
+    }
+    for name, flags in builds.items():
+        path = tmp_path / name
+        subprocess.run(
+            ["gcc", "-Wl,--build-id", "-o", str(path), str(source)] + flags,
+            check=True,
+        )
+        assert fields(elf.read(str(path))) == readelf(str(path))
+
+
+@pytest.mark.parametrize("name", sorted(FIXTURES))
+def test_builder_classification(tmp_path, name):
+    """Files are classified like the libmagic strings the builder used to
+    match, except that PIE executables are dynamic binaries now too."""
+    magic = pytest.importorskip("magic")
+    from pisi.operations.build import Builder
+
+    path = str(tmp_path / name)
+    with open(path, "wb") as f:
+        f.write(make_elf(64, "<", 62, **FIXTURES[name]))
+    description = magic.from_file(path)
+    library = re.match(r"ELF (64|32)-bit LSB shared object,", description)
+    binary = re.match(r"ELF (64|32)-bit LSB (pie )?executable,", description)
+
+    builder = Builder.__new__(Builder)
+    assert builder.is_dynamic_library(path) == bool(library)
+    assert builder.is_dynamic_binary(path) == bool(library or binary)
+    if FIXTURES[name].get("pie"):
+        assert "pie executable" in description
+        assert builder.is_dynamic_binary(path)
+        assert not builder.is_dynamic_library(path)
+
+
+@pytest.mark.parametrize("layout", LAYOUTS, ids=lambda l: "%d%s" % l[:2])
+def test_truncated(layout):
+    data = make_elf(*layout, **FIXTURES["library"])
+    for size in range(len(data)):
+        info = elf.parse(data[:size])
+        assert info is None or info.elfclass == layout[0]
+    # Cut inside the program headers
+    assert elf.parse(data[:80]) is None
+
+
+def test_not_elf(tmp_path):
+    assert elf.parse(b"") is None
+    assert elf.parse(b"#!/bin/sh\n") is None
+    assert elf.parse(b"\x7fELF\x03\x01" + b"\0" * 58) is None
+
+    empty = tmp_path / "empty"
+    empty.write_bytes(b"")
+    assert elf.read(str(empty)) is None
+
+
+def test_get(tmp_path):
+    path = tmp_path / "libfoo.so.1"
+    path.write_bytes(make_elf(64, "<", 62, **FIXTURES["library"]))
+    os.symlink("libfoo.so.1", str(tmp_path / "libfoo.so"))
+    elf.clear_cache()
+
+    assert elf.get(str(path)).soname == "libfoo.so.1"
+    assert elf.get(str(tmp_path / "libfoo.so")) is None
+    assert elf.get(str(tmp_path)) is None
+    assert elf.get(str(tmp_path / "missing")) is None
+
+    # Rewriting the file must not return the cached result
+    path.write_bytes(make_elf(64, "<", 62, **FIXTURES["pie"]))
+    os.utime(str(path), ns=(0, 0))
+    assert elf.get(str(path)).pie
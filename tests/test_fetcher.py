@@ -0,0 +1,278 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Download from a local HTTP server, resuming and verifying files."""
+
+import hashlib
+import http.server
+import os
+import threading
+import time
+
+import pytest
+import requests
+from requests.exceptions import ChunkedEncodingError, ConnectionError
+
+import pisi
+import pisi.api
+import pisi.config
+import pisi.fetcher as fetcher
+import pisi.package
+from pisi.uri import URI
+
+CHUNK_SIZE = 1024
+
+DATA = bytes(range(256)) * 40
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Serve the files of the server, honouring range requests."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        time.sleep(server.delays.get(self.path, 0))
+        data = server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        if server.corrupt:
+            server.corrupt -= 1
+            data = data[:-1] + b"\0"
+
+        start = 0
+        byte_range = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if byte_range and server.ranges and if_range in (None, server.etag):
+            start = int(byte_range.split("=")[1].split("-")[0])
+            if server.ranges == 416:
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", "bytes %d-%d/%d" % (start, len(data) - 1, len(data))
+            )
+            if server.ranges == "wrong start":
+                start = 0
+        else:
+            self.send_response(200)
+        body = data[start:]
+        self.send_header("ETag", server.etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if server.cut:
+            server.cut -= 1
+            body = body[: server.cut_at]
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    options = pisi.config.Options()
+    options.destdir = str(tmp_path / "root")
+    options.retry_attempts = "2"
+    pisi.api.set_options(options)
+    monkeypatch.setattr(fetcher, "RESUME_CHUNK_SIZE", CHUNK_SIZE)
+    # A read cut short by the server loses all of its data
+    monkeypatch.setattr(fetcher, "MAX_CHUNK_SIZE", 256)
+
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    httpd.files = {"/file.bin": DATA}
+    httpd.requests = []
+    httpd.delays = {}
+    httpd.etag = '"v1"'
+    # True, False (send the whole file), 416 or "wrong start"
+    httpd.ranges = True
+    # Number of responses to cut after cut_at bytes, and to corrupt
+    httpd.cut = 0
+    httpd.cut_at = 3000
+    httpd.corrupt = 0
+    httpd.url = "http://127.0.0.1:%d/file.bin" % httpd.server_address[1]
+
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def dest(tmp_path):
+    path = tmp_path / "cache"
+    path.mkdir()
+    return str(path)
+
+
+def make_partial(dest, url, size, validator='"v1"'):
+    """Leave a download of size bytes behind, as if it was interrupted."""
+    partial = fetcher.PartialDownload(os.path.join(dest, "file.bin"), url)
+    partial.open(0, validator)
+    partial.write(DATA[:size])
+    partial.close()
+    return partial
+
+
+def fetch(server, dest):
+    fetcher.Fetcher().fetch(
+        server.url, dest, expected_hash=hashlib.sha1(DATA).hexdigest()
+    )
+    path = os.path.join(dest, "file.bin")
+    with open(path, "rb") as f:
+        assert f.read() == DATA
+    assert not os.path.exists(path + ".part")
+    assert not os.path.exists(path + ".part.state")
+
+
+def ranges(server):
+    return [
+        (headers.get("Range"), headers.get("If-Range"))
+        for path, headers in server.requests
+    ]
+
+
+def test_fetch(server, dest):
+    fetch(server, dest)
+    assert ranges(server) == [(None, None)]
+
+
+def test_resume(server, dest):
+    server.cut = 1
+    fetch(server, dest)
+
+    # Only the complete chunks of the cut response are kept
+    assert ranges(server) == [(None, None), ("bytes=2048-", '"v1"')]
+
+
+def test_resume_partial(server, dest):
+    make_partial(dest, server.url, 2500)
+    fetch(server, dest)
+    assert ranges(server) == [("bytes=2048-", '"v1"')]
+
+
+def test_range_ignored(server, dest):
+    """A server sending the whole file again starts the download over."""
+    server.ranges = False
+    make_partial(dest, server.url, 2500)
+    fetch(server, dest)
+    assert ranges(server) == [("bytes=2048-", '"v1"')]
+
+
+def test_range_not_satisfiable(server, dest):
+    server.ranges = 416
+    make_partial(dest, server.url, 2500)
+    fetch(server, dest)
+    assert ranges(server) == [("bytes=2048-", '"v1"'), (None, None)]
+
+
+def test_wrong_range_start(server, dest):
+    server.ranges = "wrong start"
+    make_partial(dest, server.url, 2500)
+    fetch(server, dest)
+    assert ranges(server) == [("bytes=2048-", '"v1"'), (None, None)]
+
+
+def test_changed_etag(server, dest):
+    """The server sends the whole file if it changed since the partial one."""
+    server.etag = '"v2"'
+    make_partial(dest, server.url, 2500)
+    fetch(server, dest)
+    assert ranges(server) == [("bytes=2048-", '"v1"')]
+
+
+def test_stale_state(server, dest):
+    # Data of another URL
+    make_partial(dest, server.url + "?old", 2500)
+    fetch(server, dest)
+    assert ranges(server) == [(None, None)]
+
+    # Chunks which do not match their digests
+    make_partial(dest, server.url, 2500)
+    with open(os.path.join(dest, "file.bin.part"), "r+b") as f:
+        f.seek(1500)
+        f.write(b"\xff")
+    server.requests.clear()
+    fetch(server, dest)
+    assert ranges(server) == [("bytes=1024-", '"v1"')]
+
+
+def test_retries(server, dest):
+    """Each interruption is retried once, from where it stopped."""
+    server.cut = 100
+    with pytest.raises((ChunkedEncodingError, ConnectionError)):
+        fetch(server, dest)
+    assert ranges(server) == [
+        (None, None),
+        ("bytes=2048-", '"v1"'),
+        ("bytes=4096-", '"v1"'),
+    ]
+
+
+def test_verify(server, dest):
+    """A file not matching its hash is downloaded again, from the start."""
+    server.corrupt = 1
+    make_partial(dest, server.url, 2500)
+    fetch(server, dest)
+    assert ranges(server) == [("bytes=2048-", '"v1"'), (None, None)]
+
+    server.corrupt = fetcher.VERIFY_ATTEMPTS
+    server.requests.clear()
+    with pytest.raises(pisi.Error):
+        fetcher.Fetcher().fetch(
+            server.url, dest, expected_hash=hashlib.sha1(DATA).hexdigest()
+        )
+    assert len(server.requests) == fetcher.VERIFY_ATTEMPTS
+    assert os.listdir(dest) == []
+
+
+def test_verify_size(server, dest):
+    with pytest.raises(pisi.Error):
+        fetcher.Fetcher().fetch(server.url, dest, expected_size=len(DATA) + 1)
+    assert len(server.requests) == fetcher.VERIFY_ATTEMPTS
+    assert os.listdir(dest) == []
+
+
+def resources(server, dest, names):
+    for name in names:
+        data = name.encode() * 100
+        server.files[f"/{name}.bin"] = data
+        yield pisi.package.PackageResource(
+            name,
+            URI(server.url.replace("file.bin", f"{name}.bin")),
+            "test",
+            hashlib.sha1(data).hexdigest(),
+            len(data),
+            os.path.join(dest, f"{name}.bin"),
+        )
+
+
+def test_fetch_iter(server, dest):
+    """Resources are yielded as they are ready, after their dependencies."""
+    server.delays["/a.bin"] = 0.5
+    items = list(resources(server, dest, "abc"))
+
+    found = fetcher.Fetcher().fetch_iter(items, {"c": {"a"}})
+    assert [resource.name for resource in found] == ["b", "a", "c"]
+
+    # Without dependencies, in order and without fetching them again
+    server.requests.clear()
+    found = fetcher.Fetcher().fetch_iter(items)
+    assert [resource.name for resource in found] == ["a", "b", "c"]
+    assert server.requests == []
+
+
+def test_fetch_iter_error(server, dest):
+    items = list(resources(server, dest, "ab"))
+    del server.files["/b.bin"]
+    server.delays["/b.bin"] = 0.5
+
+    found = fetcher.Fetcher().fetch_iter(items, {})
+    assert next(found).name == "a"
+    with pytest.raises(requests.HTTPError):
+        next(found)
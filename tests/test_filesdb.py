@@ -0,0 +1,185 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Look up and search installed files in the FilesDB."""
+
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import pisi.api
+import pisi.config
+import pisi.context as ctx
+import pisi.db
+import pisi.files
+from pisi.db.filesdb import FilesDB
+
+INSTALLED = {
+    "foo": ["usr/bin/foo", "usr/lib64/libfoo.so.1", "usr/share/doc/foo/README"],
+    "foo-devel": ["usr/include/foo.h", "usr/lib64/pkgconfig/foo.pc"],
+    "bar": ["usr/bin/bar", "usr/share/doc/bar/README_2%.txt", "usr/share/Foo/x"],
+}
+
+
+def make_files(paths):
+    files = pisi.files.Files()
+    for path in paths:
+        fileinfo = pisi.files.FileInfo()
+        fileinfo.path = path
+        fileinfo.type = "data"
+        files.append(fileinfo)
+    return files
+
+
+def old_search(term):
+    """The files.xml search the database replaced."""
+    pattern = re.compile(".*?%s.*?" % re.escape(term), re.I)
+    found = []
+    for pkg, paths in sorted(INSTALLED.items()):
+        paths = [path for path in sorted(paths) if pattern.match(path)]
+        if paths:
+            found.append((pkg, paths))
+    return found
+
+
+@pytest.fixture
+def filesdb(tmp_path):
+    options = pisi.config.Options()
+    options.destdir = str(tmp_path)
+    pisi.api.set_options(options)
+    for pkg, paths in INSTALLED.items():
+        pkg_dir = os.path.join(ctx.config.packages_dir(), "%s-1-1" % pkg)
+        os.makedirs(pkg_dir)
+        make_files(paths).write(os.path.join(pkg_dir, ctx.const.files_xml))
+    pisi.db.invalidate_caches()
+
+    filesdb = FilesDB()
+    filesdb.init(force_rebuild=True)
+    yield filesdb
+    filesdb.close()
+    filesdb.invalidate()
+
+
+def test_lookup(filesdb):
+    assert filesdb.has_file("usr/bin/foo")
+    assert not filesdb.has_file("usr/bin")
+    assert filesdb.get_file("usr/include/foo.h") == ("foo-devel", "usr/include/foo.h")
+    with pytest.raises(KeyError):
+        filesdb.get_file("usr/bin/baz")
+    assert filesdb.get_pkgconfig_provider("foo") == (
+        "foo-devel",
+        "usr/lib64/pkgconfig/foo.pc",
+    )
+    assert filesdb.get_pkgconfig_provider("bar") is None
+
+
+@pytest.mark.parametrize(
+    "term", ["foo", "FOO", "usr/bin", "readme", "2%", "_", "lib64/", "missing"]
+)
+def test_search_like_files_xml(filesdb, term):
+    assert filesdb.search_file(term) == old_search(term)
+
+
+def test_search(filesdb):
+    assert filesdb.search_file("usr/bin/bar") == [("bar", ["usr/bin/bar"])]
+    assert filesdb.search_file("usr/bin/*") == [
+        ("bar", ["usr/bin/bar"]),
+        ("foo", ["usr/bin/foo"]),
+    ]
+    assert filesdb.search_file("*/README") == [("foo", ["usr/share/doc/foo/README"])]
+    assert filesdb.search_file("usr/lib64/lib?oo.so.[0-9]") == [
+        ("foo", ["usr/lib64/libfoo.so.1"])
+    ]
+    # Case insensitive like substring searches
+    assert filesdb.search_file("*/foo/*") == [
+        ("bar", ["usr/share/Foo/x"]),
+        ("foo", ["usr/share/doc/foo/README"]),
+    ]
+    assert filesdb.search_file("*/readme") == [("foo", ["usr/share/doc/foo/README"])]
+
+
+def test_add_and_remove(filesdb):
+    filesdb.add_files("baz", make_files(["usr/bin/baz", "usr/bin/foo"]))
+    assert filesdb.get_file("usr/bin/foo")[0] == "baz"
+    assert filesdb.has_file("usr/bin/baz")
+
+    filesdb.remove_files(make_files(["usr/bin/baz"]).list)
+    assert not filesdb.has_file("usr/bin/baz")
+    assert filesdb.get_file("usr/bin/foo")[0] == "baz"
+
+
+def other_connection():
+    """Open the database like another process would."""
+    return sqlite3.connect(os.path.join(ctx.config.info_dir(), ctx.const.files_db))
+
+
+def test_transaction(filesdb):
+    def has_file(path):
+        db = other_connection()
+        try:
+            query = "SELECT 1 FROM files WHERE path = ?"
+            return db.execute(query, (path,)).fetchone() is not None
+        finally:
+            db.close()
+
+    with filesdb.transaction():
+        filesdb.add_files("baz", make_files(["usr/bin/baz"]))
+        with filesdb.transaction():
+            filesdb.remove_files(make_files(["usr/bin/bar"]).list)
+        assert filesdb.has_file("usr/bin/baz")
+        # Other processes see the database as it was before
+        assert not has_file("usr/bin/baz")
+        assert has_file("usr/bin/bar")
+    assert has_file("usr/bin/baz")
+    assert not has_file("usr/bin/bar")
+
+    # The packages done before an error are kept
+    with pytest.raises(RuntimeError):
+        with filesdb.transaction():
+            filesdb.add_files("qux", make_files(["usr/bin/qux"]))
+            raise RuntimeError()
+    assert has_file("usr/bin/qux")
+
+
+CRASH = """
+import os, sys
+import pisi.api, pisi.config, pisi.files
+from pisi.db.filesdb import FilesDB
+
+options = pisi.config.Options()
+options.destdir = sys.argv[1]
+pisi.api.set_options(options)
+
+files = pisi.files.Files()
+for path in ("usr/bin/baz", "usr/bin/qux"):
+    fileinfo = pisi.files.FileInfo()
+    fileinfo.path = path
+    files.append(fileinfo)
+
+filesdb = FilesDB()
+with filesdb.transaction():
+    filesdb.add_files("baz", files)
+    os._exit(0)
+"""
+
+
+def test_crash_in_transaction(filesdb, tmp_path):
+    filesdb.add_files("quux", make_files(["usr/bin/quux"]))
+    filesdb.close()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run(
+        [sys.executable, "-c", CRASH, str(tmp_path)],
+        check=True,
+        env=dict(os.environ, PYTHONPATH=root),
+    )
+
+    # Nothing of the interrupted operation made it, and the database is
+    # used as it is instead of being rebuilt
+    filesdb.init()
+    assert not filesdb.has_file("usr/bin/baz")
+    assert filesdb.has_file("usr/bin/quux")
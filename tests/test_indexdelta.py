@@ -0,0 +1,185 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Publish index deltas and bring a local index up to date with them."""
+
+import lzma
+import os
+import shutil
+
+import iksemel
+import pytest
+
+import pisi.api
+import pisi.config
+import pisi.context as ctx
+import pisi.file
+import pisi.indexdelta as indexdelta
+import pisi.util as util
+
+REPO = "test"
+
+DISTRIBUTION = "<Distribution><SourceName>Test</SourceName></Distribution>"
+
+
+def package(name, summary):
+    return "<Package><Name>%s</Name><Summary>%s</Summary></Package>" % (name, summary)
+
+
+def index(*packages, distribution=DISTRIBUTION):
+    return "<PISI>%s%s</PISI>" % (distribution, "".join(packages))
+
+
+class Server:
+    """A repository in a local directory, indexed like "eopkg index"."""
+
+    def __init__(self, path):
+        os.makedirs(path)
+        self.output = os.path.join(path, "eopkg-index.xml")
+        self.uri = self.output + ".xz"
+
+    def publish(self, text):
+        previous = indexdelta.load_previous(self.output)
+        with open(self.output, "w") as f:
+            f.write(text)
+        with open(self.uri, "wb") as f:
+            f.write(lzma.compress(text.encode()))
+        indexdelta.publish(self.output, previous)
+
+    def manifest(self):
+        return indexdelta.read_manifest(indexdelta.manifest_name(self.output))
+
+
+@pytest.fixture
+def server(tmp_path):
+    options = pisi.config.Options()
+    options.destdir = str(tmp_path / "root")
+    pisi.api.set_options(options)
+    return Server(str(tmp_path / "server"))
+
+
+@pytest.fixture
+def client(server):
+    """The client side index directory, with the first generation in it."""
+    server.publish(index(package("a", "A"), package("b", "B")))
+
+    index_dir = os.path.join(ctx.config.index_dir(), REPO)
+    os.makedirs(index_dir)
+    index_path = os.path.join(index_dir, "eopkg-index.xml")
+    shutil.copy(server.output, index_path)
+    indexdelta.record_generation(server.uri, REPO)
+    assert indexdelta.local_generation(REPO) == 1
+    return index_path
+
+
+def digest(path):
+    return indexdelta.index_digest(iksemel.parse(path))
+
+
+def test_publish(server):
+    server.publish(index(package("a", "A")))
+    assert server.manifest()[0] == 1
+    assert server.manifest()[3] == {}
+
+    # An unchanged index keeps its generation
+    server.publish(index(package("a", "A")))
+    assert server.manifest()[0] == 1
+
+    server.publish(index(package("a", "A"), package("b", "B")))
+    generation, sha1sum, digest, deltas = server.manifest()
+    assert generation == 2
+    assert sha1sum == util.sha1_file(server.output)
+    assert digest == indexdelta.index_digest(iksemel.parse(server.output))
+    assert list(deltas) == [2]
+
+    # Changes outside of the packages restart the chain
+    distribution = DISTRIBUTION.replace("Test", "Other")
+    server.publish(index(package("a", "A"), distribution=distribution))
+    assert server.manifest()[0] == 3
+    assert server.manifest()[3] == {}
+    assert not os.path.exists(indexdelta.delta_name(server.output, 2))
+
+
+def test_delta_chain_is_bounded(server):
+    for i in range(indexdelta.MAX_DELTAS + 3):
+        server.publish(index(package("a", str(i))))
+
+    generation, sha1sum, digest, deltas = server.manifest()
+    assert len(deltas) == indexdelta.MAX_DELTAS
+    assert max(deltas) == generation
+    assert not os.path.exists(indexdelta.delta_name(server.output, 2))
+
+
+def test_update(server, client):
+    server.publish(index(package("a", "Changed"), package("b", "B")))
+    server.publish(index(package("b", "B"), package("c", "C")))
+
+    doc = indexdelta.update_index(server.uri, REPO)
+    assert doc is not None
+    assert indexdelta.index_digest(doc) == server.manifest()[2]
+    assert digest(client) == digest(server.output)
+    assert indexdelta.local_generation(REPO) == 3
+
+    with pytest.raises(pisi.file.AlreadyHaveException):
+        indexdelta.update_index(server.uri, REPO)
+
+
+def test_update_without_local_generation(server, client):
+    os.unlink(indexdelta.generation_path(REPO))
+    server.publish(index(package("a", "Changed"), package("b", "B")))
+
+    assert indexdelta.update_index(server.uri, REPO) is None
+
+
+def test_update_across_chain_restart(server, client):
+    distribution = DISTRIBUTION.replace("Test", "Other")
+    server.publish(index(package("a", "A"), distribution=distribution))
+    server.publish(
+        index(package("a", "A"), package("c", "C"), distribution=distribution)
+    )
+
+    assert indexdelta.update_index(server.uri, REPO) is None
+
+
+def test_update_verifies_result(server, client):
+    # A local index which is not the one its generation says
+    with open(client, "w") as f:
+        f.write(index(package("a", "A"), package("b", "Local")))
+    server.publish(index(package("a", "Changed"), package("b", "B")))
+
+    assert indexdelta.update_index(server.uri, REPO) is None
+    assert digest(client) != digest(server.output)
+    assert indexdelta.local_generation(REPO) == 1
+
+
+def test_update_checks_delta_span(server, client):
+    server.publish(index(package("a", "Changed"), package("b", "B")))
+
+    # Replace the delta with one claiming to be of another generation
+    generation, sha1sum, digest, deltas = server.manifest()
+    path = indexdelta.delta_name(server.output, generation)
+    indexdelta.write_delta(
+        path,
+        generation + 1,
+        iksemel.parse(client),
+        iksemel.parse(server.output),
+    )
+    deltas[generation] = util.sha1_file(path)
+    indexdelta.write_manifest(
+        indexdelta.manifest_name(server.output), generation, sha1sum, digest, deltas
+    )
+
+    assert indexdelta.update_index(server.uri, REPO) is None
+    assert indexdelta.local_generation(REPO) == 1
+
+
+def test_update_checks_delta_sha1sum(server, client):
+    server.publish(index(package("a", "Changed"), package("b", "B")))
+
+    generation, sha1sum, digest, deltas = server.manifest()
+    deltas[generation] = "0" * 40
+    indexdelta.write_manifest(
+        indexdelta.manifest_name(server.output), generation, sha1sum, digest, deltas
+    )
+
+    assert indexdelta.update_index(server.uri, REPO) is None
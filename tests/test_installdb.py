@@ -0,0 +1,168 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Read InstallDB records from the record store as they are needed."""
+
+import os
+import shutil
+
+import pytest
+
+import pisi.api
+import pisi.config
+import pisi.context as ctx
+import pisi.db
+import pisi.db.installdb as installdb
+
+METADATA = """<PISI>
+<Source>
+    <Name>%(name)s</Name>
+    <Packager><Name>Packager</Name><Email>packager@example.com</Email></Packager>
+</Source>
+<Package>
+    <Name>%(name)s</Name>
+    <Summary xml:lang="en">Summary of %(name)s</Summary>
+    <Description xml:lang="en">Description of %(name)s</Description>
+    <IsA>app:console</IsA>
+    <PartOf>system.utils</PartOf>
+    <License>GPL</License>
+    <RuntimeDependencies>%(deps)s</RuntimeDependencies>
+    <Provides>
+        <PkgConfig>%(name)s-pc</PkgConfig>
+        <PkgConfig32>%(name)s-pc</PkgConfig32>
+    </Provides>
+    <History>
+        <Update release="%(release)s">
+            <Date>2026-01-01</Date>
+            <Version>1.0</Version>
+            <Comment>Update</Comment>
+            <Name>Packager</Name>
+            <Email>packager@example.com</Email>
+        </Update>
+    </History>
+    <Distribution>Solus</Distribution>
+    <DistributionRelease>1</DistributionRelease>
+    <Architecture>x86_64</Architecture>
+    <InstalledSize>100</InstalledSize>
+</Package></PISI>
+"""
+
+
+@pytest.fixture
+def root(tmp_path):
+    options = pisi.config.Options()
+    options.destdir = str(tmp_path)
+    pisi.api.set_options(options)
+    for path in (
+        ctx.config.packages_dir(),
+        ctx.config.info_dir(),
+        ctx.config.cache_root_dir(),
+    ):
+        os.makedirs(path, exist_ok=True)
+    pisi.db.invalidate_caches()
+    yield tmp_path
+    pisi.db.invalidate_caches()
+
+
+def install(name, release=1, deps=()):
+    """Lay out the package dir of an installed package."""
+    path = os.path.join(ctx.config.packages_dir(), "%s-1.0-%d" % (name, release))
+    os.makedirs(path)
+    with open(os.path.join(path, ctx.const.metadata_xml), "w") as f:
+        f.write(
+            METADATA
+            % {
+                "name": name,
+                "release": release,
+                "deps": "".join("<Dependency>%s</Dependency>" % x for x in deps),
+            }
+        )
+    with open(os.path.join(path, ctx.const.files_xml), "w") as f:
+        f.write("<Files></Files>")
+    return path
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """The metadata.xml files read for records."""
+    paths = []
+    read_record = installdb.read_record
+
+    def counting_read_record(metadata_xml):
+        paths.append(os.path.basename(os.path.dirname(metadata_xml)))
+        return read_record(metadata_xml)
+
+    monkeypatch.setattr(installdb, "read_record", counting_read_record)
+    return paths
+
+
+def reopen():
+    pisi.db.invalidate_caches()
+    return installdb.InstallDB()
+
+
+def test_records(root, reads):
+    install("foo")
+    install("bar", deps=["foo"])
+
+    db = installdb.InstallDB()
+    assert sorted(db.list_installed()) == ["bar", "foo"]
+    assert reads == []
+    assert db.get_version("foo") == ("1.0", "1", None)
+    assert reads == ["foo-1.0-1"]
+    assert [name for name, dep in db.get_rev_deps("foo")] == ["bar"]
+    assert sorted(reads) == ["bar-1.0-1", "foo-1.0-1"]
+
+    # Reused from the store
+    reads.clear()
+    db = reopen()
+    assert db.get_version("bar") == ("1.0", "1", None)
+    assert db.search_package(["summary"]) == ["bar", "foo"]
+    assert reads == []
+
+    # Changed behind our back
+    shutil.rmtree(os.path.join(ctx.config.packages_dir(), "bar-1.0-1"))
+    install("bar", 2)
+    db = reopen()
+    assert db.get_version("bar") == ("1.0", "2", None)
+    assert reads == ["bar-1.0-2"]
+
+
+def test_info(root, reads):
+    install("foo")
+    db = installdb.InstallDB()
+    db.mark_pending("foo")
+
+    info = db.get_info("foo")
+    assert (info.state, info.version, info.release) == ("ip", "1.0", "1")
+    assert info.distribution == "Solus"
+    assert str(db.get_summary("foo")) == "Summary of foo"
+    assert reads == ["foo-1.0-1"]
+
+    with pytest.raises(pisi.Error):
+        db.get_info("missing")
+
+
+def test_pkgconfig(root):
+    install("foo")
+    install("bar")
+    db = installdb.InstallDB()
+
+    assert db.get_package_by_pkgconfig("bar-pc").name == "bar"
+    assert db.get_package_by_pkgconfig32("foo-pc").name == "foo"
+    assert db.get_package_by_pkgconfig("missing") is None
+
+
+def test_remove(root, reads):
+    install("foo")
+    install("bar", deps=["foo"])
+    db = installdb.InstallDB()
+    db.get_version("bar")
+
+    db.remove_package("bar")
+    shutil.rmtree(os.path.join(ctx.config.packages_dir(), "bar-1.0-1"))
+    db = reopen()
+    assert db.get_rev_deps("foo") == []
+    assert db.list_installed() == ["foo"]
+    with pytest.raises(pisi.Error):
+        db.get_version("bar")
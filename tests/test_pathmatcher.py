@@ -0,0 +1,151 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Compare PathMatcher with the fnmatch loops it replaced."""
+
+import fnmatch
+import random
+import types
+
+import pytest
+
+import pisi.context as ctx
+import pisi.util as util
+from pisi.operations.build import PathMatcher, check_path_collision
+
+COMPONENTS = ["usr", "lib", "share", "doc", "bin", "a", "b", "lib64", "x.so", "x.so.1"]
+PATTERNS = ["*", "lib*", "*.so*", "[ab]", "?", "x.so.*", "*/doc"]
+
+
+class Path:
+    def __init__(self, path, fileType):
+        self.path = path
+        self.fileType = fileType
+        self.permanent = None
+
+
+class Package:
+    def __init__(self, files):
+        self.files = files
+
+
+def old_match(path, pinfo_list):
+    """The lookup of the old get_file_type()."""
+    glob_match = parent_match = None
+    for pinfo in pinfo_list:
+        if path == pinfo.path:
+            return pinfo
+        elif fnmatch.fnmatch(path, pinfo.path):
+            glob_match = pinfo
+        elif fnmatch.fnmatch(path, util.join_path(pinfo.path, "*")):
+            if parent_match is None or parent_match.path < pinfo.path:
+                parent_match = pinfo
+    return glob_match or parent_match
+
+
+def old_included(path, packages):
+    """The is_included() loop of the old file list generation."""
+    for package in packages:
+        for pinfo in package.files:
+            entry = util.join_path("/install", pinfo.path)
+            path1 = "/install" + path
+            if (
+                path1 == entry
+                or fnmatch.fnmatch(path1, entry)
+                or fnmatch.fnmatch(path1, util.join_path(entry, "*"))
+            ):
+                return True
+    return False
+
+
+def old_collisions(package, packages):
+    """The old check_path_collision() with static and debug files off."""
+    collisions = []
+    for pinfo in package.files:
+        for pkg in packages:
+            if pkg is package:
+                continue
+            for path in pkg.files:
+                if util.subpath(pinfo.path, path.path):
+                    collisions.append(path.path.rstrip("/"))
+    return collisions
+
+
+def random_path(rand, depth, magic):
+    components = []
+    for i in range(depth):
+        if magic and rand.random() < 0.3:
+            components.append(rand.choice(PATTERNS))
+        else:
+            components.append(rand.choice(COMPONENTS))
+    path = "/" + "/".join(components)
+    return path + "/" if rand.random() < 0.1 else path
+
+
+@pytest.fixture
+def config(monkeypatch):
+    config = types.SimpleNamespace(
+        get_option=lambda option: False,
+        values=types.SimpleNamespace(build=types.SimpleNamespace(generatedebug=False)),
+    )
+    monkeypatch.setattr(ctx, "config", config)
+    return config
+
+
+def test_match_examples():
+    docs = Path("/usr/share/doc", "doc")
+    libs = Path("/usr/lib/lib*.so.*", "library")
+    devel = Path("/usr/lib/*.so", "library")
+    data = Path("/usr/share", "data")
+    package = Package([data, docs, libs, devel, Path("/usr", "executable")])
+    matcher = PathMatcher([package])
+
+    assert matcher.match("/usr/share", package) is data
+    assert matcher.match("/usr/share/doc/foo/README", package) is docs
+    assert matcher.match("/usr/share/foo", package) is data
+    assert matcher.match("/usr/lib/libfoo.so.1", package) is libs
+    assert matcher.match("/usr/lib/libfoo.so", package) is devel
+    assert matcher.match("/usr/bin/foo", package).fileType == "executable"
+    assert matcher.match("/etc/foo", package) is None
+
+
+def test_match_like_fnmatch(config):
+    rand = random.Random(1)
+    for trial in range(300):
+        packages = [
+            Package(
+                [
+                    Path(random_path(rand, rand.randint(1, 4), True), "t%d" % i)
+                    for i in range(rand.randint(1, 6))
+                ]
+            )
+            for j in range(rand.randint(1, 4))
+        ]
+        matcher = PathMatcher(packages)
+        for i in range(40):
+            path = random_path(rand, rand.randint(1, 5), False).rstrip("/")
+            for package in packages:
+                assert matcher.match(path, package) is old_match(path, package.files)
+            assert (matcher.match(path) is not None) == old_included(path, packages)
+
+        for package in packages:
+            assert check_path_collision(package, matcher) == old_collisions(
+                package, packages
+            )
+
+
+def test_collision_skips_static_and_debug(config):
+    config.get_option = lambda option: option == "create_static"
+    config.values.build.generatedebug = True
+    main = Package([Path("/usr/lib", "library")])
+    devel = Package(
+        [
+            Path("/usr/lib/libfoo.a", "library"),
+            Path("/usr/lib/debug/libfoo.so.debug", "debug"),
+            Path("/usr/lib/pkgconfig/", "data"),
+        ]
+    )
+    matcher = PathMatcher([main, devel])
+
+    assert check_path_collision(main, matcher) == ["/usr/lib/pkgconfig"]
+    assert check_path_collision(devel, matcher) == []
@@ -0,0 +1,164 @@
+# SPDX-FileCopyrightText: 2026 Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Search the token index, and compare it with the old regex search."""
+
+import random
+import re
+
+from pisi.db import searchindex
+
+PACKAGES = {
+    "libreoffice": (
+        {"en": "Office suite", "de": "Büroprogramme"},
+        {"en": "A full featured office suite with a word processor."},
+    ),
+    "office-tools": ({"en": "Tools for documents"}, {"en": "Converters."}),
+    "gimp": ({"en": "Image editor"}, {"en": "Edit photos, draw and paint."}),
+    "inkscape": ({"en": "Vector graphics editor"}, {"en": "Draw SVG images."}),
+    "c++-utils": ({"en": "Helpers"}, {"en": "Nothing to see here."}),
+}
+
+
+def make_index(packages=PACKAGES):
+    index = searchindex.SearchIndex()
+    for name, (summary, description) in packages.items():
+        index.add(name, summary, description)
+    return index
+
+
+def search(index, *terms, **kwargs):
+    lang = kwargs.pop("lang", "en")
+    return searchindex.rank(index.search(list(terms), lang, **kwargs))
+
+
+def old_search(packages, terms, lang):
+    """The regular expression search the token index replaced."""
+
+    def search_text(texts, term):
+        return any(
+            re.compile(term, re.I).search(texts.get(x) or "") for x in (lang, "en")
+        )
+
+    found = []
+    for name, (summary, description) in packages.items():
+        if all(
+            re.compile(term, re.I).search(name)
+            or search_text(summary, term)
+            or search_text(description, term)
+            for term in terms
+        ):
+            found.append(name)
+    return found
+
+
+def test_tokenize():
+    assert searchindex.tokenize("A full-featured Office") == [
+        "a",
+        "full",
+        "featured",
+        "office",
+    ]
+
+
+def test_search():
+    index = make_index()
+
+    assert search(index, "office") == ["office-tools", "libreoffice"]
+    assert search(index, "editor") == ["gimp", "inkscape"]
+    assert search(index, "draw") == ["gimp", "inkscape"]
+    assert search(index, "edit") == ["gimp", "inkscape"]
+    assert search(index, "editor", "vector") == ["inkscape"]
+    assert search(index, "editor", "office") == []
+    assert search(index, "nothing") == ["c++-utils"]
+
+
+def test_ranking():
+    index = make_index()
+
+    # A name token weighs more than a summary token, which weighs more
+    # than a description token
+    assert search(index, "office") == ["office-tools", "libreoffice"]
+    assert index.search(["office"], "en")["office-tools"] == 8
+    assert index.search(["office"], "en")["libreoffice"] == 4
+    assert index.search(["image"], "en") == {"gimp": 4, "inkscape": 1}
+
+
+def test_name_patterns():
+    index = make_index()
+
+    assert search(index, "reoff") == ["libreoffice"]
+    assert search(index, "^lib") == ["libreoffice"]
+    assert search(index, "scape$") == ["inkscape"]
+    # Not a valid expression, matched literally
+    assert search(index, "++") == ["c++-utils"]
+    assert search(index, "reoff", fields={"summary": True}) == []
+
+
+def test_substrings():
+    index = make_index()
+
+    assert search(index, "ffice") == ["libreoffice", "office-tools"]
+    assert index.search(["ffice"], "en")["libreoffice"] == 1
+    assert search(index, "ffice", fields={"desc": True}) == ["libreoffice"]
+    assert search(index, "raphic", lang="en") == ["inkscape"]
+    assert search(index, "programm", lang="de") == ["libreoffice"]
+    assert search(index, "programm", lang="en") == []
+
+
+def test_fields():
+    index = make_index()
+
+    assert search(index, "office", fields={"name": True}) == [
+        "office-tools",
+        "libreoffice",
+    ]
+    assert search(index, "office", fields={"desc": True}) == ["libreoffice"]
+    assert search(index, "photos", fields={"name": True, "summary": True}) == []
+
+
+def test_languages():
+    index = make_index()
+
+    assert search(index, "büroprogramme", lang="de") == ["libreoffice"]
+    assert search(index, "büroprogramme", lang="en") == []
+    # English texts are searched in every language
+    assert search(index, "suite", lang="de") == ["libreoffice"]
+
+
+def test_update():
+    index = make_index()
+    index.add("gimp", {"en": "GNU image manipulation program"}, {})
+    index.remove("inkscape")
+    index.remove("missing")
+
+    assert search(index, "editor") == []
+    assert search(index, "manipulation") == ["gimp"]
+    assert search(index, "draw") == []
+
+
+def test_like_old_search():
+    """Words and parts of words find what the old search found."""
+    rand = random.Random(1)
+    words = ["office", "suite", "editor", "image", "vector", "draw", "paint", "doc"]
+
+    def text():
+        return " ".join(rand.choice(words) for i in range(rand.randint(0, 4)))
+
+    packages = dict(
+        (
+            "%s%d" % (rand.choice(words), i),
+            ({"en": text(), "de": text()}, {"en": text()}),
+        )
+        for i in range(60)
+    )
+    index = make_index(packages)
+
+    for i in range(200):
+        terms = rand.sample(words, rand.randint(1, 2))
+        if rand.random() < 0.5:
+            terms = [term[rand.randint(0, 2) : rand.randint(3, 6)] for term in terms]
+        lang = rand.choice(["en", "de"])
+
+        found = index.search(terms, lang)
+        assert set(found) == set(old_search(packages, terms, lang))